@@ -0,0 +1,124 @@
+"""
+Benchmark de arranque del portal de Streamlit.
+Para cada página de portal.py lanza un intérprete nuevo (como tras un
+despliegue), renderiza la página de inicio con AppTest y después abre la
+página. Reporta el arranque en frío, la latencia de la primera apertura de
+cada página y qué dependencias pesadas quedan cargadas en cada momento.
+
+Ejemplos:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --admin-url postgresql://postgres:pw@localhost/postgres --runs 5
+    python benchmarks/bench_startup.py --docker --json > startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_db import disposable_database
+from bench_worker import WEB_AUPA
+
+PAGES = [
+    "🏠 Inicio",
+    "🗄️ Gestión de Comercios",
+    "🤖 Gestión IA",
+    "🌐 Redes Sociales",
+    "📡 Operaciones",
+    "🔍 Test de Conexión",
+]
+HEAVY_MODULES = ("pandas", "requests", "psycopg2")
+
+# Se ejecuta en un proceso nuevo por medición: el tiempo cuenta desde antes de
+# importar streamlit. Si hay BD de prueba, DATABASE_URL se fija después de medir
+# el arranque (config.get_db_connection la lee en cada llamada).
+CHILD = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+
+app_dir, page, db_url, heavy = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4].split(",")
+sys.path.insert(0, app_dir)
+at = AppTest.from_file(os.path.join(app_dir, "portal.py"), default_timeout=120)
+at.run()
+cold_start = time.perf_counter() - t0
+loaded_at_start = [m for m in heavy if m in sys.modules]
+
+if db_url:
+    os.environ["DATABASE_URL"] = db_url
+
+t1 = time.perf_counter()
+at.sidebar.radio[0].set_value(page).run()
+first_page = time.perf_counter() - t1
+print(json.dumps({
+    "cold_start": cold_start,
+    "first_page": first_page,
+    "loaded_at_start": loaded_at_start,
+    "loaded_after_page": [m for m in heavy if m in sys.modules],
+    "exceptions": [e.value for e in at.exception],
+}))
+"""
+
+
+def measure(app_dir, page, db_url, env):
+    """Una medición en un intérprete nuevo."""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, app_dir, page, db_url or "", ",".join(HEAVY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=app_dir, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{page}: {result.stderr.strip()[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(args, db_url):
+    env = dict(os.environ, LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"))
+    if db_url:
+        env["DATABASE_URL"] = db_url
+
+    report = {}
+    for page in PAGES:
+        samples = [measure(args.app_dir, page, db_url, env) for _ in range(args.runs)]
+        report[page] = {
+            "cold_start_ms": round(statistics.median(s["cold_start"] for s in samples) * 1000, 1),
+            "first_page_ms": round(statistics.median(s["first_page"] for s in samples) * 1000, 1),
+            "loaded_at_start": samples[-1]["loaded_at_start"],
+            "loaded_after_page": samples[-1]["loaded_after_page"],
+            "exceptions": samples[-1]["exceptions"],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del portal")
+    parser.add_argument("--runs", type=int, default=3, help="Procesos nuevos por página (se reporta la mediana)")
+    parser.add_argument("--app-dir", default=os.path.abspath(WEB_AUPA),
+                        help="Directorio con portal.py (p. ej. un checkout anterior para comparar)")
+    parser.add_argument("--admin-url", help="Servidor PostgreSQL donde crear la BD desechable")
+    parser.add_argument("--docker", action="store_true", help="Lanzar un postgres:17 desechable con Docker")
+    parser.add_argument("--no-db", action="store_true", help="Medir sin base de datos (las páginas muestran el error)")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado en JSON")
+    args = parser.parse_args()
+
+    if args.no_db:
+        report = run_benchmark(args, None)
+    else:
+        with disposable_database(args.admin_url, docker=args.docker) as db_url:
+            report = run_benchmark(args, db_url)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{'página':<26} {'arranque':>10} {'1ª apertura':>12}  cargado al arrancar / tras abrir")
+    for page, row in report.items():
+        print(f"{page:<26} {row['cold_start_ms']:>8.0f}ms {row['first_page_ms']:>10.0f}ms  "
+              f"{','.join(row['loaded_at_start']) or '-'} / {','.join(row['loaded_after_page']) or '-'}"
+              + (f"  ⚠ {len(row['exceptions'])} excepciones" if row["exceptions"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark del pipeline de publicación del worker.
+Llena posts_queue en una base de datos desechable, ejecuta process_posts() en
+N workers contra la Graph API falsa y mide throughput, latencia de publicación
+(p50/p99) y consultas a la BD por post.
+
+Ejemplos:
+    python benchmarks/bench_worker.py --admin-url postgresql://postgres:pw@localhost/postgres
+    python benchmarks/bench_worker.py --docker --posts 2000 --workers 4 --latency-ms 150
+    python benchmarks/bench_worker.py --docker --error-rate 0.05 --graph-rate-limit 50 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_db import QueryCounter, disposable_database
+from fake_graph_api import FakeGraphConfig, start_fake_graph
+
+WEB_AUPA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web_aupa")
+
+
+def percentile(values, pct):
+    """Percentil por el método del rango más cercano."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def seed_queue(db_url, posts, accounts, platform):
+    """Crea cuentas y posts pendientes con datos sintéticos."""
+    import psycopg2
+    from psycopg2.extras import execute_values
+
+    conn = psycopg2.connect(db_url)
+    cur = conn.cursor()
+    execute_values(cur, """
+        INSERT INTO social_accounts (user_email, platform, platform_user_id, access_token)
+        VALUES %s RETURNING id
+    """, [
+        (f"bench{i}@aupa.test", platform, str(100000 + i), f"token-{i}")
+        for i in range(accounts)
+    ], fetch=True)
+    cur.execute("SELECT id FROM social_accounts ORDER BY id")
+    account_ids = [row[0] for row in cur.fetchall()]
+
+    media_url = "https://example.com/bench.jpg" if platform == "Instagram" else None
+    execute_values(cur, """
+        INSERT INTO posts_queue (account_id, content, media_url, idempotency_key)
+        VALUES %s
+    """, [
+        (account_ids[i % len(account_ids)], f"Post de benchmark #{i}", media_url, uuid.uuid4().hex)
+        for i in range(posts)
+    ], page_size=1000)
+    conn.commit()
+    conn.close()
+
+
+def queue_remaining(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM posts_queue WHERE status IN ('pending', 'claimed', 'publishing', 'retrying')")
+    remaining = cur.fetchone()[0]
+    conn.rollback()
+    return remaining
+
+
+def collect_latencies(db_url):
+    """Latencias (s) de reclamo→envío y de programación→envío de los posts enviados."""
+    import psycopg2
+    conn = psycopg2.connect(db_url)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT EXTRACT(EPOCH FROM sent_at - claimed_at), EXTRACT(EPOCH FROM sent_at - scheduled_at)
+        FROM posts_queue WHERE status = 'sent'
+    """)
+    rows = cur.fetchall()
+    cur.execute("SELECT status, COUNT(*) FROM posts_queue GROUP BY status")
+    statuses = dict(cur.fetchall())
+    conn.close()
+    return [float(r[0]) for r in rows], [float(r[1]) for r in rows], statuses
+
+
+def run_benchmark(args, db_url, graph_url):
+    # El worker lee su configuración del entorno al importarse
+    os.environ.update({
+        "DATABASE_URL": db_url,
+        "GRAPH_API_URL": graph_url,
+        "GRAPH_VIDEO_URL": graph_url,
+        "FACEBOOK_CLIENT_ID": "bench",
+        "FACEBOOK_CLIENT_SECRET": "bench",
+        "WORKER_POLL_INTERVAL": str(args.poll_interval),
+        "IG_CONTAINER_POLL_INTERVAL": str(args.poll_interval),
+        "WORKER_MAX_RETRIES": str(args.max_retries),
+        "WORKER_RETRY_BACKOFF_SECONDS": str(args.retry_backoff),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    sys.path.insert(0, WEB_AUPA)
+    import worker
+    import publishers
+
+    if args.publisher_rate_limit:
+        for publisher in publishers.PUBLISHERS.values():
+            publisher.rate_limiter = publishers.RateLimiter(args.publisher_rate_limit)
+
+    # La conexión de control se abre antes de instalar el contador para no medirla
+    import psycopg2
+    monitor = psycopg2.connect(db_url)
+    counter = QueryCounter().install()
+    threads = [
+        threading.Thread(target=worker.process_posts, name=f"bench-worker-{i}", daemon=True)
+        for i in range(args.workers)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    deadline = start + args.timeout
+    while time.perf_counter() < deadline:
+        time.sleep(0.2)
+        if queue_remaining(monitor) == 0:
+            break
+    elapsed = time.perf_counter() - start
+
+    worker.shutdown_event.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    counter.uninstall()
+    monitor.close()
+
+    return elapsed, counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del worker de publicación")
+    parser.add_argument("--posts", type=int, default=500, help="Posts en la cola")
+    parser.add_argument("--accounts", type=int, default=20, help="Cuentas sociales entre las que repartirlos")
+    parser.add_argument("--workers", type=int, default=1, help="Workers concurrentes (hilos con process_posts)")
+    parser.add_argument("--platform", default="Facebook", choices=["Facebook", "Instagram"])
+    parser.add_argument("--latency-ms", type=float, default=100, help="Latencia media de la Graph API falsa")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proporción de respuestas 500")
+    parser.add_argument("--graph-rate-limit", type=int, default=0, help="Peticiones/s antes de responder 429")
+    parser.add_argument("--publisher-rate-limit", type=int, default=100000,
+                        help="Llamadas/minuto por adaptador (0 mantiene los límites reales)")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--max-retries", type=int, default=0,
+                        help="Reintentos de errores transitorios (0: pasan a 'dead' al primer fallo)")
+    parser.add_argument("--retry-backoff", type=int, default=0, help="Espera base entre reintentos (s)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--admin-url", help="Servidor PostgreSQL donde crear la BD desechable")
+    parser.add_argument("--docker", action="store_true", help="Lanzar un postgres:17 desechable con Docker")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado en JSON")
+    args = parser.parse_args()
+
+    server, graph_state, graph_url = start_fake_graph(FakeGraphConfig(
+        args.latency_ms, args.jitter_ms, args.error_rate, args.graph_rate_limit
+    ))
+
+    with disposable_database(args.admin_url, docker=args.docker) as db_url:
+        seed_queue(db_url, args.posts, args.accounts, args.platform)
+        elapsed, counter = run_benchmark(args, db_url, graph_url)
+        claim_latencies, e2e_latencies, statuses = collect_latencies(db_url)
+
+    server.shutdown()
+
+    processed = sum(v for k, v in statuses.items() if k not in ("pending", "claimed", "publishing", "retrying"))
+    result = {
+        "posts": args.posts,
+        "workers": args.workers,
+        "platform": args.platform,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_posts_s": round(processed / elapsed, 2) if elapsed else None,
+        "statuses": statuses,
+        "publish_latency_p50_s": percentile(claim_latencies, 50),
+        "publish_latency_p99_s": percentile(claim_latencies, 99),
+        "end_to_end_p50_s": percentile(e2e_latencies, 50),
+        "end_to_end_p99_s": percentile(e2e_latencies, 99),
+        "db_queries_per_post": round(counter.queries / processed, 2) if processed else None,
+        "db_connections_per_post": round(counter.connections / processed, 2) if processed else None,
+        "graph_requests": graph_state.requests,
+        "graph_errors": graph_state.errors,
+        "graph_throttled": graph_state.throttled,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print("\n📊 Benchmark del worker")
+    print("=" * 60)
+    for key, value in result.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"  {key:<26} {value}")
+
+
+if __name__ == "__main__":
+    main()
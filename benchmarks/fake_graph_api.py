@@ -0,0 +1,181 @@
+"""
+Doble local de la Graph API para benchmarks.
+Responde a los endpoints que usa el worker (debug_token, feed, photos, videos,
+contenedores de Instagram) con latencia, tasa de error y límite de peticiones
+configurables.
+
+Uso independiente:
+    python benchmarks/fake_graph_api.py --port 8765 --latency-ms 120 --error-rate 0.02
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGraphConfig:
+    """Parámetros de comportamiento del servidor falso."""
+
+    def __init__(self, latency_ms=100, jitter_ms=20, error_rate=0.0, rate_limit_per_sec=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # 0 desactiva el límite; por encima se responde 429 como la Graph API
+        self.rate_limit_per_sec = rate_limit_per_sec
+
+
+class _State:
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+    def throttle(self, limit):
+        """Devuelve True si la petición supera el límite del segundo actual."""
+        with self.lock:
+            self.requests += 1
+            if not limit:
+                return False
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            if self.window_count > limit:
+                self.throttled += 1
+                return True
+            return False
+
+
+def _path_parts(path):
+    """Segmentos de la ruta sin el prefijo de versión (v18.0)."""
+    return [p for p in path.split("/") if p and not re.fullmatch(r"v\d+\.\d+", p)]
+
+
+def make_handler(config, state):
+    class FakeGraphHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate(self):
+            """Aplica latencia, límite de peticiones y errores aleatorios."""
+            delay = max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000
+            time.sleep(delay)
+            if state.throttle(config.rate_limit_per_sec):
+                self._send(429, {"error": {
+                    "message": "Application request limit reached", "type": "OAuthException", "code": 4
+                }})
+                return False
+            if random.random() < config.error_rate:
+                with state.lock:
+                    state.errors += 1
+                self._send(500, {"error": {
+                    "message": "An unexpected error has occurred", "type": "OAuthException", "code": 2
+                }})
+                return False
+            return True
+
+        def _read_body(self):
+            # Se consume el cuerpo completo (incluidas subidas multipart) sin guardarlo
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(65536, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            parts = _path_parts(url.path)
+            if not self._simulate():
+                return
+
+            if parts == ["debug_token"]:
+                self._send(200, {"data": {"is_valid": True, "expires_at": int(time.time()) + 3600}})
+            elif not parts and "ids" in params:
+                ids = params["ids"][0].split(",")
+                self._send(200, {cid: {"id": cid, "status_code": "FINISHED"} for cid in ids})
+            elif len(parts) == 2 and parts[1] in ("feed", "media"):
+                self._send(200, {"data": []})
+            else:
+                self._send(200, {"id": parts[0] if parts else "0"})
+
+        def do_POST(self):
+            self._read_body()
+            parts = _path_parts(urlparse(self.path).path)
+            if not self._simulate():
+                return
+
+            new_id = state.next_id()
+            if len(parts) == 2 and parts[1] == "feed":
+                self._send(200, {"id": f"{parts[0]}_{new_id}"})
+            elif len(parts) == 2 and parts[1] == "videos":
+                self._send(200, {
+                    "video_id": str(new_id), "upload_session_id": str(new_id),
+                    "start_offset": "0", "end_offset": "0", "success": True
+                })
+            else:
+                self._send(200, {"id": str(new_id)})
+
+    return FakeGraphHandler
+
+
+def start_fake_graph(config, host="127.0.0.1", port=0):
+    """
+    Arranca el servidor en un hilo en segundo plano.
+
+    Returns:
+        (server, state, base_url)
+    """
+    state = _State()
+    server = ThreadingHTTPServer((host, port), make_handler(config, state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v18.0"
+    return server, state, base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Graph API falsa para benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="Peticiones/segundo antes de responder 429")
+    args = parser.parse_args()
+
+    server, state, base_url = start_fake_graph(
+        FakeGraphConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit),
+        port=args.port
+    )
+    print(f"Graph API falsa escuchando en {base_url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
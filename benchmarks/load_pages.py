@@ -0,0 +1,300 @@
+"""
+Prueba de carga de las páginas de Streamlit respaldadas por la BD.
+Llena social_accounts, posts_queue, token_exchange_logs, post_publish_logs y
+categoria_comercio con datos sintéticos a escala, simula N operadores que
+recargan las páginas de app.py y admin_comercios.py en paralelo y reporta la
+latencia y las conexiones/consultas de cada acción de página.
+
+Ejemplos:
+    python benchmarks/load_pages.py --admin-url postgresql://postgres:pw@localhost/postgres
+    python benchmarks/load_pages.py --docker --operators 50 --log-rows 1000000 --duration 120
+    python benchmarks/load_pages.py --docker --json > baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_db import QueryCounter, disposable_database
+from bench_worker import WEB_AUPA, percentile
+
+# Peso relativo de cada acción en la mezcla de los operadores. Cada rerun de
+# app.py lista las cuentas; las pestañas del monitor solo consultan al pulsar
+# su botón de actualizar.
+ACTION_WEIGHTS = {
+    "app.rerun": 10,
+    "app.monitor_publicaciones": 3,
+    "app.auditoria_tokens": 2,
+    "app.errores_publicacion": 2,
+    "app.programar_publicacion": 1,
+    "admin_comercios.rerun": 4,
+}
+
+
+def seed_data(db_url, accounts, posts, log_rows, comercios):
+    """Genera los datos en el servidor con generate_series (sin pasar por el cliente)."""
+    import psycopg2
+
+    conn = psycopg2.connect(db_url)
+    cur = conn.cursor()
+    # Particiones mensuales para todo el histórico generado (180 días)
+    for table in ("token_exchange_logs", "post_publish_logs"):
+        cur.execute("SELECT create_monthly_partitions(%s, 3, 7)", (table,))
+    cur.execute("""
+        INSERT INTO social_accounts (user_email, platform, platform_user_id, access_token, created_at)
+        SELECT 'operador' || g || '@aupa.test',
+               (ARRAY['Facebook', 'Instagram'])[1 + g %% 2],
+               (100000 + g)::text, 'token-' || g,
+               NOW() - random() * INTERVAL '365 days'
+        FROM generate_series(1, %s) g
+    """, (accounts,))
+    cur.execute("""
+        INSERT INTO posts_queue (account_id, content, status, error_message, scheduled_at,
+                                 sent_at, idempotency_key)
+        SELECT 1 + g %% %s,
+               'Publicación sintética #' || g,
+               s.status,
+               CASE WHEN s.status = 'failed' THEN 'Error sintético' END,
+               s.scheduled_at,
+               CASE WHEN s.status = 'sent' THEN s.scheduled_at + INTERVAL '5 seconds' END,
+               md5(g::text)
+        FROM generate_series(1, %s) g,
+        LATERAL (SELECT (ARRAY['sent', 'sent', 'sent', 'failed', 'pending'])[1 + g %% 5] AS status,
+                        NOW() - random() * INTERVAL '180 days' AS scheduled_at) s
+    """, (accounts, posts))
+    cur.execute("""
+        INSERT INTO token_exchange_logs (user_email, platform, authorization_code, token_status,
+                                         error_message, facebook_user_id, exchange_timestamp, ip_address)
+        SELECT 'operador' || (1 + g %% %s) || '@aupa.test',
+               (ARRAY['Facebook', 'Instagram'])[1 + g %% 2],
+               md5(g::text),
+               (ARRAY['success', 'success', 'success', 'failed', 'pending'])[1 + g %% 5],
+               CASE WHEN g %% 5 = 3 THEN 'Error sintético' END,
+               (100000 + g %% %s)::text,
+               NOW() - random() * INTERVAL '180 days',
+               '10.0.' || (g %% 256) || '.' || (g %% 250)
+        FROM generate_series(1, %s) g
+    """, (accounts, accounts, log_rows))
+    cur.execute("""
+        INSERT INTO post_publish_logs (post_id, account_id, platform, facebook_post_id, publish_status,
+                                       platform_response_code, error_details, retry_count,
+                                       published_at, logged_at)
+        SELECT 1 + g %% %s, 1 + g %% %s,
+               (ARRAY['Facebook', 'Instagram'])[1 + g %% 2],
+               CASE WHEN g %% 4 <> 0 THEN 'fb_' || g END,
+               CASE WHEN g %% 4 = 0 THEN 'failed' ELSE 'published' END,
+               CASE WHEN g %% 4 = 0 THEN '500' ELSE '200' END,
+               CASE WHEN g %% 4 = 0 THEN 'Error sintético' END,
+               g %% 3,
+               t.logged_at, t.logged_at
+        FROM generate_series(1, %s) g,
+        LATERAL (SELECT NOW() - random() * INTERVAL '180 days' AS logged_at) t
+    """, (posts, accounts, log_rows))
+    conn.commit()
+
+    cur.execute("""
+        INSERT INTO categoria_comercio (comercio_id, nombre_comercio, categoria)
+        SELECT 'comercio-' || g, 'Comercio sintético ' || g,
+               (ARRAY['Restaurante', 'Tienda', 'Servicios', 'Otros'])[1 + g %% 4]
+        FROM generate_series(1, %s) g
+    """, (comercios,))
+    conn.commit()
+
+    conn.autocommit = True
+    cur.execute("ANALYZE")
+    cur.close()
+    conn.close()
+
+
+def build_actions(db_url):
+    """Acciones de página: reproducen las consultas de cada rerun / botón."""
+    import psycopg2
+    import tables_comercios
+    from monitor_queries import get_accounts, get_recent_posts, get_recent_publish_errors, get_recent_token_exchanges
+    from admission import check_admission
+    from post_queue import enqueue_post
+
+    def with_cursor(fn):
+        # Igual que las páginas: una conexión nueva por bloque de consultas
+        def action():
+            conn = psycopg2.connect(db_url)
+            try:
+                cur = conn.cursor()
+                fn(cur)
+                conn.commit()
+                cur.close()
+            finally:
+                conn.close()
+        return action
+
+    def programar(cur):
+        account_id = random.choice(get_accounts(cur))[0]
+        decision = check_admission(cur, account_id)
+        if decision.action != "reject":
+            enqueue_post(cur, account_id, f"Carga {random.random()}",
+                         deferred_to=decision.scheduled_at if decision.action == "defer" else None)
+
+    def admin_rerun():
+        tables_comercios.obtener_comercios()
+
+    return {
+        "app.rerun": with_cursor(get_accounts),
+        "app.monitor_publicaciones": with_cursor(get_recent_posts),
+        "app.auditoria_tokens": with_cursor(get_recent_token_exchanges),
+        "app.errores_publicacion": with_cursor(get_recent_publish_errors),
+        "app.programar_publicacion": with_cursor(programar),
+        "admin_comercios.rerun": admin_rerun,
+    }
+
+
+def operator_loop(actions, counter, stats, stop_event, think_time):
+    """Un operador elige acciones según ACTION_WEIGHTS hasta que se detiene la prueba."""
+    names = list(ACTION_WEIGHTS)
+    weights = [ACTION_WEIGHTS[name] for name in names]
+    while not stop_event.is_set():
+        name = random.choices(names, weights)[0]
+        queries_before, connections_before = counter.thread_totals()
+        start = time.perf_counter()
+        error = None
+        try:
+            actions[name]()
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - start
+        queries_after, connections_after = counter.thread_totals()
+
+        entry = stats[name]
+        with entry["lock"]:
+            entry["latencies"].append(elapsed)
+            entry["queries"] += queries_after - queries_before
+            entry["connections"] += connections_after - connections_before
+            if error:
+                entry["errors"] += 1
+        if think_time:
+            stop_event.wait(random.uniform(0, 2 * think_time))
+
+
+def sample_server_connections(monitor, stop_event, peaks):
+    """Registra el pico de conexiones abiertas en el servidor durante la prueba."""
+    cur = monitor.cursor()
+    while not stop_event.wait(0.1):
+        cur.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database()")
+        peaks.append(cur.fetchone()[0] - 1)
+        monitor.rollback()
+
+
+def run_load(args, db_url):
+    import psycopg2
+
+    monitor = psycopg2.connect(db_url)
+    counter = QueryCounter().install()
+    actions = build_actions(db_url)
+    stats = {
+        name: {"lock": threading.Lock(), "latencies": [], "queries": 0, "connections": 0, "errors": 0}
+        for name in ACTION_WEIGHTS
+    }
+    stop_event = threading.Event()
+    peaks = []
+
+    threads = [
+        threading.Thread(target=operator_loop, name=f"operador-{i}", daemon=True,
+                         args=(actions, counter, stats, stop_event, args.think_time))
+        for i in range(args.operators)
+    ]
+    sampler = threading.Thread(target=sample_server_connections, daemon=True,
+                               args=(monitor, stop_event, peaks))
+    sampler.start()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=60)
+    sampler.join(timeout=5)
+    elapsed = time.perf_counter() - start
+    counter.uninstall()
+    monitor.close()
+    return elapsed, stats, max(peaks, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de las páginas de Streamlit")
+    parser.add_argument("--operators", type=int, default=50, help="Operadores concurrentes")
+    parser.add_argument("--duration", type=float, default=60, help="Segundos de carga")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Pausa media entre acciones (s)")
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--log-rows", type=int, default=1000000,
+                        help="Filas en token_exchange_logs y en post_publish_logs")
+    parser.add_argument("--comercios", type=int, default=5000)
+    parser.add_argument("--admin-url", help="Servidor PostgreSQL donde crear la BD desechable")
+    parser.add_argument("--docker", action="store_true", help="Lanzar un postgres:17 desechable con Docker")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado en JSON")
+    args = parser.parse_args()
+
+    os.environ["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, WEB_AUPA)
+
+    with disposable_database(args.admin_url, docker=args.docker) as db_url:
+        os.environ["DATABASE_URL"] = db_url
+
+        seed_start = time.perf_counter()
+        seed_data(db_url, args.accounts, args.posts, args.log_rows, args.comercios)
+        seed_elapsed = time.perf_counter() - seed_start
+        elapsed, stats, peak_connections = run_load(args, db_url)
+
+    actions = {}
+    for name in ACTION_WEIGHTS:
+        entry = stats[name]
+        count = len(entry["latencies"])
+        actions[name] = {
+            "count": count,
+            "errors": entry["errors"],
+            "p50_ms": round(percentile(entry["latencies"], 50) * 1000, 2) if count else None,
+            "p95_ms": round(percentile(entry["latencies"], 95) * 1000, 2) if count else None,
+            "p99_ms": round(percentile(entry["latencies"], 99) * 1000, 2) if count else None,
+            "max_ms": round(max(entry["latencies"]) * 1000, 2) if count else None,
+            "queries_per_action": round(entry["queries"] / count, 2) if count else None,
+            "connections_per_action": round(entry["connections"] / count, 2) if count else None,
+        }
+    total_actions = sum(a["count"] for a in actions.values())
+    result = {
+        "operators": args.operators,
+        "duration_s": round(elapsed, 2),
+        "seed_s": round(seed_elapsed, 2),
+        "rows": {
+            "social_accounts": args.accounts,
+            "posts_queue": args.posts,
+            "token_exchange_logs": args.log_rows,
+            "post_publish_logs": args.log_rows,
+            "categoria_comercio": args.comercios,
+        },
+        "actions_per_s": round(total_actions / elapsed, 2) if elapsed else None,
+        "peak_server_connections": peak_connections,
+        "actions": actions,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print("\n📊 Carga de páginas")
+    print("=" * 96)
+    print(f"  operadores={args.operators}  duración={result['duration_s']}s  "
+          f"acciones/s={result['actions_per_s']}  pico de conexiones={peak_connections}")
+    print(f"  {'acción':<28}{'n':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'consultas':>10}{'conex.':>8}")
+    for name, a in actions.items():
+        print(f"  {name:<28}{a['count']:>7}{a['errors']:>5}{a['p50_ms'] or '-':>9}{a['p95_ms'] or '-':>9}"
+              f"{a['p99_ms'] or '-':>9}{a['max_ms'] or '-':>9}{a['queries_per_action'] or '-':>10}"
+              f"{a['connections_per_action'] or '-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de web_aupa se importan por nombre, como al ejecutar la app
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "web_aupa"))
@@ -1,3 +1,6 @@
+-- Búsqueda por similitud (trigramas) en emails y nombres de comercio
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Tabla para almacenar los tokens de acceso de las redes sociales
 CREATE TABLE social_accounts (
     id SERIAL PRIMARY KEY,
@@ -7,9 +10,14 @@ CREATE TABLE social_accounts (
     access_token TEXT NOT NULL,
     refresh_token TEXT,
     expires_at TIMESTAMP,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Una fila por página/cuenta: volver a vincular actualiza el token
+    UNIQUE (platform, platform_user_id)
 );
 
+-- Búsqueda de cuentas por email (ILIKE '%...%' y similitud)
+CREATE INDEX idx_social_accounts_email_trgm ON social_accounts USING gin (user_email gin_trgm_ops);
+
 -- Tabla para la cola de publicaciones (el worker monitorea esta tabla)
 CREATE TABLE posts_queue (
     id SERIAL PRIMARY KEY,
@@ -17,14 +25,194 @@ CREATE TABLE posts_queue (
     content TEXT NOT NULL,
     media_url TEXT,
     scheduled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(20) DEFAULT 'pending', -- 'pending', 'sent', 'failed'
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN (
+        'pending', 'claimed', 'publishing', 'sent', 'failed', 'retrying', 'dead', 'unsupported'
+    )), -- transiciones permitidas en posts_queue_transitions
+    error_message TEXT,
+    sent_at TIMESTAMP,
+    idempotency_key VARCHAR(64) UNIQUE, -- hash de cuenta + contenido + programación
+    claimed_at TIMESTAMP, -- momento en que un worker reclamó el post
+    platform_post_id VARCHAR(255), -- ID del post en la red social
+    retry_count INTEGER NOT NULL DEFAULT 0, -- reintentos tras errores transitorios
+    retry_at TIMESTAMP, -- próximo intento de un post en 'retrying'
+    media_file VARCHAR(80), -- copia validada de media_url en MEDIA_CACHE_DIR (<sha256>.<ext>)
+    media_checked_at TIMESTAMP -- último intento de descarga/validación (web_aupa/media_prefetch.py)
+);
+
+-- Posts en curso que hay que reconciliar si un worker se detiene
+CREATE INDEX idx_posts_queue_in_flight ON posts_queue (claimed_at) WHERE status IN ('claimed', 'publishing');
+-- Cola por orden de publicación: reclamo del worker y control de admisión
+CREATE INDEX idx_posts_queue_due ON posts_queue (scheduled_at) WHERE status IN ('pending', 'retrying');
+-- Posts terminados candidatos a archivarse en posts_history
+CREATE INDEX idx_posts_queue_finished ON posts_queue (scheduled_at)
+    WHERE status IN ('sent', 'failed', 'dead', 'unsupported');
+-- Búsqueda de texto completo en el contenido (ver web_aupa/monitor_queries.py:
+-- las consultas usan la misma expresión; posts_history tiene el mismo índice)
+CREATE INDEX idx_posts_queue_content_fts ON posts_queue USING gin (to_tsvector('spanish', content));
+-- Listado del monitor sin texto: mismo orden que search_posts para que posts_all
+-- se lea con Merge Append y se pare en el LIMIT (posts_history tiene el mismo índice)
+CREATE INDEX idx_posts_queue_scheduled ON posts_queue (scheduled_at DESC, id DESC);
+
+-- Posts terminados que el archivador saca de posts_queue (ver web_aupa/post_archiver.py).
+-- Conserva el id original, así que post_publish_logs.post_id sigue enlazando.
+-- toast_tuple_target bajo: los contenidos largos se comprimen fuera de la fila.
+CREATE TABLE posts_history (
+    id INTEGER PRIMARY KEY,
+    account_id INTEGER REFERENCES social_accounts(id),
+    content TEXT NOT NULL,
+    media_url TEXT,
+    scheduled_at TIMESTAMP,
+    status VARCHAR(20) NOT NULL,
     error_message TEXT,
-    sent_at TIMESTAMP
+    sent_at TIMESTAMP,
+    idempotency_key VARCHAR(64),
+    claimed_at TIMESTAMP,
+    platform_post_id VARCHAR(255),
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    retry_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITH (toast_tuple_target = 128);
+
+CREATE INDEX idx_posts_history_account ON posts_history (account_id, scheduled_at DESC);
+-- Misma expresión que idx_posts_queue_content_fts: la búsqueda va sobre posts_all
+CREATE INDEX idx_posts_history_content_fts ON posts_history USING gin (to_tsvector('spanish', content));
+CREATE INDEX idx_posts_history_scheduled ON posts_history (scheduled_at DESC, id DESC);
+
+-- Cola e histórico juntos para consultas que abarcan ambos
+CREATE VIEW posts_all AS
+    SELECT id, account_id, content, media_url, scheduled_at, status, error_message, sent_at,
+           idempotency_key, claimed_at, platform_post_id, retry_count, retry_at, NULL::TIMESTAMP AS archived_at
+    FROM posts_queue
+    UNION ALL
+    SELECT id, account_id, content, media_url, scheduled_at, status, error_message, sent_at,
+           idempotency_key, claimed_at, platform_post_id, retry_count, retry_at, archived_at
+    FROM posts_history;
+
+-- Máquina de estados de posts_queue:
+--   pending -> claimed -> publishing -> sent | failed | retrying | dead
+--   retrying -> claimed (cuando vence retry_at)
+--   claimed/publishing -> pending (liberado por apagado o reconciliación)
+--   failed/dead/unsupported -> pending (reencolado manual)
+CREATE TABLE posts_queue_transitions (
+    from_status VARCHAR(20) NOT NULL,
+    to_status VARCHAR(20) NOT NULL,
+    PRIMARY KEY (from_status, to_status)
 );
 
+INSERT INTO posts_queue_transitions (from_status, to_status) VALUES
+    ('pending', 'claimed'), ('pending', 'unsupported'), ('pending', 'failed'),
+    ('retrying', 'claimed'),
+    ('claimed', 'publishing'), ('claimed', 'pending'),
+    ('publishing', 'sent'), ('publishing', 'failed'), ('publishing', 'retrying'),
+    ('publishing', 'dead'), ('publishing', 'pending'),
+    ('failed', 'pending'), ('dead', 'pending'), ('unsupported', 'pending');
+
+CREATE FUNCTION check_posts_queue_transition() RETURNS TRIGGER AS $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM posts_queue_transitions
+        WHERE from_status = OLD.status AND to_status = NEW.status
+    ) THEN
+        RAISE EXCEPTION 'Transición no permitida en posts_queue %: % -> %', OLD.id, OLD.status, NEW.status
+            USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_queue_transition_check
+    BEFORE UPDATE OF status ON posts_queue
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION check_posts_queue_transition();
+
+-- Si cambia media_url, la copia validada deja de servir y se vuelve a descargar
+CREATE FUNCTION reset_posts_queue_media() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.media_file := NULL;
+    NEW.media_checked_at := NULL;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_queue_media_reset
+    BEFORE UPDATE OF media_url ON posts_queue
+    FOR EACH ROW WHEN (OLD.media_url IS DISTINCT FROM NEW.media_url)
+    EXECUTE FUNCTION reset_posts_queue_media();
+
+-- Posts por cuenta y estado, actualizado en la misma transacción que cada
+-- cambio de posts_queue (profundidad de cola en O(1) sin COUNT(*)). Los posts
+-- archivados siguen contando: el archivador activa aupa.archiving y el
+-- trigger de DELETE no los resta.
+CREATE TABLE posts_queue_counters (
+    account_id INTEGER NOT NULL, -- 0 para posts sin cuenta
+    status VARCHAR(20) NOT NULL,
+    posts BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, status)
+);
+
+-- Trigger por sentencia: un lote reclamado actualiza una fila de contador por
+-- (cuenta, estado), en orden fijo para no provocar interbloqueos
+CREATE FUNCTION count_posts_queue_changes() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO posts_queue_counters (account_id, status, posts)
+        SELECT COALESCE(account_id, 0), status, COUNT(*)
+        FROM new_rows GROUP BY 1, 2 ORDER BY 1, 2
+        ON CONFLICT (account_id, status)
+        DO UPDATE SET posts = posts_queue_counters.posts + EXCLUDED.posts;
+    ELSIF TG_OP = 'DELETE' THEN
+        IF current_setting('aupa.archiving', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO posts_queue_counters (account_id, status, posts)
+        SELECT COALESCE(account_id, 0), status, -COUNT(*)
+        FROM old_rows GROUP BY 1, 2 ORDER BY 1, 2
+        ON CONFLICT (account_id, status)
+        DO UPDATE SET posts = posts_queue_counters.posts + EXCLUDED.posts;
+    ELSE
+        INSERT INTO posts_queue_counters (account_id, status, posts)
+        SELECT account_id, status, SUM(delta)
+        FROM (
+            SELECT COALESCE(n.account_id, 0) AS account_id, n.status, 1 AS delta
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.account_id, o.status) IS DISTINCT FROM (n.account_id, n.status)
+            UNION ALL
+            SELECT COALESCE(o.account_id, 0), o.status, -1
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE (o.account_id, o.status) IS DISTINCT FROM (n.account_id, n.status)
+        ) deltas
+        GROUP BY 1, 2 HAVING SUM(delta) <> 0 ORDER BY 1, 2
+        ON CONFLICT (account_id, status)
+        DO UPDATE SET posts = posts_queue_counters.posts + EXCLUDED.posts;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_queue_count_insert
+    AFTER INSERT ON posts_queue REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_posts_queue_changes();
+CREATE TRIGGER posts_queue_count_update
+    AFTER UPDATE ON posts_queue REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_posts_queue_changes();
+CREATE TRIGGER posts_queue_count_delete
+    AFTER DELETE ON posts_queue REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_posts_queue_changes();
+
+-- Recalcula los contadores desde posts_queue y posts_history (si se desajustan)
+CREATE FUNCTION rebuild_posts_queue_counters() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE posts_queue, posts_history IN SHARE MODE;
+    DELETE FROM posts_queue_counters;
+    INSERT INTO posts_queue_counters (account_id, status, posts)
+    SELECT COALESCE(account_id, 0), status, COUNT(*) FROM posts_all GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Tabla para auditoría y seguimiento de intercambios de tokens
+-- Particionada por mes sobre exchange_timestamp (ver web_aupa/log_partitions.py)
 CREATE TABLE token_exchange_logs (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_email VARCHAR(255) NOT NULL,
     platform VARCHAR(50) NOT NULL,
     authorization_code VARCHAR(255),
@@ -35,14 +223,16 @@ CREATE TABLE token_exchange_logs (
     facebook_user_id VARCHAR(255),
     token_obtained_at TIMESTAMP,
     token_expires_at TIMESTAMP,
-    exchange_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    ip_address VARCHAR(45)
-);
+    exchange_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ip_address VARCHAR(45),
+    PRIMARY KEY (id, exchange_timestamp) -- la clave de partición debe formar parte de la PK
+) PARTITION BY RANGE (exchange_timestamp);
 
 -- Tabla para logs de publicaciones exitosas y fallidas
+-- Particionada por mes sobre logged_at (ver web_aupa/log_partitions.py)
 CREATE TABLE post_publish_logs (
-    id SERIAL PRIMARY KEY,
-    post_id INTEGER REFERENCES posts_queue(id),
+    id SERIAL,
+    post_id INTEGER, -- posts_queue.id o posts_history.id (el archivado conserva el id)
     account_id INTEGER REFERENCES social_accounts(id),
     platform VARCHAR(50),
     facebook_post_id VARCHAR(255),
@@ -51,5 +241,291 @@ CREATE TABLE post_publish_logs (
     error_details TEXT,
     retry_count INTEGER DEFAULT 0,
     published_at TIMESTAMP,
-    logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+    logged_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, logged_at)
+) PARTITION BY RANGE (logged_at);
+
+CREATE INDEX idx_post_publish_logs_post ON post_publish_logs (post_id);
+
+-- Filas fuera de las particiones mensuales existentes (nunca se pierde un log)
+CREATE TABLE token_exchange_logs_default PARTITION OF token_exchange_logs DEFAULT;
+CREATE TABLE post_publish_logs_default PARTITION OF post_publish_logs DEFAULT;
+
+-- Crea las particiones mensuales desde months_back meses antes del actual
+-- hasta months_ahead meses después. Nombre: <tabla>_pYYYY_MM. Es idempotente;
+-- si la partición DEFAULT ya tiene filas de ese mes se trasladan a la nueva.
+CREATE FUNCTION create_monthly_partitions(parent TEXT, months_ahead INTEGER DEFAULT 3, months_back INTEGER DEFAULT 0)
+RETURNS INTEGER AS $$
+DECLARE
+    part_key TEXT := substring(pg_get_partkeydef(parent::regclass) FROM '\((.*)\)');
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+    has_rows BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    -- Evita carreras entre varios procesos de mantenimiento
+    PERFORM pg_advisory_xact_lock(hashtext('log_partitions:' || parent));
+
+    FOR i IN -months_back..months_ahead LOOP
+        month_start := (date_trunc('month', NOW()) + make_interval(months => i))::DATE;
+        month_end := (month_start + INTERVAL '1 month')::DATE;
+        partition_name := format('%s_p%s', parent, to_char(month_start, 'YYYY_MM'));
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                       parent || '_default', part_key, month_start, part_key, month_end)
+        INTO has_rows;
+
+        IF has_rows THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                parent || '_default', part_key, month_start, part_key, month_end, partition_name
+            );
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           parent, partition_name, month_start, month_end);
+        ELSE
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, parent, month_start, month_end);
+        END IF;
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Retira las particiones mensuales cuyo mes completo es anterior a la
+-- retención. Con archive = TRUE solo se desvinculan (DETACH) y quedan como
+-- tablas independientes para exportarlas; si no, se eliminan.
+CREATE FUNCTION drop_expired_partitions(parent TEXT, retention_months INTEGER, archive BOOLEAN DEFAULT FALSE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    cutoff DATE := (date_trunc('month', NOW()) - make_interval(months => retention_months))::DATE;
+    part RECORD;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('log_partitions:' || parent));
+
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent::regclass
+          AND c.relname ~ ('^' || parent || '_p[0-9]{4}_[0-9]{2}$')
+          AND to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        IF archive THEN
+            EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, part.relname);
+        ELSE
+            EXECUTE format('DROP TABLE %I', part.relname);
+        END IF;
+        RETURN NEXT part.relname;
+    END LOOP;
+
+    -- Las filas caducadas que cayeron en DEFAULT son pocas: se borran directamente
+    IF NOT archive THEN
+        EXECUTE format('DELETE FROM %I WHERE %s < %L', parent || '_default',
+                       substring(pg_get_partkeydef(parent::regclass) FROM '\((.*)\)'), cutoff);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_monthly_partitions('token_exchange_logs');
+SELECT create_monthly_partitions('post_publish_logs');
+
+-- Media subida por cada post (permite reanudar o reutilizar la subida al reintentarlo)
+CREATE TABLE media_uploads (
+    id SERIAL PRIMARY KEY,
+    -- Un objeto subido pertenece al post que lo adjuntó: solo se reutiliza al
+    -- reintentar ese mismo post (foto sin publicar o subida de video a medias)
+    post_id INTEGER NOT NULL REFERENCES posts_queue(id) ON DELETE CASCADE,
+    page_id VARCHAR(255) NOT NULL,
+    content_hash CHAR(64) NOT NULL, -- SHA-256 del archivo (o de la URL remota)
+    media_type VARCHAR(20) NOT NULL, -- 'photo', 'video'
+    platform_media_id VARCHAR(255),
+    status VARCHAR(20) DEFAULT 'uploaded', -- 'uploading', 'uploaded'
+    upload_session_id VARCHAR(255), -- sesión de subida reanudable en curso
+    uploaded_bytes BIGINT DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (post_id, page_id, content_hash)
+);
+
+-- Rollups de auditoría por hora y por día (mantenidos por trigger al insertar).
+-- generate_audit_report lee de aquí en lugar de agregar los logs crudos; como
+-- no se tocan al retirar particiones, conservan el histórico completo.
+CREATE TABLE publish_stats_hourly (
+    bucket TIMESTAMP NOT NULL,
+    platform VARCHAR(50) NOT NULL DEFAULT '',
+    account_id INTEGER NOT NULL DEFAULT 0,
+    publish_status VARCHAR(50) NOT NULL DEFAULT '',
+    error_code VARCHAR(50) NOT NULL DEFAULT '', -- platform_response_code del log
+    events BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, platform, account_id, publish_status, error_code)
+);
+CREATE TABLE publish_stats_daily (LIKE publish_stats_hourly INCLUDING ALL);
+
+CREATE TABLE token_exchange_stats_hourly (
+    bucket TIMESTAMP NOT NULL,
+    platform VARCHAR(50) NOT NULL,
+    user_email VARCHAR(255) NOT NULL,
+    token_status VARCHAR(50) NOT NULL,
+    events BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, platform, user_email, token_status)
+);
+CREATE TABLE token_exchange_stats_daily (LIKE token_exchange_stats_hourly INCLUDING ALL);
+
+CREATE FUNCTION rollup_publish_log() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO publish_stats_hourly (bucket, platform, account_id, publish_status, error_code, events)
+    VALUES (date_trunc('hour', NEW.logged_at), COALESCE(NEW.platform, ''), COALESCE(NEW.account_id, 0),
+            COALESCE(NEW.publish_status, ''), COALESCE(NEW.platform_response_code, ''), 1)
+    ON CONFLICT (bucket, platform, account_id, publish_status, error_code)
+    DO UPDATE SET events = publish_stats_hourly.events + 1;
+
+    INSERT INTO publish_stats_daily (bucket, platform, account_id, publish_status, error_code, events)
+    VALUES (date_trunc('day', NEW.logged_at), COALESCE(NEW.platform, ''), COALESCE(NEW.account_id, 0),
+            COALESCE(NEW.publish_status, ''), COALESCE(NEW.platform_response_code, ''), 1)
+    ON CONFLICT (bucket, platform, account_id, publish_status, error_code)
+    DO UPDATE SET events = publish_stats_daily.events + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION rollup_token_exchange_log() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO token_exchange_stats_hourly (bucket, platform, user_email, token_status, events)
+    VALUES (date_trunc('hour', NEW.exchange_timestamp), NEW.platform, NEW.user_email, NEW.token_status, 1)
+    ON CONFLICT (bucket, platform, user_email, token_status)
+    DO UPDATE SET events = token_exchange_stats_hourly.events + 1;
+
+    INSERT INTO token_exchange_stats_daily (bucket, platform, user_email, token_status, events)
+    VALUES (date_trunc('day', NEW.exchange_timestamp), NEW.platform, NEW.user_email, NEW.token_status, 1)
+    ON CONFLICT (bucket, platform, user_email, token_status)
+    DO UPDATE SET events = token_exchange_stats_daily.events + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER post_publish_logs_rollup
+    AFTER INSERT ON post_publish_logs
+    FOR EACH ROW EXECUTE FUNCTION rollup_publish_log();
+
+CREATE TRIGGER token_exchange_logs_rollup
+    AFTER INSERT ON token_exchange_logs
+    FOR EACH ROW EXECUTE FUNCTION rollup_token_exchange_log();
+
+-- Recalcula los rollups desde los logs crudos (carga inicial o corrección).
+-- Solo cubre los datos aún presentes en las particiones.
+CREATE FUNCTION rebuild_audit_rollups() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE post_publish_logs, token_exchange_logs IN SHARE MODE;
+    TRUNCATE publish_stats_hourly, publish_stats_daily,
+             token_exchange_stats_hourly, token_exchange_stats_daily;
+
+    INSERT INTO publish_stats_hourly
+    SELECT date_trunc('hour', logged_at), COALESCE(platform, ''), COALESCE(account_id, 0),
+           COALESCE(publish_status, ''), COALESCE(platform_response_code, ''), COUNT(*)
+    FROM post_publish_logs GROUP BY 1, 2, 3, 4, 5;
+    INSERT INTO publish_stats_daily
+    SELECT date_trunc('day', bucket), platform, account_id, publish_status, error_code, SUM(events)
+    FROM publish_stats_hourly GROUP BY 1, 2, 3, 4, 5;
+
+    INSERT INTO token_exchange_stats_hourly
+    SELECT date_trunc('hour', exchange_timestamp), platform, user_email, token_status, COUNT(*)
+    FROM token_exchange_logs GROUP BY 1, 2, 3, 4;
+    INSERT INTO token_exchange_stats_daily
+    SELECT date_trunc('day', bucket), platform, user_email, token_status, SUM(events)
+    FROM token_exchange_stats_hourly GROUP BY 1, 2, 3, 4;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Seguimiento de la sincronización de métricas de cada post publicado
+-- (ver web_aupa/insights_sync.py). next_sync_at se espacia según la edad
+-- del post; NULL indica que ya no se sincroniza. Guarda la última lectura.
+CREATE TABLE post_insights_sync (
+    post_id INTEGER PRIMARY KEY, -- posts_queue.id o posts_history.id
+    account_id INTEGER NOT NULL REFERENCES social_accounts(id) ON DELETE CASCADE,
+    platform_post_id VARCHAR(255) NOT NULL,
+    published_at TIMESTAMP NOT NULL,
+    next_sync_at TIMESTAMP,
+    last_synced_at TIMESTAMP,
+    failures INTEGER NOT NULL DEFAULT 0,
+    reactions INTEGER,
+    comments INTEGER,
+    shares INTEGER,
+    reach INTEGER,
+    impressions INTEGER
+);
+
+CREATE INDEX idx_post_insights_sync_due ON post_insights_sync (next_sync_at)
+    WHERE next_sync_at IS NOT NULL;
+
+-- Serie temporal de métricas: una fila por post y hora, solo si cambian
+CREATE TABLE post_insights (
+    post_id INTEGER NOT NULL,
+    captured_at TIMESTAMP NOT NULL, -- truncado a la hora
+    reactions INTEGER,
+    comments INTEGER,
+    shares INTEGER,
+    reach INTEGER,
+    impressions INTEGER,
+    PRIMARY KEY (post_id, captured_at)
+);
+
+-- Outbox de eventos de publicación para webhooks (ver web_aupa/webhook_dispatcher.py).
+-- El worker escribe el evento en la misma sentencia que el cambio de estado.
+-- xid es la transacción que lo escribió: el dispatcher solo entrega eventos de
+-- transacciones ya terminadas y en orden (xid, id), así un evento que se
+-- confirma tarde nunca queda por detrás del cursor.
+CREATE TABLE publish_events_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    account_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    event_type VARCHAR(50) NOT NULL, -- 'post.published', 'post.failed', 'post.retrying', 'post.dead', 'post.unsupported'
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_publish_events_outbox_order ON publish_events_outbox (xid, id);
+
+-- Despierta al dispatcher (LISTEN publish_events) al confirmar la transacción
+CREATE FUNCTION notify_publish_events() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('publish_events', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER publish_events_outbox_notify
+    AFTER INSERT ON publish_events_outbox
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_publish_events();
+
+-- Cursor de entrega por webhook y cuenta: último evento entregado y espera
+-- tras un fallo. Los eventos de una cuenta se entregan en orden; si un
+-- webhook falla solo se retrasan las cuentas afectadas.
+CREATE TABLE webhook_delivery_cursors (
+    endpoint TEXT NOT NULL, -- URL del webhook
+    account_id INTEGER NOT NULL,
+    last_xid XID8 NOT NULL DEFAULT '0',
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    PRIMARY KEY (endpoint, account_id)
+);
+
+-- Categorías de comercios (página de administración, web_aupa/admin_comercios.py)
+CREATE TABLE categoria_comercio (
+    id SERIAL PRIMARY KEY,
+    comercio_id TEXT NOT NULL,
+    nombre_comercio TEXT NOT NULL,
+    categoria TEXT
+);
+
+-- Búsqueda por nombre o ID (ILIKE y similitud)
+CREATE INDEX idx_categoria_comercio_nombre_trgm ON categoria_comercio USING gin (nombre_comercio gin_trgm_ops);
+CREATE INDEX idx_categoria_comercio_id_trgm ON categoria_comercio USING gin (comercio_id gin_trgm_ops);
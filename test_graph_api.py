@@ -0,0 +1,71 @@
+"""
+Pruebas del circuito de graph_api (sin red: requests.request se sustituye).
+Ejecutar: python -m pytest test_graph_api.py
+"""
+
+import time
+
+import pytest
+import requests
+
+import graph_api
+from graph_api import CIRCUIT_OPEN, GraphAPIError, graph_request
+
+PATH = "123/feed"
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"id": "1"}
+
+
+@pytest.fixture
+def circuit(monkeypatch):
+    """Circuito del endpoint en semiabierto: ya pasó CIRCUIT_OPEN_SECONDS."""
+    monkeypatch.setattr(graph_api, "_circuits", {})
+    breaker = graph_api.get_circuit(graph_api.endpoint_label(PATH))
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.open_seconds - 1
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def expire(breaker):
+    breaker.opened_at = time.monotonic() - breaker.open_seconds - 1
+
+
+def test_probe_connection_error_reopens_circuit(circuit, monkeypatch):
+    def fail(*args, **kwargs):
+        raise requests.ConnectionError("conexión rechazada")
+    monkeypatch.setattr(graph_api.requests, "request", fail)
+
+    with pytest.raises(GraphAPIError) as error:
+        graph_request("GET", PATH)
+    assert error.value.code == "REQUEST_ERROR"
+    assert circuit.state == "open" and not circuit.probing
+
+    # Mientras está abierto se rechaza sin llamar a la API
+    with pytest.raises(GraphAPIError) as error:
+        graph_request("GET", PATH)
+    assert error.value.code == CIRCUIT_OPEN
+
+    # Pasado el tiempo se permite otra llamada de prueba, que lo cierra
+    expire(circuit)
+    monkeypatch.setattr(graph_api.requests, "request", lambda *args, **kwargs: FakeResponse())
+    assert graph_request("GET", PATH) == {"id": "1"}
+    assert circuit.state == "closed"
+
+
+def test_probe_unexpected_exception_does_not_block_circuit(circuit, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("error inesperado")
+    monkeypatch.setattr(graph_api.requests, "request", fail)
+
+    with pytest.raises(RuntimeError):
+        graph_request("GET", PATH)
+    assert circuit.state == "open" and not circuit.probing
+
+    expire(circuit)
+    assert circuit.allow()
@@ -0,0 +1,57 @@
+"""
+Pruebas de oauth_exchange contra PostgreSQL (DATABASE_URL con init.sql aplicado).
+Cada prueba trabaja en una transacción que se deshace al terminar.
+Ejecutar: python -m pytest test_oauth_exchange.py
+"""
+
+import os
+
+import psycopg2
+import pytest
+
+from oauth_exchange import save_linked_accounts
+
+
+@pytest.fixture
+def cur():
+    try:
+        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    except psycopg2.Error as e:
+        pytest.skip(f"Sin base de datos: {e}")
+    cursor = conn.cursor()
+    yield cursor
+    conn.rollback()
+    conn.close()
+
+
+def test_save_linked_accounts_duplicated_instagram_account(cur):
+    # La misma cuenta de Instagram enlazada a dos páginas
+    accounts = [
+        {"platform_user_id": "ig-1", "access_token": "token-pagina-a", "name": "Página A"},
+        {"platform_user_id": "ig-2", "access_token": "token-pagina-b", "name": "Página B"},
+        {"platform_user_id": "ig-1", "access_token": "token-pagina-c", "name": "Página C"},
+    ]
+
+    ids = save_linked_accounts(cur, "test@aupa.local", "Instagram", accounts, expires_in=3600)
+
+    assert len(ids) == 3
+    assert ids[0] == ids[2] != ids[1]
+    cur.execute("""
+        SELECT platform_user_id, access_token FROM social_accounts
+        WHERE platform = 'Instagram' AND user_email = 'test@aupa.local'
+        ORDER BY platform_user_id
+    """)
+    assert cur.fetchall() == [("ig-1", "token-pagina-c"), ("ig-2", "token-pagina-b")]
+
+
+def test_save_linked_accounts_updates_existing_account(cur):
+    first = save_linked_accounts(cur, "test@aupa.local", "Facebook", [
+        {"platform_user_id": "page-1", "access_token": "viejo", "name": "Página"},
+    ])
+    second = save_linked_accounts(cur, "otro@aupa.local", "Facebook", [
+        {"platform_user_id": "page-1", "access_token": "nuevo", "name": "Página"},
+    ])
+
+    assert first == second
+    cur.execute("SELECT user_email, access_token FROM social_accounts WHERE id = %s", (first[0],))
+    assert cur.fetchone() == ("otro@aupa.local", "nuevo")
@@ -146,7 +146,7 @@ def check_file_structure():
         "web_aupa/app.py": "Aplicación principal Streamlit",
         "web_aupa/worker.py": "Worker para publicaciones",
         "web_aupa/audit_logger.py": "Módulo de auditoría",
-        "web_aupa/database_config.py": "Configuración de BD",
+        "web_aupa/config.py": "Configuración de BD",
         "init.sql": "Script de inicialización de BD"
     }
     
@@ -1,9 +1,21 @@
 import streamlit as st
-from tables_comercios import crear_tablas, insertar_comercio, obtener_comercios, eliminar_comercio, actualizar_comercio
+from tables_comercios import crear_tablas, insertar_comercio, buscar_comercios, eliminar_comercio, actualizar_comercio
+
+POR_PAGINA = 20
+
+@st.cache_resource(show_spinner=False)
+def asegurar_tablas():
+    """Crea la tabla una vez por proceso, no en cada rerun (si falla, se reintenta)."""
+    crear_tablas()
+    return True
 
 def main():
     st.title("🗄️ Administración de Comercios")
-    crear_tablas()
+    try:
+        asegurar_tablas()
+    except Exception as e:
+        st.error(f"❌ Error crítico de conexión: {e}")
+        return
 
     if 'edit_mode' not in st.session_state:
         st.session_state.edit_mode = False
@@ -43,15 +55,20 @@ def main():
                 st.rerun()
 
     st.subheader("📋 Lista de Comercios")
-    df = obtener_comercios()
+    texto = st.text_input("🔍 Buscar por nombre o ID", key="busqueda_comercios").strip()
+    if st.session_state.get("busqueda_comercios_previa") != texto:
+        st.session_state.busqueda_comercios_previa = texto
+        st.session_state.pagina_comercios = 0
+    pagina = st.session_state.get("pagina_comercios", 0)
+    comercios, hay_mas = buscar_comercios(texto, pagina, POR_PAGINA)
     
-    if not df.empty:
+    if comercios:
         cols = st.columns([1, 2, 3, 2, 2])
         headers = ["ID DB", "Comercio ID", "Nombre", "Categoría", "Acciones"]
         for col, h in zip(cols, headers): col.write(f"**{h}**")
         st.divider()
 
-        for _, row in df.iterrows():
+        for row in comercios:
             c1, c2, c3, c4, c5 = st.columns([1, 2, 3, 2, 2])
             c1.write(row['id']) 
             c2.write(row['comercio_id'])
@@ -68,5 +85,16 @@ def main():
                 st.session_state.edit_mode = True
                 st.session_state.comercio_a_editar = row
                 st.rerun()
+
+        col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+        if col_ant.button("◀ Anterior", disabled=pagina == 0, key="comercios_anterior"):
+            st.session_state.pagina_comercios = pagina - 1
+            st.rerun()
+        col_pag.caption(f"Página {pagina + 1}")
+        if col_sig.button("Siguiente ▶", disabled=not hay_mas, key="comercios_siguiente"):
+            st.session_state.pagina_comercios = pagina + 1
+            st.rerun()
+    elif texto:
+        st.info("Ningún comercio coincide con la búsqueda.")
     else:
         st.info("No hay registros.")
\ No newline at end of file
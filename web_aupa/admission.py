@@ -0,0 +1,146 @@
+"""
+Control de admisión de la cola de publicaciones.
+Antes de encolar estima cuándo se publicaría el post a partir del ritmo real
+de publicación (rollups de la última hora) y de la cuota por página. Si el
+retraso sobre la hora programada supera el SLA, el post se aplaza a la hora
+estimada o se rechaza, para que la cola no crezca sin límite y las horas
+programadas sigan significando algo.
+"""
+
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+from publishers import PUBLISHERS
+from structured_logger import get_logger
+
+logger = get_logger("admission")
+
+# Retraso máximo aceptable sobre la hora programada
+SLA_MINUTES = float(os.getenv("ADMISSION_SLA_MINUTES", "60"))
+# 'defer' aplaza el post a la hora estimada; 'reject' lo rechaza
+MODE = os.getenv("ADMISSION_MODE", "defer")
+# Más allá de este aplazamiento se rechaza igualmente
+MAX_DEFER_HOURS = float(os.getenv("ADMISSION_MAX_DEFER_HOURS", "24"))
+# Publicaciones por hora que admite una página (0 = sin límite por página)
+PAGE_POSTS_PER_HOUR = float(os.getenv("ADMISSION_PAGE_POSTS_PER_HOUR", "30"))
+# Ritmo mínimo supuesto cuando hay poco historial (posts/minuto por plataforma)
+MIN_DRAIN_PER_MINUTE = float(os.getenv("ADMISSION_MIN_DRAIN_PER_MINUTE", "5"))
+# Workers que comparten la cuota de cada adaptador
+WORKERS = int(os.getenv("ADMISSION_WORKERS", "1"))
+
+QUEUED_STATUSES = ("pending", "retrying", "claimed", "publishing")
+
+AdmissionDecision = namedtuple("AdmissionDecision", [
+    "action", "scheduled_at", "projected_delay_minutes", "reason"
+])
+
+
+def platform_drain_rate(cur, platform):
+    """
+    Posts/minuto que está procesando la plataforma, según los rollups horarios
+    de la hora en curso y la anterior. Se acota entre MIN_DRAIN_PER_MINUTE y la
+    cuota nominal de los adaptadores.
+    """
+    cur.execute("""
+        SELECT COALESCE(SUM(events), 0),
+               60 + EXTRACT(EPOCH FROM LOCALTIMESTAMP - date_trunc('hour', LOCALTIMESTAMP)) / 60
+        FROM publish_stats_hourly
+        WHERE platform = %s
+          AND publish_status IN ('published', 'failed')
+          AND bucket >= date_trunc('hour', LOCALTIMESTAMP) - INTERVAL '1 hour'
+    """, (platform,))
+    events, minutes = cur.fetchone()
+    observed = float(events) / float(minutes)
+
+    publisher = PUBLISHERS.get(platform)
+    nominal = publisher.rate_limit_per_minute * WORKERS if publisher else MIN_DRAIN_PER_MINUTE
+    return min(nominal, max(observed, MIN_DRAIN_PER_MINUTE))
+
+
+def queued_backlog(cur, platform, account_id):
+    """Posts en cola de la plataforma y de la cuenta, desde los contadores (O(1))."""
+    cur.execute("""
+        SELECT COALESCE(SUM(c.posts), 0),
+               COALESCE(SUM(c.posts) FILTER (WHERE c.account_id = %s), 0)
+        FROM posts_queue_counters c
+        JOIN social_accounts a ON a.id = c.account_id
+        WHERE a.platform = %s AND c.status = ANY(%s)
+    """, (account_id, platform, list(QUEUED_STATUSES)))
+    platform_posts, account_posts = cur.fetchone()
+    return int(platform_posts), int(account_posts)
+
+
+def due_backlog(cur, platform, account_id, scheduled_at):
+    """Posts en cola que se publicarán antes que uno programado para scheduled_at."""
+    cur.execute("""
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE q.account_id = %s)
+        FROM posts_queue q
+        JOIN social_accounts a ON a.id = q.account_id
+        WHERE a.platform = %s
+          AND q.status = ANY(%s)
+          AND q.scheduled_at <= %s
+    """, (account_id, platform, list(QUEUED_STATUSES), scheduled_at))
+    platform_posts, account_posts = cur.fetchone()
+    return int(platform_posts), int(account_posts)
+
+
+def page_wait_minutes(account_posts):
+    """Minutos que tarda la página en publicar sus posts en cola según su cuota."""
+    if PAGE_POSTS_PER_HOUR <= 0:
+        return 0.0
+    return account_posts / (PAGE_POSTS_PER_HOUR / 60)
+
+
+def check_admission(cur, account_id, scheduled_at=None):
+    """
+    Decide si un post nuevo entra en la cola.
+
+    Args:
+        cur: Cursor de la conexión
+        account_id: ID de la cuenta social
+        scheduled_at: Fecha programada solicitada (por defecto, ahora)
+
+    Returns:
+        AdmissionDecision con action 'admit', 'defer' o 'reject'. En 'defer',
+        scheduled_at es la nueva fecha programada.
+    """
+    now = datetime.now()
+    scheduled_at = scheduled_at or now
+
+    cur.execute("SELECT platform FROM social_accounts WHERE id = %s", (account_id,))
+    row = cur.fetchone()
+    if not row:
+        return AdmissionDecision("reject", scheduled_at, None, "Cuenta no encontrada")
+    platform = row[0]
+
+    drain = platform_drain_rate(cur, platform)
+
+    # Camino rápido: aunque todo lo encolado fuera por delante, cabe en el SLA
+    platform_posts, account_posts = queued_backlog(cur, platform, account_id)
+    wait = max(platform_posts / drain, page_wait_minutes(account_posts))
+    if wait <= SLA_MINUTES:
+        return AdmissionDecision("admit", scheduled_at, 0.0, None)
+
+    platform_posts, account_posts = due_backlog(cur, platform, account_id, scheduled_at)
+    wait = max(platform_posts / drain, page_wait_minutes(account_posts))
+    projected_at = max(scheduled_at, now + timedelta(minutes=wait))
+    delay = (projected_at - scheduled_at).total_seconds() / 60
+
+    if delay <= SLA_MINUTES:
+        return AdmissionDecision("admit", scheduled_at, delay, None)
+
+    reason = (
+        f"La cola de {platform} va con {delay:.0f} min de retraso "
+        f"({platform_posts} posts por delante, {drain:.1f} posts/min)"
+    )
+    if MODE == "defer" and delay <= MAX_DEFER_HOURS * 60:
+        logger.info("Post aplazado por control de admisión", extra={
+            "account_id": account_id, "platform": platform, "delay_minutes": round(delay, 1),
+            "deferred_to": projected_at.isoformat()
+        })
+        return AdmissionDecision("defer", projected_at.replace(second=0, microsecond=0), delay, reason)
+
+    logger.warning("Post rechazado por control de admisión", extra={
+        "account_id": account_id, "platform": platform, "delay_minutes": round(delay, 1)
+    })
+    return AdmissionDecision("reject", scheduled_at, delay, reason)
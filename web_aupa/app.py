@@ -1,24 +1,16 @@
 import streamlit as st
 import psycopg2
 import os
-import requests
-import json
+import logging
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 import socket
 from audit_logger import audit_logger
+from config import get_db_connection
+from log_export import export_to_buffer
+from monitor_queries import get_accounts, get_recent_publish_errors, get_recent_token_exchanges, search_posts
+from structured_logger import get_logger, log_context, span
 
-load_dotenv()
-
-# --- CONFIGURACIÓN DE PÁGINA ---
-st.set_page_config(page_title="Social Aupa Manager", layout="wide")
-
-# Lógica de Navegación Simple
-if "page" not in st.session_state:
-    st.session_state.page = "home"
-
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+logger = get_logger("app")
 
 def get_client_ip():
     """Obtiene la IP del cliente para auditoría."""
@@ -27,117 +19,9 @@ def get_client_ip():
     except Exception:
         return "0.0.0.0"
 
-def validate_facebook_token(access_token):
-    """Valida que el token de Facebook sea válido y obtiene información del usuario."""
-    try:
-        url = "https://graph.facebook.com/v18.0/me"
-        params = {
-            "access_token": access_token,
-            "fields": "id,name,email"
-        }
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return True, data
-        else:
-            return False, response.json()
-    except Exception as e:
-        return False, {"error": str(e)}
-
-def exchange_facebook_code(code):
-    """Realiza el intercambio del código de autorización por un access_token de Facebook.
-    Primero obtiene el user token, luego obtiene el page access token para publicar."""
-    try:
-        fb_app_id = os.getenv("FACEBOOK_CLIENT_ID")
-        fb_app_secret = os.getenv("FACEBOOK_CLIENT_SECRET")
-        redirect_uri = os.getenv("REDIRECT_URI", "https://localhost:8501/")
-        
-        if not fb_app_id or not fb_app_secret:
-            return None, "Faltan credenciales de Facebook en variables de entorno", "MISSING_CREDENTIALS"
-        
-        # Paso 1: Obtener USER ACCESS TOKEN
-        url = "https://graph.facebook.com/v18.0/oauth/access_token"
-        params = {
-            "client_id": fb_app_id,
-            "client_secret": fb_app_secret,
-            "redirect_uri": redirect_uri,
-            "code": code
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code != 200:
-            error_data = response.json()
-            error_msg = error_data.get("error", {}).get("message", "Unknown error")
-            error_code = error_data.get("error", {}).get("code", "UNKNOWN")
-            return None, error_msg, error_code
-        
-        user_token_data = response.json()
-        user_access_token = user_token_data.get("access_token")
-        expires_in = user_token_data.get("expires_in")
-        
-        # Validar el user token obtenido
-        is_valid, user_data = validate_facebook_token(user_access_token)
-        if not is_valid:
-            error_msg = user_data.get("error", {}).get("message", "Token validation failed")
-            return None, error_msg, "VALIDATION_FAILED"
-        
-        # Paso 2: Obtener PAGE ACCESS TOKEN para publicar
-        # Necesitamos obtener las páginas del usuario y un page token
-        pages_url = "https://graph.facebook.com/v18.0/me/accounts"
-        pages_params = {
-            "access_token": user_access_token,
-            "limit": 100
-        }
-        
-        pages_response = requests.get(pages_url, params=pages_params, timeout=10)
-        
-        if pages_response.status_code == 200:
-            pages_data = pages_response.json()
-            pages = pages_data.get("data", [])
-            
-            if pages:
-                # Usar la primera página disponible
-                page_token = pages[0].get("access_token")
-                page_id = pages[0].get("id")
-                page_name = pages[0].get("name")
-                
-                # Guardar info de la página en session
-                st.session_state.facebook_page_id = page_id
-                st.session_state.facebook_page_name = page_name
-                
-                # Retornar el PAGE TOKEN (es el que usaremos para publicar)
-                return page_token, None, None, expires_in, {
-                    "name": user_data.get("name"),
-                    "email": user_data.get("email"),
-                    "id": user_data.get("id"),
-                    "page_id": page_id,
-                    "page_name": page_name
-                }
-            else:
-                return None, "No se encontraron páginas. Asegúrate de que el usuario tenga acceso a páginas de Facebook", "NO_PAGES"
-        else:
-            return None, "No se pudieron obtener las páginas del usuario", "PAGES_ERROR"
-            
-    except requests.exceptions.Timeout:
-        return None, "Timeout en conexión con Facebook", "TIMEOUT"
-    except requests.exceptions.RequestException as e:
-        return None, str(e), "REQUEST_ERROR"
-    except Exception as e:
-        return None, str(e), "UNKNOWN_ERROR"
-
-# Sidebar para navegar
-with st.sidebar:
-    st.title("Navegación")
-    if st.button("🏠 Inicio"):
-        st.session_state.page = "home"
-    if st.button("⚖️ Política de Privacidad"):
-        st.session_state.page = "privacy"
-
-# --- RENDERIZADO DE PÁGINAS ---
 
-if st.session_state.page == "privacy":
+def mostrar_privacidad():
+    """Página de política de privacidad."""
     st.title("Política de Privacidad - Aupa Manager")
     st.write(f"**Última actualización:** {datetime.now().strftime('%d/%m/%Y')}")
     
@@ -157,9 +41,8 @@ if st.session_state.page == "privacy":
         st.session_state.page = "home"
         st.rerun()
 
-elif st.session_state.page == "home":
-    st.title("📱 Social Aupa Manager")
-
+def mostrar_conexion_redes():
+    """Sección 1: autorización OAuth y vinculación de cuentas."""
     # --- 1. CONFIGURACIÓN DE REDES SOCIALES (MODIFICADO) ---
     st.header("1. Conectar Redes Sociales")
     st.write("Selecciona una red social para autorizar el acceso:")
@@ -204,10 +87,14 @@ elif st.session_state.page == "home":
             else:
                 with st.spinner(f"🔄 Intercambiando código por token con {platform}..."):
                     try:
-                        # Paso 1: Intercambiar código por access_token
-                        access_token, error_msg, error_code, expires_in, user_data = exchange_facebook_code(code)
+                        # Los clientes de la Graph API solo se cargan al vincular
+                        from oauth_exchange import exchange_facebook_code, save_linked_accounts
+
+                        # Paso 1: Intercambiar código y obtener todas las páginas gestionadas
+                        with span(logger, "oauth_exchange", level=logging.INFO, platform=platform):
+                            result, error_msg, error_code = exchange_facebook_code(code, platform)
                         
-                        if not access_token:
+                        if not result:
                             st.error(f"❌ Error en intercambio de tokens: {error_msg}")
                             audit_logger.log_token_exchange(
                                 user_email, platform, code,
@@ -216,56 +103,37 @@ elif st.session_state.page == "home":
                                 error_code=error_code
                             )
                         else:
-                            # Paso 2: Validar token
-                            is_valid, validation_data = validate_facebook_token(access_token)
+                            # Paso 2: Guardar todas las cuentas en una sola transacción
+                            fb_user_id = result["user"].get("id")
+                            accounts_linked = result["accounts"]
+                            expires_in = result["expires_in"]
+                            
+                            conn = get_db_connection()
+                            cur = conn.cursor()
+                            account_ids = save_linked_accounts(cur, user_email, platform, accounts_linked, expires_in)
+                            conn.commit()
+                            
+                            # Paso 3: Registrar en auditoría
+                            audit_logger.log_token_exchange(
+                                user_email, platform, code,
+                                access_token=accounts_linked[0]["access_token"],
+                                status="success",
+                                fb_user_id=fb_user_id,
+                                expires_in=expires_in
+                            )
                             
-                            if not is_valid:
-                                st.error("❌ Token inválido después de obtenerlo.")
-                                audit_logger.log_token_exchange(
-                                    user_email, platform, code,
-                                    status="failed",
-                                    error_msg="Token validation failed"
-                                )
-                            else:
-                                # Paso 3: Guardar en base de datos
-                                fb_user_id = user_data.get("id")
-                                
-                                conn = get_db_connection()
-                                cur = conn.cursor()
-                                
-                                cur.execute("""
-                                    INSERT INTO social_accounts 
-                                    (user_email, platform, platform_user_id, access_token, expires_at)
-                                    VALUES (%s, %s, %s, %s, %s)
-                                    RETURNING id
-                                """, (
-                                    user_email,
-                                    platform,
-                                    fb_user_id,
-                                    access_token,
-                                    datetime.now() + timedelta(seconds=int(expires_in)) if expires_in else None
-                                ))
-                                account_id = cur.fetchone()[0]
-                                conn.commit()
-                                
-                                # Paso 4: Registrar en auditoría
-                                audit_logger.log_token_exchange(
-                                    user_email, platform, code,
-                                    access_token=access_token,
-                                    status="success",
-                                    fb_user_id=fb_user_id,
-                                    expires_in=expires_in
-                                )
-                                
-                                cur.close()
-                                conn.close()
-                                
-                                st.success(f"✅ ¡{platform} configurado exitosamente para {user_email}!")
-                                st.info(f"📊 ID de la cuenta: {account_id}")
-                                st.query_params.clear()
-                                st.rerun()
+                            cur.close()
+                            conn.close()
+                            
+                            st.success(f"✅ ¡{platform} configurado exitosamente para {user_email}!")
+                            st.info(f"📊 {len(account_ids)} cuenta(s) vinculada(s): " + ", ".join(
+                                account["name"] or account["platform_user_id"] for account in accounts_linked
+                            ))
+                            st.query_params.clear()
+                            st.rerun()
                     
                     except psycopg2.Error as db_err:
+                        logger.error("Error de base de datos en la vinculación", extra={"platform": platform, "error": str(db_err)})
                         st.error(f"❌ Error de Base de Datos: {db_err}")
                         audit_logger.log_token_exchange(
                             user_email, platform, code,
@@ -273,6 +141,7 @@ elif st.session_state.page == "home":
                             error_msg=f"Database error: {str(db_err)}"
                         )
                     except Exception as e:
+                        logger.exception("Error inesperado en la vinculación", extra={"platform": platform})
                         st.error(f"💥 Error inesperado: {type(e).__name__}: {str(e)}")
                         st.exception(e)
                         audit_logger.log_token_exchange(
@@ -281,51 +150,80 @@ elif st.session_state.page == "home":
                             error_msg=f"{type(e).__name__}: {str(e)}"
                         )
 
+def mostrar_formulario_publicacion():
+    """Sección 2: alta de publicaciones en la cola."""
     # --- 2. FORMULARIO DE PUBLICACIÓN ---
     st.divider()
     st.header("2. Crear Publicación")
     try:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT id, platform, created_at FROM social_accounts")
-        accounts = cur.fetchall()
+        accounts = get_accounts(cur)
         
         if accounts:
             selected_acc = st.selectbox("Publicar desde:", accounts, format_func=lambda x: f"{x[1]} (ID: {x[0]})")
             post_content = st.text_area("¿Qué quieres publicar?")
             
             if st.button("Programar Publicación"):
-                cur.execute(
-                    "INSERT INTO posts_queue (account_id, content) VALUES (%s, %s)",
-                    (selected_acc[0], post_content)
-                )
-                conn.commit()
-                st.success("Post añadido a la cola de procesamiento.")
+                # admission importa los adaptadores de publicación: solo al encolar
+                from admission import check_admission
+                from post_queue import enqueue_post
+
+                with log_context(account_id=selected_acc[0]), span(logger, "enqueue", level=logging.INFO):
+                    requested_at = datetime.now().replace(second=0, microsecond=0)
+                    decision = check_admission(cur, selected_acc[0], requested_at)
+                    if decision.action != "reject":
+                        post_id, created = enqueue_post(
+                            cur, selected_acc[0], post_content, scheduled_at=requested_at,
+                            deferred_to=decision.scheduled_at if decision.action == "defer" else None
+                        )
+                        conn.commit()
+                if decision.action == "reject":
+                    st.error(f"⛔ La cola está saturada y no se puede aceptar la publicación. {decision.reason}")
+                elif not created:
+                    st.info(f"Esta publicación ya estaba en la cola (ID: {post_id}).")
+                elif decision.action == "defer":
+                    st.warning(
+                        f"⏳ {decision.reason}. La publicación se ha programado para "
+                        f"{decision.scheduled_at:%d/%m %H:%M}."
+                    )
+                else:
+                    st.success("Post añadido a la cola de procesamiento.")
         else:
             st.warning("No hay cuentas conectadas.")
         cur.close()
         conn.close()
     except Exception as e:
+        logger.exception("Error en el formulario de publicación")
         st.error(f"Error de conexión: {e}")
 
+def mostrar_monitor():
+    """Sección 3: monitor de publicaciones y auditoría."""
     # --- 3. MONITOR DE ERRORES Y AUDITORÍA ---
     st.divider()
     st.header("3. Monitor de Publicaciones y Auditoría")
     
-    tab1, tab2, tab3 = st.tabs(["📊 Publicaciones", "🔐 Auditoría de Tokens", "❌ Errores"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Publicaciones", "🔐 Auditoría de Tokens", "❌ Errores", "📥 Exportar"])
     
     with tab1:
-        if st.button("🔄 Actualizar logs de publicaciones"):
+        with st.form("buscar_posts"):
+            col_texto, col_email = st.columns(2)
+            texto = col_texto.text_input("Contenido", placeholder='p. ej. oferta "fin de semana" -envío')
+            email = col_email.text_input("Email de la cuenta")
+            if st.form_submit_button("🔍 Buscar"):
+                # Sin filtros se muestran las últimas publicaciones
+                st.session_state.busqueda_posts = (texto.strip(), email.strip())
+                st.session_state.pagina_posts = 0
+
+        if "busqueda_posts" in st.session_state:
+            texto, email = st.session_state.busqueda_posts
+            pagina = st.session_state.get("pagina_posts", 0)
             try:
                 conn = get_db_connection()
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT q.id, a.platform, q.content, q.status, q.error_message, q.scheduled_at, a.user_email
-                    FROM posts_queue q
-                    JOIN social_accounts a ON q.account_id = a.id
-                    ORDER BY q.scheduled_at DESC LIMIT 20
-                """)
-                logs = cur.fetchall()
+                logs, hay_mas = search_posts(cur, texto, email, pagina)
+                cur.close()
+                conn.close()
                 if logs:
                     for log in logs:
                         with st.expander(f"📌 ID: {log[0]} | {log[1]} | Estado: {log[3]} | {log[4]}"):
@@ -334,10 +232,17 @@ elif st.session_state.page == "home":
                             st.write(f"**Programado:** {log[5]}")
                             if log[4]: 
                                 st.error(f"**Error:** {log[4]}")
+
+                    col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+                    if col_ant.button("◀ Anterior", disabled=pagina == 0, key="posts_anterior"):
+                        st.session_state.pagina_posts = pagina - 1
+                        st.rerun()
+                    col_pag.caption(f"Página {pagina + 1}")
+                    if col_sig.button("Siguiente ▶", disabled=not hay_mas, key="posts_siguiente"):
+                        st.session_state.pagina_posts = pagina + 1
+                        st.rerun()
                 else:
                     st.write("No hay registros de publicaciones.")
-                cur.close()
-                conn.close()
             except Exception as e:
                 st.error(f"Error al cargar logs: {e}")
     
@@ -346,13 +251,7 @@ elif st.session_state.page == "home":
             try:
                 conn = get_db_connection()
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT user_email, platform, token_status, error_message, 
-                           facebook_user_id, exchange_timestamp, ip_address
-                    FROM token_exchange_logs
-                    ORDER BY exchange_timestamp DESC LIMIT 20
-                """)
-                logs = cur.fetchall()
+                logs = get_recent_token_exchanges(cur)
                 if logs:
                     for log in logs:
                         if log[2] == "success":
@@ -379,14 +278,7 @@ elif st.session_state.page == "home":
             try:
                 conn = get_db_connection()
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT post_id, account_id, platform, publish_status, 
-                           error_details, retry_count, logged_at
-                    FROM post_publish_logs
-                    WHERE publish_status = 'failed'
-                    ORDER BY logged_at DESC LIMIT 20
-                """)
-                logs = cur.fetchall()
+                logs = get_recent_publish_errors(cur)
                 if logs:
                     for log in logs:
                         with st.expander(f"❌ Post ID: {log[0]} | {log[2]} | Intentos: {log[5]}"):
@@ -400,4 +292,65 @@ elif st.session_state.page == "home":
                 cur.close()
                 conn.close()
             except Exception as e:
-                st.error(f"Error al cargar errores: {e}")
\ No newline at end of file
+                st.error(f"Error al cargar errores: {e}")
+
+    with tab4:
+        mostrar_exportacion()
+
+def mostrar_exportacion():
+    """Descarga de los logs de auditoría filtrados (CSV o Parquet)."""
+    tablas = {"Publicaciones": "post_publish_logs", "Intercambios de tokens": "token_exchange_logs"}
+    col1, col2 = st.columns(2)
+    tabla = col1.selectbox("Logs", list(tablas), key="export_tabla")
+    formato = col2.radio("Formato", ["csv", "parquet"], horizontal=True, key="export_formato")
+    hoy = datetime.now().date()
+    rango = st.date_input("Periodo", value=(hoy - timedelta(days=30), hoy), key="export_rango")
+    col3, col4 = st.columns(2)
+    plataforma = col3.selectbox("Plataforma", ["Todas", "Facebook", "Instagram", "TikTok"], key="export_plataforma")
+    email = col4.text_input("Email (opcional)", key="export_email")
+
+    if not isinstance(rango, tuple) or len(rango) != 2:
+        st.info("Selecciona la fecha inicial y la final.")
+        return
+    desde = datetime.combine(rango[0], datetime.min.time())
+    hasta = datetime.combine(rango[1] + timedelta(days=1), datetime.min.time())
+
+    # La exportación se genera al pulsar (no en cada rerun) y se lee por bloques
+    st.download_button(
+        "📥 Descargar",
+        data=lambda: export_to_buffer(
+            tablas[tabla], formato, desde, hasta,
+            None if plataforma == "Todas" else plataforma, email.strip() or None
+        ),
+        file_name=f"{tablas[tabla]}_{rango[0]:%Y%m%d}_{rango[1]:%Y%m%d}.{formato}",
+        mime="text/csv" if formato == "csv" else "application/vnd.apache.parquet",
+        on_click="ignore",
+    )
+
+def main():
+    """Punto de entrada de la página (lo llama portal.py o `streamlit run app.py`)."""
+    # Lógica de Navegación Simple
+    if "page" not in st.session_state:
+        st.session_state.page = "home"
+
+    # Sidebar para navegar
+    with st.sidebar:
+        st.title("Navegación")
+        if st.button("🏠 Inicio"):
+            st.session_state.page = "home"
+        if st.button("⚖️ Política de Privacidad"):
+            st.session_state.page = "privacy"
+
+    # --- RENDERIZADO DE PÁGINAS ---
+    if st.session_state.page == "privacy":
+        mostrar_privacidad()
+    elif st.session_state.page == "home":
+        st.title("📱 Social Aupa Manager")
+        mostrar_conexion_redes()
+        mostrar_formulario_publicacion()
+        mostrar_monitor()
+
+if __name__ == "__main__":
+    # --- CONFIGURACIÓN DE PÁGINA --- (en el portal la fija portal.py)
+    st.set_page_config(page_title="Social Aupa Manager", layout="wide")
+    main()
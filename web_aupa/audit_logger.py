@@ -7,10 +7,10 @@ import psycopg2
 import os
 from datetime import datetime, timedelta
 import socket
-import json
-from dotenv import load_dotenv
+import config  # carga el .env una sola vez por proceso
+from structured_logger import get_logger
 
-load_dotenv()
+logger = get_logger("audit")
 
 class AuditLogger:
     """Clase para gestionar toda la auditoría del sistema."""
@@ -23,7 +23,7 @@ class AuditLogger:
         try:
             return psycopg2.connect(self.db_url)
         except Exception as e:
-            print(f"❌ Error de conexión a BD: {e}")
+            logger.error("Error de conexión a BD", extra={"error": str(e)})
             return None
     
     def get_client_ip(self):
@@ -85,17 +85,13 @@ class AuditLogger:
             cur.close()
             conn.close()
             
-            if status == "success":
-                status_symbol = "✅"
-            elif status == "failed":
-                status_symbol = "❌"
-            else:
-                status_symbol = "⏳"
-            print(f"{status_symbol} [AUDITORÍA] Token exchange: {user_email} | {platform} | {status}")
+            logger.info("Token exchange registrado", extra={
+                "user_email": user_email, "platform": platform, "token_status": status
+            })
             return True
             
         except Exception as e:
-            print(f"❌ Error registrando token exchange: {e}")
+            logger.error("Error registrando token exchange", extra={"error": str(e)})
             return False
     
     def log_publish_event(self, post_id, account_id, platform, fb_post_id=None,
@@ -141,12 +137,13 @@ class AuditLogger:
             cur.close()
             conn.close()
             
-            status_symbol = "✅" if status == "published" else "❌"
-            print(f"{status_symbol} [AUDITORÍA] Post publish: ID={post_id} | {platform} | {status}")
+            logger.debug("Evento de publicación registrado", extra={
+                "post_id": post_id, "platform": platform, "publish_status": status
+            })
             return True
             
         except Exception as e:
-            print(f"❌ Error registrando evento de publicación: {e}")
+            logger.error("Error registrando evento de publicación", extra={"post_id": post_id, "error": str(e)})
             return False
     
     def log_validation_event(self, access_token, is_valid, expires_at, account_id, platform):
@@ -187,12 +184,13 @@ class AuditLogger:
             cur.close()
             conn.close()
             
-            status_symbol = "✅" if is_valid else "⚠️"
-            print(f"{status_symbol} [AUDITORÍA] Token validation: Account={account_id} | {platform} | valid={is_valid}")
+            logger.debug("Validación de token registrada", extra={
+                "account_id": account_id, "platform": platform, "is_valid": is_valid
+            })
             return True
             
         except Exception as e:
-            print(f"❌ Error registrando validación: {e}")
+            logger.error("Error registrando validación", extra={"account_id": account_id, "error": str(e)})
             return False
     
     def get_token_exchange_history(self, user_email=None, platform=None, limit=50):
@@ -237,7 +235,7 @@ class AuditLogger:
             return records
             
         except Exception as e:
-            print(f"❌ Error obteniendo historial: {e}")
+            logger.error("Error obteniendo historial", extra={"error": str(e)})
             return None
     
     def get_failed_publications(self, limit=20):
@@ -268,13 +266,17 @@ class AuditLogger:
             return records
             
         except Exception as e:
-            print(f"❌ Error obteniendo publicaciones fallidas: {e}")
+            logger.error("Error obteniendo publicaciones fallidas", extra={"error": str(e)})
             return None
     
     def generate_audit_report(self, days=7):
         """
         Genera un reporte de auditoría de los últimos N días.
         
+        Lee los rollups por hora/día en lugar de los logs crudos: las horas del
+        primer día (parcial) salen de las tablas *_hourly y el resto de las
+        *_daily, así que el coste no depende del volumen de logs.
+        
         Returns:
             Diccionario con estadísticas
         """
@@ -287,29 +289,51 @@ class AuditLogger:
             
             # Estadísticas de intercambios
             cur.execute("""
+                WITH window_start AS (
+                    SELECT date_trunc('hour', NOW() - %s * INTERVAL '1 day') AS hour_start,
+                           date_trunc('day', NOW() - %s * INTERVAL '1 day') + INTERVAL '1 day' AS day_start
+                ), buckets AS (
+                    SELECT platform, token_status, events
+                    FROM token_exchange_stats_hourly, window_start
+                    WHERE bucket >= hour_start AND bucket < day_start
+                    UNION ALL
+                    SELECT platform, token_status, events
+                    FROM token_exchange_stats_daily, window_start
+                    WHERE bucket >= day_start
+                )
                 SELECT 
-                    COUNT(*) as total,
-                    COUNT(CASE WHEN token_status = 'success' THEN 1 END) as exitosos,
-                    COUNT(CASE WHEN token_status = 'failed' THEN 1 END) as fallidos,
+                    SUM(events)::BIGINT as total,
+                    COALESCE(SUM(events) FILTER (WHERE token_status = 'success'), 0)::BIGINT as exitosos,
+                    COALESCE(SUM(events) FILTER (WHERE token_status = 'failed'), 0)::BIGINT as fallidos,
                     platform
-                FROM token_exchange_logs
-                WHERE exchange_timestamp >= NOW() - INTERVAL '%s days'
+                FROM buckets
                 GROUP BY platform
-            """, (days,))
+            """, (days, days))
             
             token_stats = cur.fetchall()
             
             # Estadísticas de publicaciones
             cur.execute("""
+                WITH window_start AS (
+                    SELECT date_trunc('hour', NOW() - %s * INTERVAL '1 day') AS hour_start,
+                           date_trunc('day', NOW() - %s * INTERVAL '1 day') + INTERVAL '1 day' AS day_start
+                ), buckets AS (
+                    SELECT platform, publish_status, events
+                    FROM publish_stats_hourly, window_start
+                    WHERE bucket >= hour_start AND bucket < day_start
+                    UNION ALL
+                    SELECT platform, publish_status, events
+                    FROM publish_stats_daily, window_start
+                    WHERE bucket >= day_start
+                )
                 SELECT 
-                    COUNT(*) as total,
-                    COUNT(CASE WHEN publish_status = 'published' THEN 1 END) as exitosas,
-                    COUNT(CASE WHEN publish_status = 'failed' THEN 1 END) as fallidas,
-                    platform
-                FROM post_publish_logs
-                WHERE logged_at >= NOW() - INTERVAL '%s days'
+                    SUM(events)::BIGINT as total,
+                    COALESCE(SUM(events) FILTER (WHERE publish_status = 'published'), 0)::BIGINT as exitosas,
+                    COALESCE(SUM(events) FILTER (WHERE publish_status = 'failed'), 0)::BIGINT as fallidas,
+                    NULLIF(platform, '') as platform
+                FROM buckets
                 GROUP BY platform
-            """, (days,))
+            """, (days, days))
             
             publish_stats = cur.fetchall()
             
@@ -324,7 +348,7 @@ class AuditLogger:
             }
             
         except Exception as e:
-            print(f"❌ Error generando reporte: {e}")
+            logger.error("Error generando reporte", extra={"error": str(e)})
             return {}
 
 
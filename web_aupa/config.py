@@ -0,0 +1,16 @@
+"""
+Configuración compartida.
+Carga el .env una sola vez por proceso: los módulos importan este en lugar de
+llamar cada uno a load_dotenv() al importarse.
+"""
+
+import os
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def get_db_connection():
+    """Establece conexión a la base de datos (DATABASE_URL se lee en cada llamada)."""
+    return psycopg2.connect(os.getenv("DATABASE_URL"))
@@ -0,0 +1,214 @@
+"""
+Panel de operaciones en vivo: profundidad de la cola, ritmo de publicación,
+tasa de fallos por plataforma y código de error y horizonte de caducidad de
+tokens.
+
+Se refresca solo (st.fragment con run_every) y de forma incremental: cada
+sesión guarda en session_state el último bucket horario y la fecha del último
+log de fallo vistos y solo pide lo posterior. Los agregados comunes (cola y tokens) se
+cachean para todo el proceso, así que varios operadores con el panel abierto
+no multiplican la carga sobre la BD.
+"""
+
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+import streamlit as st
+from config import get_db_connection
+
+REFRESH_SECONDS = int(os.getenv("DASHBOARD_REFRESH_SECONDS", "15"))
+WINDOW_HOURS = 24
+FEED_SIZE = 50
+# Los logs se fechan al empezar la transacción que los escribe, no al hacer
+# commit: el feed vuelve a leer este margen para no perder los que llegan tarde
+FEED_OVERLAP = timedelta(minutes=5)
+
+
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def obtener_profundidad_cola():
+    """Posts por estado en posts_queue, leídos de los contadores (compartido entre sesiones)."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT status, SUM(posts) FROM posts_queue_counters GROUP BY status")
+        return {status: int(posts) for status, posts in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+@st.cache_data(ttl=REFRESH_SECONDS, show_spinner=False)
+def obtener_horizonte_tokens():
+    """Cuentas agrupadas por tiempo restante hasta la caducidad del token."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT CASE
+                       WHEN expires_at IS NULL THEN 'Sin caducidad'
+                       WHEN expires_at <= NOW() THEN 'Caducado'
+                       WHEN expires_at <= NOW() + INTERVAL '1 day' THEN '< 24 h'
+                       WHEN expires_at <= NOW() + INTERVAL '7 days' THEN '< 7 días'
+                       WHEN expires_at <= NOW() + INTERVAL '30 days' THEN '< 30 días'
+                       ELSE '> 30 días'
+                   END AS horizonte,
+                   platform, COUNT(*)
+            FROM social_accounts
+            GROUP BY 1, 2
+        """)
+        return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def actualizar_estado(cur):
+    """
+    Trae solo lo nuevo desde la última actualización de esta sesión.
+
+    - Rollups horarios: se vuelven a pedir los buckets desde el último visto
+      (la hora en curso sigue cambiando) y se descartan los que salen de la ventana.
+    - Fallos recientes: logs desde el último visto menos FEED_OVERLAP,
+      deduplicados por id (un id mayor no implica un commit posterior).
+    """
+    state = st.session_state
+    # La ventana se calcula con el reloj de la BD (los logs son TIMESTAMP sin zona)
+    cur.execute("SELECT date_trunc('hour', LOCALTIMESTAMP) - %s * INTERVAL '1 hour'", (WINDOW_HOURS,))
+    window_start = cur.fetchone()[0]
+
+    if "ops_hourly" not in state:
+        state.ops_hourly = {}
+        state.ops_last_bucket = window_start
+        state.ops_feed = []
+        state.ops_feed_since = window_start
+
+    cur.execute("""
+        SELECT bucket, platform, publish_status, error_code, SUM(events)
+        FROM publish_stats_hourly
+        WHERE bucket >= %s
+        GROUP BY 1, 2, 3, 4
+    """, (state.ops_last_bucket,))
+    for bucket, platform, status, error_code, events in cur.fetchall():
+        state.ops_hourly[(bucket, platform, status, error_code)] = int(events)
+        state.ops_last_bucket = max(state.ops_last_bucket, bucket)
+    state.ops_hourly = {k: v for k, v in state.ops_hourly.items() if k[0] >= window_start}
+
+    # El filtro por logged_at permite además descartar particiones antiguas
+    cur.execute("""
+        SELECT id, logged_at, platform, account_id, platform_response_code, error_details
+        FROM post_publish_logs
+        WHERE publish_status = 'failed' AND logged_at >= %s
+        ORDER BY logged_at DESC, id DESC LIMIT %s
+    """, (max(window_start, state.ops_feed_since - FEED_OVERLAP), FEED_SIZE))
+    nuevos = cur.fetchall()
+
+    if nuevos:
+        feed = {row[0]: row for row in state.ops_feed + nuevos}
+        state.ops_feed = sorted(feed.values(), key=lambda row: (row[1], row[0]), reverse=True)[:FEED_SIZE]
+        state.ops_feed_since = max(state.ops_feed_since, nuevos[0][1])
+
+
+def mostrar_cola():
+    cola = obtener_profundidad_cola()
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1.metric("⏳ Pendientes", cola.get("pending", 0))
+    col2.metric("🚀 En curso", cola.get("claimed", 0) + cola.get("publishing", 0))
+    col3.metric("🔁 Reintentando", cola.get("retrying", 0))
+    # Totales desde el inicio (incluyen los archivados), no solo la ventana
+    col4.metric("✅ Enviados (total)", cola.get("sent", 0))
+    col5.metric("❌ Fallidos (total)", cola.get("failed", 0))
+    col6.metric("💀 Descartados (total)", cola.get("dead", 0))
+
+
+def mostrar_publicaciones():
+    hourly = st.session_state.ops_hourly
+    if not hourly:
+        st.info(f"Sin publicaciones en las últimas {WINDOW_HOURS} horas.")
+        return
+
+    df = pd.DataFrame(
+        [(bucket, platform or "-", status or "-", error_code or "-", events)
+         for (bucket, platform, status, error_code), events in hourly.items()],
+        columns=["hora", "plataforma", "estado", "codigo", "eventos"]
+    )
+
+    ultima_hora = df[df["hora"] == df["hora"].max()]
+    publicadas_hora = int(ultima_hora.loc[ultima_hora["estado"] == "published", "eventos"].sum())
+    total = int(df["eventos"].sum())
+    fallidas = int(df.loc[df["estado"] == "failed", "eventos"].sum())
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("📤 Publicadas (hora actual)", publicadas_hora)
+    col2.metric(f"📊 Eventos ({WINDOW_HOURS} h)", total)
+    col3.metric(f"⚠️ Tasa de fallos ({WINDOW_HOURS} h)", f"{fallidas / total:.1%}" if total else "-")
+
+    st.subheader("Ritmo de publicación por hora")
+    ritmo = df[df["estado"] == "published"].pivot_table(
+        index="hora", columns="plataforma", values="eventos", aggfunc="sum", fill_value=0
+    )
+    if not ritmo.empty:
+        st.bar_chart(ritmo)
+
+    st.subheader("Fallos por plataforma y código de error")
+    por_plataforma = df.groupby("plataforma")["eventos"].sum()
+    fallos = df[df["estado"] == "failed"].groupby(["plataforma", "codigo"])["eventos"].sum().reset_index()
+    if fallos.empty:
+        st.success("Sin fallos en la ventana.")
+    else:
+        fallos["tasa"] = fallos.apply(lambda r: r["eventos"] / por_plataforma[r["plataforma"]], axis=1)
+        fallos = fallos.sort_values("eventos", ascending=False)
+        st.dataframe(
+            fallos, hide_index=True, width="stretch",
+            column_config={"tasa": st.column_config.NumberColumn("tasa", format="percent")}
+        )
+
+
+def mostrar_tokens():
+    filas = obtener_horizonte_tokens()
+    if not filas:
+        st.write("No hay cuentas conectadas.")
+        return
+    df = pd.DataFrame(filas, columns=["horizonte", "plataforma", "cuentas"])
+    tabla = df.pivot_table(index="horizonte", columns="plataforma", values="cuentas",
+                           aggfunc="sum", fill_value=0)
+    orden = ["Caducado", "< 24 h", "< 7 días", "< 30 días", "> 30 días", "Sin caducidad"]
+    st.dataframe(tabla.reindex([h for h in orden if h in tabla.index]), width="stretch")
+
+
+def mostrar_feed():
+    if not st.session_state.ops_feed:
+        st.write("No hay errores recientes.")
+        return
+    df = pd.DataFrame(st.session_state.ops_feed,
+                      columns=["id", "fecha", "plataforma", "cuenta", "codigo", "detalle"])
+    st.dataframe(df, hide_index=True, width="stretch")
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def panel_en_vivo():
+    try:
+        conn = get_db_connection()
+        try:
+            actualizar_estado(conn.cursor())
+        finally:
+            conn.close()
+    except Exception as e:
+        st.error(f"Error al actualizar el panel: {e}")
+        return
+
+    st.caption(f"Actualizado {datetime.now():%H:%M:%S} · cada {REFRESH_SECONDS} s")
+    st.header("Cola de publicaciones")
+    mostrar_cola()
+    st.divider()
+    mostrar_publicaciones()
+    st.divider()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("🔐 Caducidad de tokens")
+        mostrar_tokens()
+    with col2:
+        st.subheader("❌ Últimos errores")
+        mostrar_feed()
+
+
+def main():
+    st.title("📡 Operaciones")
+    panel_en_vivo()
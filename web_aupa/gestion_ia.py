@@ -1,5 +1,4 @@
 import streamlit as st
-import requests
 import uuid
 import time
 from urllib.parse import quote
@@ -13,6 +12,8 @@ class HerramientasIA:
 
     def generate_text(self, prompt):
         """Genera copy creativo con sistema de reintentos para evitar saturación."""
+        import requests  # solo se carga al generar, no al abrir la página
+
         full_prompt = f"Crea un post creativo y profesional para redes sociales sobre: {prompt}. Incluye emojis y hashtags."
         
         for intento in range(3):
@@ -40,53 +41,59 @@ class HerramientasIA:
         return f"{self.img_base_url}{quote(prompt)}?width=1080&height=1080&seed={seed}&nologo=true"
 
 # --- INTERFAZ PARA EL PORTAL ---
-st.title("🤖 Aupa - Gestión IA")
-
-ia_tool = HerramientasIA()
-
-# Inicialización de estados de sesión para mantener los datos al navegar en el portal
-if 'txt_gen' not in st.session_state: st.session_state['txt_gen'] = ""
-if 'img_gen_url' not in st.session_state: st.session_state['img_gen_url'] = ""
-
-# Creación de pestañas incluyendo la nueva función de Visión
-tab_txt, tab_img, tab_vision = st.tabs(["✍️ Redactar Copy", "🎨 Diseñar Imagen", "🔍 Imagen a Texto"])
-
-with tab_txt:
-    idea_txt = st.text_area("¿Sobre qué quieres escribir hoy?", placeholder="Ej: Promoción de verano para una cafetería...")
-    if st.button("✨ Generar Texto"):
-        with st.spinner("La IA está redactando..."):
-            st.session_state['txt_gen'] = ia_tool.generate_text(idea_txt)
-    
-    if st.session_state['txt_gen']:
-        st.info(st.session_state['txt_gen'])
-        if st.button("Limpiar Texto", key="clear_text"):
-            st.session_state['txt_gen'] = ""
-            st.rerun()
-
-with tab_img:
-    idea_img = st.text_input("Describe la imagen que necesitas:", placeholder="Ej: Un café humeante al atardecer...")
-    if st.button("🎨 Crear Arte"):
-        with st.spinner("Diseñando imagen..."):
-            st.session_state['img_gen_url'] = ia_tool.generate_image(idea_img)
-    
-    if st.session_state['img_gen_url']:
-        st.image(st.session_state['img_gen_url'], use_container_width=True)
-        if st.button("Borrar Imagen", key="clear_img"):
-            st.session_state['img_gen_url'] = ""
-            st.rerun()
-
-with tab_vision:
-    st.write("### 📸 Generar Post desde Imagen")
-    st.write("Sube una foto de tu producto o local para que la IA cree un post automático.")
-    
-    foto = st.file_uploader("Sube una foto", type=["png", "jpg", "jpeg"], key="uploader_vision")
-    
-    if foto:
-        st.image(foto, caption="Imagen cargada para análisis", width=300)
-        if st.button("🤖 Analizar y Crear Post"):
-            with st.spinner("Analizando visuales y redactando post..."):
-                # Se utiliza un prompt especializado para "ver" a través del contexto
-                contexto_vision = "Un producto o servicio basado en la imagen adjunta"
-                st.session_state['txt_gen'] = ia_tool.generate_text(f"Análisis visual de: {contexto_vision}")
-                st.success("¡Post generado con éxito!")
-                st.write(st.session_state['txt_gen'])
\ No newline at end of file
+def main():
+    """Punto de entrada de la página (lo llama portal.py)."""
+    st.title("🤖 Aupa - Gestión IA")
+
+    ia_tool = HerramientasIA()
+
+    # Inicialización de estados de sesión para mantener los datos al navegar en el portal
+    if 'txt_gen' not in st.session_state: st.session_state['txt_gen'] = ""
+    if 'img_gen_url' not in st.session_state: st.session_state['img_gen_url'] = ""
+
+    # Creación de pestañas incluyendo la nueva función de Visión
+    tab_txt, tab_img, tab_vision = st.tabs(["✍️ Redactar Copy", "🎨 Diseñar Imagen", "🔍 Imagen a Texto"])
+
+    with tab_txt:
+        idea_txt = st.text_area("¿Sobre qué quieres escribir hoy?", placeholder="Ej: Promoción de verano para una cafetería...")
+        if st.button("✨ Generar Texto"):
+            with st.spinner("La IA está redactando..."):
+                st.session_state['txt_gen'] = ia_tool.generate_text(idea_txt)
+
+        if st.session_state['txt_gen']:
+            st.info(st.session_state['txt_gen'])
+            if st.button("Limpiar Texto", key="clear_text"):
+                st.session_state['txt_gen'] = ""
+                st.rerun()
+
+    with tab_img:
+        idea_img = st.text_input("Describe la imagen que necesitas:", placeholder="Ej: Un café humeante al atardecer...")
+        if st.button("🎨 Crear Arte"):
+            with st.spinner("Diseñando imagen..."):
+                st.session_state['img_gen_url'] = ia_tool.generate_image(idea_img)
+
+        if st.session_state['img_gen_url']:
+            st.image(st.session_state['img_gen_url'], use_container_width=True)
+            if st.button("Borrar Imagen", key="clear_img"):
+                st.session_state['img_gen_url'] = ""
+                st.rerun()
+
+    with tab_vision:
+        st.write("### 📸 Generar Post desde Imagen")
+        st.write("Sube una foto de tu producto o local para que la IA cree un post automático.")
+
+        foto = st.file_uploader("Sube una foto", type=["png", "jpg", "jpeg"], key="uploader_vision")
+
+        if foto:
+            st.image(foto, caption="Imagen cargada para análisis", width=300)
+            if st.button("🤖 Analizar y Crear Post"):
+                with st.spinner("Analizando visuales y redactando post..."):
+                    # Se utiliza un prompt especializado para "ver" a través del contexto
+                    contexto_vision = "Un producto o servicio basado en la imagen adjunta"
+                    st.session_state['txt_gen'] = ia_tool.generate_text(f"Análisis visual de: {contexto_vision}")
+                    st.success("¡Post generado con éxito!")
+                    st.write(st.session_state['txt_gen'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Cliente mínimo para la Graph API de Meta.
+Centraliza la URL base y el tratamiento de errores de las llamadas HTTP.
+"""
+
+import os
+import threading
+import time
+import requests
+import config  # carga el .env una sola vez por proceso
+from metrics import GRAPH_CIRCUIT_OPEN, GRAPH_ERRORS, GRAPH_REQUEST_SECONDS, endpoint_label
+from structured_logger import get_logger
+
+logger = get_logger("graph_api")
+
+# Se puede apuntar a otro servidor (p. ej. un doble local para pruebas)
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v18.0").rstrip("/")
+# Las subidas de video van a un host dedicado
+GRAPH_VIDEO_URL = os.getenv(
+    "GRAPH_VIDEO_URL", GRAPH_API_URL.replace("://graph.", "://graph-video.")
+).rstrip("/")
+
+
+# Códigos de error de la Graph API por límite de peticiones y fallos temporales
+RATE_LIMIT_GRAPH_CODES = (4, 17, 32, 613)
+TRANSIENT_GRAPH_CODES = (1, 2)
+# Errores que merece la pena reintentar más tarde
+RETRYABLE_ERROR_CODES = ("TIMEOUT", "REQUEST_ERROR", "RATE_LIMITED", "SERVER_ERROR")
+
+# Circuit breaker por app y endpoint: tras CIRCUIT_FAILURE_THRESHOLD fallos
+# seguidos de conexión o 5xx se deja de llamar durante CIRCUIT_OPEN_SECONDS y
+# después se deja pasar una llamada de prueba (semiabierto)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("GRAPH_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("GRAPH_CIRCUIT_OPEN_SECONDS", "60"))
+CIRCUIT_BREAKER_CODES = ("TIMEOUT", "REQUEST_ERROR", "SERVER_ERROR")
+# Error de una llamada que no se llegó a hacer: no es culpa del post
+CIRCUIT_OPEN = "CIRCUIT_OPEN"
+
+
+class GraphAPIError(Exception):
+    """Error devuelto por la Graph API o por la conexión con ella."""
+
+    def __init__(self, message, code="UNKNOWN_ERROR", status_code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """
+    Estado del circuito de un endpoint: cerrado, abierto o semiabierto.
+
+    Cerrado deja pasar todo y cuenta los fallos seguidos. Abierto rechaza las
+    llamadas hasta que pasa CIRCUIT_OPEN_SECONDS; entonces se deja pasar una
+    sola llamada de prueba, que lo cierra si va bien o lo vuelve a abrir.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        """Indica si se puede llamar; en semiabierto solo a la llamada de prueba."""
+        with self.lock:
+            state = self.state
+            if state == "half_open":
+                self.probing = True
+                return True
+            return state == "closed"
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info("Circuito cerrado", extra={"endpoint": self.name})
+                GRAPH_CIRCUIT_OPEN.set(0, endpoint=self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.warning("Circuito abierto", extra={
+                        "endpoint": self.name, "failures": self.failures, "open_seconds": self.open_seconds
+                    })
+                GRAPH_CIRCUIT_OPEN.set(1, endpoint=self.name)
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+# Un circuito por (app, endpoint), compartido por todos los hilos del proceso
+_circuits = {}
+_circuits_lock = threading.Lock()
+
+
+def get_circuit(endpoint):
+    """Devuelve el circuito del endpoint para la app configurada."""
+    key = (os.getenv("FACEBOOK_CLIENT_ID", ""), endpoint)
+    with _circuits_lock:
+        if key not in _circuits:
+            _circuits[key] = CircuitBreaker(endpoint)
+        return _circuits[key]
+
+
+def graph_url(path):
+    """Construye la URL completa de un endpoint de la Graph API."""
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return f"{GRAPH_API_URL}/{path.lstrip('/')}"
+
+
+def graph_request(method, path, timeout=15, **kwargs):
+    """
+    Realiza una llamada a la Graph API.
+
+    Args:
+        method: Método HTTP ('GET', 'POST', ...)
+        path: Ruta relativa (ej. '{page_id}/photos') o URL completa
+        timeout: Timeout en segundos
+        **kwargs: Parámetros adicionales para requests (params, data, headers...)
+
+    Returns:
+        Diccionario con el JSON de la respuesta
+
+    Raises:
+        GraphAPIError: Si la API responde con error o falla la conexión, o con
+            código CIRCUIT_OPEN si el circuito del endpoint está abierto
+    """
+    endpoint = endpoint_label(path)
+    circuit = get_circuit(endpoint)
+    if not circuit.allow():
+        GRAPH_ERRORS.inc(endpoint=endpoint, error_code=CIRCUIT_OPEN)
+        raise GraphAPIError(f"Circuito abierto para {endpoint}: la Graph API no responde", CIRCUIT_OPEN)
+
+    try:
+        data = _send(method, path, endpoint, timeout, **kwargs)
+    except GraphAPIError as e:
+        if e.code in CIRCUIT_BREAKER_CODES:
+            circuit.record_failure()
+        else:
+            # La API respondió (4xx, límite de peticiones...): el endpoint funciona
+            circuit.record_success()
+        raise
+    except Exception:
+        # Cualquier otro error cuenta como fallo: si era la llamada de prueba,
+        # el circuito no se queda esperando un resultado que no llegará
+        circuit.record_failure()
+        raise
+    circuit.record_success()
+    return data
+
+
+def _send(method, path, endpoint, timeout, **kwargs):
+    """Llamada HTTP y traducción de errores de graph_request."""
+    start = time.perf_counter()
+    try:
+        response = requests.request(method, graph_url(path), timeout=timeout, **kwargs)
+    except requests.exceptions.Timeout:
+        _observe(endpoint, start, "TIMEOUT")
+        raise GraphAPIError("Timeout en conexión con Facebook", "TIMEOUT")
+    except requests.exceptions.RequestException as e:
+        _observe(endpoint, start, "REQUEST_ERROR")
+        raise GraphAPIError(str(e), "REQUEST_ERROR")
+
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+
+    if response.status_code != 200:
+        error = data.get("error", {}) if isinstance(data, dict) else {}
+        graph_code = error.get("code")
+        _observe(endpoint, start, str(graph_code or response.status_code))
+        if response.status_code == 429 or graph_code in RATE_LIMIT_GRAPH_CODES:
+            code = "RATE_LIMITED"
+        elif response.status_code >= 500 or graph_code in TRANSIENT_GRAPH_CODES:
+            code = "SERVER_ERROR"
+        else:
+            code = error.get("type", "UNKNOWN")
+        raise GraphAPIError(error.get("message", "Unknown error"), code, response.status_code)
+
+    _observe(endpoint, start)
+    return data
+
+
+def _observe(endpoint, start, error_code=None):
+    """Registra la latencia (y el error, si lo hay) de una llamada."""
+    GRAPH_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    if error_code:
+        GRAPH_ERRORS.inc(endpoint=endpoint, error_code=error_code)
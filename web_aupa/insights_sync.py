@@ -0,0 +1,387 @@
+"""
+Sincronización incremental de métricas (reacciones, comentarios, alcance e
+impresiones) de los posts publicados.
+
+Cada post enviado se inscribe en post_insights_sync y se consulta con una
+frecuencia que decae con su edad (cada 30 min las primeras horas, una vez al
+día al final) hasta INSIGHTS_MAX_AGE_DAYS. Las consultas agrupan hasta 50
+posts del mismo token en una búsqueda por ids con expansión de campos, y hasta
+50 búsquedas en una sola petición batch de la Graph API, así que cada llamada
+cubre cientos de posts. Las lecturas se guardan en post_insights, una fila por
+post y hora solo cuando cambian.
+
+Ejecutar periódicamente (cron) o en bucle:
+    python insights_sync.py
+    python insights_sync.py --loop 300
+"""
+
+import argparse
+import json
+import os
+import signal
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from config import get_db_connection
+from graph_api import CIRCUIT_OPEN, RATE_LIMIT_GRAPH_CODES, RETRYABLE_ERROR_CODES, GraphAPIError, graph_request
+from metrics import INSIGHTS_SYNCED
+from structured_logger import get_logger
+
+logger = get_logger("insights_sync")
+
+MAX_AGE_DAYS = int(os.getenv("INSIGHTS_MAX_AGE_DAYS", "28"))
+# Posts por lote reclamado
+BATCH_SIZE = int(os.getenv("INSIGHTS_BATCH_SIZE", "500"))
+# Fallos seguidos tras los que se deja de sincronizar un post (p. ej. borrado)
+MAX_FAILURES = int(os.getenv("INSIGHTS_MAX_FAILURES", "5"))
+POLL_INTERVAL = float(os.getenv("INSIGHTS_POLL_INTERVAL", "300"))
+
+# Se activa con SIGTERM/SIGINT en modo --loop: se termina el lote en curso y se sale
+stop_event = threading.Event()
+
+# (edad máxima del post en horas, minutos hasta la siguiente sincronización);
+# a partir de la última edad, una vez al día hasta MAX_AGE_DAYS
+SYNC_SCHEDULE = ((6, 30), (24, 120), (72, 360), (168, 720))
+DAILY_INTERVAL_MINUTES = 1440
+# Un lote reclamado no se vuelve a reclamar durante este tiempo
+LEASE_MINUTES = 10
+# Posts que no se llegaron a consultar (sin cuota, circuito abierto o error
+# transitorio): se reintentan pasado este tiempo sin contar como fallo
+SKIPPED_RETRY_MINUTES = int(os.getenv("INSIGHTS_SKIPPED_RETRY_MINUTES", "15"))
+
+IDS_PER_LOOKUP = 50
+LOOKUPS_PER_BATCH = 50
+
+# Campos por plataforma con expansión de campos: una sola lectura por post
+INSIGHT_FIELDS = {
+    "Facebook": (
+        "reactions.summary(total_count).limit(0),comments.summary(total_count).limit(0),"
+        "shares,insights.metric(post_impressions,post_impressions_unique)"
+    ),
+    "Instagram": "like_count,comments_count,insights.metric(impressions,reach)",
+}
+METRICS = ("reactions", "comments", "shares", "reach", "impressions")
+
+InsightsPost = namedtuple("InsightsPost", [
+    "post_id", "platform_post_id", "published_at", "platform", "access_token", "failures", "last"
+])
+
+
+def next_sync_interval(published_at, now=None):
+    """Minutos hasta la siguiente sincronización, o None si el post ya es demasiado antiguo."""
+    age_hours = ((now or datetime.now()) - published_at).total_seconds() / 3600
+    if age_hours >= MAX_AGE_DAYS * 24:
+        return None
+    for max_age_hours, minutes in SYNC_SCHEDULE:
+        if age_hours < max_age_hours:
+            return minutes
+    return DAILY_INTERVAL_MINUTES
+
+
+def enroll_published_posts(cur):
+    """
+    Inscribe los posts enviados recientemente que aún no se siguen.
+
+    Returns:
+        Número de posts inscritos
+    """
+    cur.execute("""
+        INSERT INTO post_insights_sync (post_id, account_id, platform_post_id, published_at, next_sync_at)
+        SELECT q.id, q.account_id, q.platform_post_id, COALESCE(q.sent_at, q.scheduled_at),
+               COALESCE(q.sent_at, q.scheduled_at) + %s * INTERVAL '1 minute'
+        FROM posts_queue q
+        JOIN social_accounts a ON a.id = q.account_id
+        WHERE q.status = 'sent'
+          AND q.platform_post_id IS NOT NULL
+          AND q.scheduled_at >= NOW() - %s * INTERVAL '1 day'
+          AND a.platform = ANY(%s)
+        ON CONFLICT (post_id) DO NOTHING
+    """, (SYNC_SCHEDULE[0][1], MAX_AGE_DAYS, list(INSIGHT_FIELDS)))
+    return cur.rowcount
+
+
+def claim_due_posts(cur, limit=BATCH_SIZE):
+    """Reclama los posts cuya sincronización toca, aplazándolos LEASE_MINUTES mientras se procesan."""
+    cur.execute("""
+        UPDATE post_insights_sync s
+        SET next_sync_at = NOW() + %s * INTERVAL '1 minute'
+        FROM social_accounts a
+        WHERE a.id = s.account_id
+          AND s.post_id IN (
+              SELECT post_id FROM post_insights_sync
+              WHERE next_sync_at <= NOW()
+              ORDER BY next_sync_at
+              LIMIT %s
+              FOR UPDATE SKIP LOCKED
+          )
+        RETURNING s.post_id, s.platform_post_id, s.published_at, a.platform, a.access_token, s.failures,
+                  s.reactions, s.comments, s.shares, s.reach, s.impressions
+    """, (LEASE_MINUTES, limit))
+    return [InsightsPost(*row[:6], last=tuple(row[6:])) for row in cur.fetchall()]
+
+
+def parse_insights(platform, data):
+    """Extrae las métricas de la respuesta de un post."""
+    insights = {
+        metric.get("name"): (metric.get("values") or [{}])[0].get("value")
+        for metric in data.get("insights", {}).get("data", [])
+    }
+    if platform == "Instagram":
+        return {
+            "reactions": data.get("like_count"),
+            "comments": data.get("comments_count"),
+            "shares": None,
+            "reach": insights.get("reach"),
+            "impressions": insights.get("impressions"),
+        }
+    return {
+        "reactions": data.get("reactions", {}).get("summary", {}).get("total_count"),
+        "comments": data.get("comments", {}).get("summary", {}).get("total_count"),
+        "shares": data.get("shares", {}).get("count", 0),
+        "reach": insights.get("post_impressions_unique"),
+        "impressions": insights.get("post_impressions"),
+    }
+
+
+def build_lookups(posts):
+    """Agrupa los posts por plataforma y token en búsquedas de hasta IDS_PER_LOOKUP ids."""
+    groups = {}
+    for post in posts:
+        groups.setdefault((post.platform, post.access_token), []).append(post)
+
+    lookups = []
+    for (platform, access_token), group in groups.items():
+        for i in range(0, len(group), IDS_PER_LOOKUP):
+            lookups.append((platform, access_token, group[i:i + IDS_PER_LOOKUP]))
+    return lookups
+
+
+def fetch_insights(posts):
+    """
+    Lee las métricas de los posts con peticiones batch.
+
+    Solo cuentan como fallidos los posts cuya consulta devolvió un error. Los
+    que no se llegaron a consultar (sin cuota, circuito abierto, error
+    transitorio de la petición) se devuelven aparte; sin cuota o sin servicio
+    no se sigue consultando en este ciclo.
+
+    Returns:
+        (resultados {post_id: métricas}, post_ids que fallaron, post_ids no consultados)
+    """
+    results = {}
+    failed = set()
+    skipped = set()
+    lookups = build_lookups(posts)
+
+    for i in range(0, len(lookups), LOOKUPS_PER_BATCH):
+        chunk = lookups[i:i + LOOKUPS_PER_BATCH]
+        batch = [{
+            "method": "GET",
+            # Cada búsqueda lleva su propio token (las cuentas pueden ser distintas)
+            "relative_url": "?ids={}&fields={}&access_token={}".format(
+                ",".join(post.platform_post_id for post in group), INSIGHT_FIELDS[platform], access_token
+            ),
+        } for platform, access_token, group in chunk]
+
+        try:
+            responses = graph_request("POST", "", timeout=30, data={
+                "access_token": chunk[0][1],
+                "batch": json.dumps(batch),
+                "include_headers": "false",
+            })
+        except GraphAPIError as e:
+            logger.warning("Error en la petición batch de métricas", extra={
+                "error": e.message, "error_code": e.code, "lookups": len(chunk)
+            })
+            if e.code not in RETRYABLE_ERROR_CODES and e.code != CIRCUIT_OPEN:
+                failed.update(post.post_id for _, _, group in chunk for post in group)
+                continue
+            skipped.update(post.post_id for _, _, group in chunk for post in group)
+            if e.code in ("RATE_LIMITED", CIRCUIT_OPEN):
+                # Sin cuota o sin servicio no tiene sentido seguir en este ciclo
+                for _, _, group in lookups[i + LOOKUPS_PER_BATCH:]:
+                    skipped.update(post.post_id for post in group)
+                break
+            continue
+
+        throttled = False
+        for (platform, _, group), response in zip(chunk, responses):
+            # Una respuesta nula indica que Facebook no llegó a ejecutar la subpetición
+            if not response:
+                skipped.update(post.post_id for post in group)
+                continue
+            if response.get("code") != 200:
+                error = (json.loads(response["body"]) if response.get("body") else {}).get("error", {})
+                logger.warning("Error consultando métricas", extra={
+                    "platform": platform, "posts": len(group), "error": error.get("message")
+                })
+                if response.get("code") == 429 or error.get("code") in RATE_LIMIT_GRAPH_CODES:
+                    throttled = True
+                    skipped.update(post.post_id for post in group)
+                else:
+                    failed.update(post.post_id for post in group)
+                continue
+            body = json.loads(response["body"])
+            for post in group:
+                data = body.get(post.platform_post_id)
+                if data is None:
+                    failed.add(post.post_id)
+                else:
+                    results[post.post_id] = parse_insights(platform, data)
+
+        if throttled:
+            for _, _, group in lookups[i + LOOKUPS_PER_BATCH:]:
+                skipped.update(post.post_id for post in group)
+            break
+    return results, failed, skipped
+
+
+def save_insights(cur, posts, results, failed, skipped=()):
+    """
+    Guarda las lecturas: serie temporal (solo si cambian) y estado de sincronización.
+
+    Los fallidos suman un fallo (tras MAX_FAILURES se dejan de sincronizar);
+    los no consultados se aplazan SKIPPED_RETRY_MINUTES sin sumar fallo.
+
+    Returns:
+        Número de filas escritas en post_insights
+    """
+    now = datetime.now()
+    by_id = {post.post_id: post for post in posts}
+
+    samples = []
+    synced = []
+    for post_id, values in results.items():
+        post = by_id[post_id]
+        row = tuple(values[metric] for metric in METRICS)
+        if row != post.last:
+            samples.append((post_id,) + row)
+        interval = next_sync_interval(post.published_at, now)
+        next_sync_at = now + timedelta(minutes=interval) if interval else None
+        synced.append((post_id, next_sync_at) + row)
+
+    if samples:
+        execute_values(cur, """
+            INSERT INTO post_insights (post_id, captured_at, reactions, comments, shares, reach, impressions)
+            SELECT v.post_id, date_trunc('hour', LOCALTIMESTAMP), v.reactions, v.comments, v.shares, v.reach, v.impressions
+            FROM (VALUES %s) AS v (post_id, reactions, comments, shares, reach, impressions)
+            ON CONFLICT (post_id, captured_at) DO UPDATE
+            SET reactions = EXCLUDED.reactions, comments = EXCLUDED.comments, shares = EXCLUDED.shares,
+                reach = EXCLUDED.reach, impressions = EXCLUDED.impressions
+        """, samples, template="(%s, %s::INTEGER, %s::INTEGER, %s::INTEGER, %s::INTEGER, %s::INTEGER)")
+
+    if synced:
+        execute_values(cur, """
+            UPDATE post_insights_sync s
+            SET next_sync_at = v.next_sync_at, last_synced_at = NOW(), failures = 0,
+                reactions = v.reactions, comments = v.comments, shares = v.shares,
+                reach = v.reach, impressions = v.impressions
+            FROM (VALUES %s) AS v (post_id, next_sync_at, reactions, comments, shares, reach, impressions)
+            WHERE s.post_id = v.post_id
+        """, synced, template="(%s, %s::TIMESTAMP, %s::INTEGER, %s::INTEGER, %s::INTEGER, %s::INTEGER, %s::INTEGER)")
+
+    retries = []
+    for post_id in failed - set(results):
+        post = by_id[post_id]
+        interval = next_sync_interval(post.published_at, now)
+        give_up = interval is None or post.failures + 1 >= MAX_FAILURES
+        retries.append((post_id, None if give_up else now + timedelta(minutes=interval)))
+    if retries:
+        execute_values(cur, """
+            UPDATE post_insights_sync s
+            SET next_sync_at = v.next_sync_at, failures = s.failures + 1
+            FROM (VALUES %s) AS v (post_id, next_sync_at)
+            WHERE s.post_id = v.post_id
+        """, retries, template="(%s, %s::TIMESTAMP)")
+
+    postponed = list(set(skipped) - set(results) - set(failed))
+    if postponed:
+        cur.execute("""
+            UPDATE post_insights_sync
+            SET next_sync_at = NOW() + %s * INTERVAL '1 minute'
+            WHERE post_id = ANY(%s)
+        """, (SKIPPED_RETRY_MINUTES, postponed))
+
+    return len(samples)
+
+
+def sync_insights(conn, batch_size=BATCH_SIZE, max_batches=None):
+    """
+    Inscribe los posts nuevos y sincroniza todos los que tocan.
+
+    Hace commit tras reclamar y tras guardar cada lote, de modo que no hay
+    transacciones abiertas durante las llamadas a la Graph API.
+
+    Returns:
+        Counter con enrolled, synced, failed, skipped, samples y batches
+    """
+    summary = Counter()
+    cur = conn.cursor()
+    summary["enrolled"] = enroll_published_posts(cur)
+    conn.commit()
+
+    while (max_batches is None or summary["batches"] < max_batches) and not stop_event.is_set():
+        posts = claim_due_posts(cur, batch_size)
+        conn.commit()
+        if not posts:
+            break
+
+        results, failed, skipped = fetch_insights(posts)
+        summary["samples"] += save_insights(cur, posts, results, failed, skipped)
+        conn.commit()
+
+        summary["batches"] += 1
+        summary["synced"] += len(results)
+        summary["failed"] += len(failed - set(results))
+        summary["skipped"] += len(skipped - set(results) - failed)
+        for post in posts:
+            result = "ok" if post.post_id in results else "failed" if post.post_id in failed else "skipped"
+            INSIGHTS_SYNCED.inc(platform=post.platform, result=result)
+        if skipped or len(posts) < batch_size:
+            # Con posts sin consultar (sin cuota o sin servicio) se espera al siguiente ciclo
+            break
+    cur.close()
+
+    if summary["synced"] or summary["failed"] or summary["skipped"] or summary["enrolled"]:
+        logger.info("Métricas sincronizadas", extra=dict(summary))
+    return summary
+
+
+def handle_stop_signal(signum, frame):
+    logger.info("Señal recibida, deteniendo la sincronización", extra={"signal": signal.Signals(signum).name})
+    stop_event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincronización de métricas de posts publicados")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--loop", type=float, nargs="?", const=POLL_INTERVAL, default=None,
+                        help="Repetir cada N segundos (por defecto INSIGHTS_POLL_INTERVAL)")
+    args = parser.parse_args()
+
+    if args.loop is None:
+        conn = get_db_connection()
+        try:
+            summary = sync_insights(conn, args.batch_size, args.max_batches)
+        finally:
+            conn.close()
+        print(", ".join(f"{key}={value}" for key, value in sorted(summary.items())) or "Nada que sincronizar")
+    else:
+        signal.signal(signal.SIGTERM, handle_stop_signal)
+        signal.signal(signal.SIGINT, handle_stop_signal)
+        logger.info("Sincronización de métricas activa", extra={"interval": args.loop})
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                sync_insights(conn, args.batch_size, args.max_batches)
+            except Exception as e:
+                # Un corte de la BD o de red no detiene el proceso: se reintenta en el siguiente ciclo
+                logger.exception(f"Error sincronizando métricas: {type(e).__name__}: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            stop_event.wait(args.loop)
+        logger.info("Sincronización de métricas detenida")
@@ -0,0 +1,240 @@
+"""
+Exportación de los logs de auditoría a CSV o Parquet.
+Las filas se leen con un cursor con nombre (server-side) en bloques de tamaño
+fijo y se escriben a medida que llegan, así que exportar un año de logs usa
+memoria constante. Los filtros de fecha van sobre la clave de partición, de
+modo que solo se recorren los meses pedidos.
+
+Uso:
+    python log_export.py post_publish_logs --desde 2025-01-01 --hasta 2026-01-01 -o publicaciones.csv
+    python log_export.py token_exchange_logs --platform Facebook --format parquet -o tokens.parquet
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import uuid
+from datetime import datetime
+from config import get_db_connection
+from structured_logger import get_logger
+
+logger = get_logger("log_export")
+
+CHUNK_SIZE = int(os.getenv("LOG_EXPORT_CHUNK_SIZE", "5000"))
+FORMATS = ("csv", "parquet")
+
+# Por tabla: consulta base, columna de partición (filtro de fechas) y filtro
+# por email. No se exportan tokens ni códigos de autorización.
+EXPORTS = {
+    "token_exchange_logs": {
+        "select": """
+            SELECT l.id, l.exchange_timestamp, l.user_email, l.platform, l.token_status,
+                   l.error_code, l.error_message, l.facebook_user_id,
+                   l.token_obtained_at, l.token_expires_at, l.ip_address
+            FROM token_exchange_logs l
+        """,
+        "timestamp": "l.exchange_timestamp",
+        "email": "l.user_email = %s",
+    },
+    "post_publish_logs": {
+        "select": """
+            SELECT l.id, l.logged_at, a.user_email, l.platform, l.post_id, l.account_id,
+                   l.facebook_post_id, l.publish_status, l.platform_response_code,
+                   l.error_details, l.retry_count, l.published_at
+            FROM post_publish_logs l
+            LEFT JOIN social_accounts a ON a.id = l.account_id
+        """,
+        "timestamp": "l.logged_at",
+        "email": "a.user_email = %s",
+    },
+}
+
+
+def build_query(table, start=None, end=None, platform=None, email=None):
+    """Consulta de exportación con los filtros indicados (fechas: [start, end))."""
+    spec = EXPORTS[table]
+    conditions = []
+    params = []
+    if start:
+        conditions.append(f"{spec['timestamp']} >= %s")
+        params.append(start)
+    if end:
+        conditions.append(f"{spec['timestamp']} < %s")
+        params.append(end)
+    if platform:
+        conditions.append("l.platform = %s")
+        params.append(platform)
+    if email:
+        conditions.append(spec["email"])
+        params.append(email)
+
+    query = spec["select"]
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {spec['timestamp']}, l.id"
+    return query, params
+
+
+def iter_log_chunks(conn, table, start=None, end=None, platform=None, email=None, chunk_size=CHUNK_SIZE):
+    """
+    Genera (cursor.description, filas) por bloques desde un cursor con nombre.
+
+    El cursor vive en su propia transacción, que se cierra (rollback) al
+    agotar el generador. El primer bloque se emite aunque esté vacío, para
+    que la exportación lleve siempre las columnas.
+    """
+    query, params = build_query(table, start, end, platform, email)
+    cur = conn.cursor(name=f"log_export_{uuid.uuid4().hex[:8]}")
+    cur.itersize = chunk_size
+    try:
+        cur.execute(query, params)
+        rows = cur.fetchmany(chunk_size)
+        yield cur.description, rows
+        while rows:
+            rows = cur.fetchmany(chunk_size)
+            if rows:
+                yield cur.description, rows
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+def write_csv(chunks, fileobj):
+    """Escribe los bloques como CSV en un fichero de texto. Devuelve el número de filas."""
+    writer = csv.writer(fileobj)
+    total = 0
+    header_written = False
+    for description, rows in chunks:
+        if not header_written:
+            writer.writerow([col.name for col in description])
+            header_written = True
+        writer.writerows(rows)
+        total += len(rows)
+    return total
+
+
+def write_parquet(chunks, fileobj):
+    """
+    Escribe los bloques como Parquet (un row group por bloque).
+
+    El esquema sale de los tipos de columna de PostgreSQL, no de los datos,
+    para que un bloque con una columna todo NULL no lo cambie. Requiere
+    pyarrow, que es opcional. Devuelve el número de filas.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación a Parquet necesita pyarrow (pip install pyarrow)")
+
+    # OID de PostgreSQL -> tipo de Arrow (el resto se exporta como texto)
+    arrow_types = {
+        16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(), 1114: pa.timestamp("us"),
+    }
+
+    writer = None
+    total = 0
+    try:
+        for description, rows in chunks:
+            if writer is None:
+                schema = pa.schema([
+                    (col.name, arrow_types.get(col.type_code, pa.string())) for col in description
+                ])
+                writer = pq.ParquetWriter(fileobj, schema)
+            columns = {
+                field.name: pa.array(
+                    [row[i] if field.type != pa.string() or row[i] is None else str(row[i]) for row in rows],
+                    type=field.type
+                )
+                for i, field in enumerate(schema)
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            total += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def export_logs(conn, table, fileobj, fmt="csv", start=None, end=None, platform=None, email=None,
+                chunk_size=CHUNK_SIZE):
+    """
+    Exporta una tabla de logs a fileobj (texto para CSV, binario para Parquet).
+
+    Returns:
+        Número de filas exportadas
+    """
+    if table not in EXPORTS:
+        raise ValueError(f"Tabla no exportable: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+    chunks = iter_log_chunks(conn, table, start, end, platform, email, chunk_size)
+    rows = write_parquet(chunks, fileobj) if fmt == "parquet" else write_csv(chunks, fileobj)
+    logger.info("Logs exportados", extra={
+        "table": table, "format": fmt, "rows": rows, "platform": platform,
+        "start": start.isoformat() if start else None, "end": end.isoformat() if end else None
+    })
+    return rows
+
+
+def export_to_buffer(table, fmt="csv", start=None, end=None, platform=None, email=None):
+    """
+    Exporta a un fichero temporal y lo devuelve posicionado al inicio (para
+    st.download_button). Se vuelca a disco a partir de unos MB, así que la
+    lectura de la BD sigue siendo por bloques.
+    """
+    import tempfile
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    conn = get_db_connection()
+    try:
+        if fmt == "csv":
+            text = io.TextIOWrapper(buffer, encoding="utf-8", newline="", write_through=True)
+            export_logs(conn, table, text, fmt, start, end, platform, email)
+            text.detach()
+        else:
+            export_logs(conn, table, buffer, fmt, start, end, platform, email)
+    finally:
+        conn.close()
+    buffer.seek(0)
+    return buffer
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportación de logs de auditoría")
+    parser.add_argument("table", choices=list(EXPORTS))
+    parser.add_argument("--desde", type=_parse_date, help="Fecha inicial incluida (YYYY-MM-DD[THH:MM])")
+    parser.add_argument("--hasta", type=_parse_date, help="Fecha final excluida (YYYY-MM-DD[THH:MM])")
+    parser.add_argument("--platform")
+    parser.add_argument("--email")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="Por defecto se deduce de la extensión de --output (csv si no hay)")
+    parser.add_argument("-o", "--output", help="Fichero de salida (por defecto, CSV por stdout)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.output and args.output.endswith(".parquet") else "csv")
+    if fmt == "parquet" and not args.output:
+        parser.error("Parquet necesita --output")
+
+    conn = get_db_connection()
+    try:
+        if not args.output:
+            rows = export_logs(conn, args.table, sys.stdout, fmt, args.desde, args.hasta,
+                               args.platform, args.email, args.chunk_size)
+        else:
+            mode, kwargs = ("wb", {}) if fmt == "parquet" else ("w", {"encoding": "utf-8", "newline": ""})
+            with open(args.output, mode, **kwargs) as output:
+                rows = export_logs(conn, args.table, output, fmt, args.desde, args.hasta,
+                                   args.platform, args.email, args.chunk_size)
+    finally:
+        conn.close()
+    print(f"{rows} filas exportadas", file=sys.stderr)
@@ -0,0 +1,74 @@
+"""
+Mantenimiento de las particiones mensuales de los logs de auditoría.
+Crea por adelantado las particiones de los próximos meses y retira las que
+superan la retención (DROP, o DETACH si se archivan), de modo que borrar datos
+antiguos no genera DELETE masivos ni vacuum.
+
+Ejecutar periódicamente (cron) o dejar que lo haga el worker:
+    python log_partitions.py
+    python log_partitions.py --retention-months 6 --archive
+"""
+
+import argparse
+import os
+from config import get_db_connection
+from structured_logger import get_logger
+
+logger = get_logger("log_partitions")
+
+PARTITIONED_LOG_TABLES = ("token_exchange_logs", "post_publish_logs")
+PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", "12"))
+# true: las particiones caducadas se desvinculan y se conservan para archivarlas
+RETENTION_ARCHIVE = os.getenv("LOG_RETENTION_ARCHIVE", "false").lower() in ("1", "true", "yes")
+
+
+def maintain_log_partitions(cur, months_ahead=PARTITIONS_AHEAD,
+                            retention_months=RETENTION_MONTHS, archive=RETENTION_ARCHIVE):
+    """
+    Crea las particiones futuras y retira las caducadas de cada tabla de logs.
+
+    Args:
+        cur: Cursor de una transacción abierta (el llamador hace commit)
+        months_ahead: Meses posteriores al actual que deben existir ya
+        retention_months: Meses completos que se conservan (0 o menos desactiva la retención)
+        archive: Si es True se hace DETACH en lugar de DROP
+
+    Returns:
+        Diccionario {tabla: {"created": n, "removed": [particiones]}}
+    """
+    summary = {}
+    for table in PARTITIONED_LOG_TABLES:
+        cur.execute("SELECT create_monthly_partitions(%s, %s)", (table, months_ahead))
+        created = cur.fetchone()[0]
+
+        removed = []
+        if retention_months > 0:
+            cur.execute("SELECT drop_expired_partitions(%s, %s, %s)", (table, retention_months, archive))
+            removed = [row[0] for row in cur.fetchall()]
+
+        summary[table] = {"created": created, "removed": removed}
+        if created or removed:
+            logger.info("Particiones de logs actualizadas", extra={
+                "table": table, "partitions_created": created, "partitions_removed": removed,
+                "mode": "detach" if archive else "drop"
+            })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de particiones de logs")
+    parser.add_argument("--months-ahead", type=int, default=PARTITIONS_AHEAD)
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    parser.add_argument("--archive", action="store_true", default=RETENTION_ARCHIVE,
+                        help="Desvincular (DETACH) las particiones caducadas en lugar de eliminarlas")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        result = maintain_log_partitions(conn.cursor(), args.months_ahead, args.retention_months, args.archive)
+        conn.commit()
+    finally:
+        conn.close()
+    for table, changes in result.items():
+        print(f"{table}: {changes['created']} creadas, {len(changes['removed'])} retiradas {changes['removed']}")
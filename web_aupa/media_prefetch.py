@@ -0,0 +1,447 @@
+"""
+Descarga y validación anticipada de la media de los posts programados.
+
+Los posts pendientes con media_url cuya hora programada cae dentro de
+MEDIA_PREFETCH_WINDOW_MINUTES se preparan antes de su hora: la media se
+descarga (o se copia, si es local) a MEDIA_CACHE_DIR con su SHA-256 como
+nombre, se comprueba su tipo real por contenido, su tamaño y, en imágenes, sus
+dimensiones según las reglas de cada plataforma, y se guarda en
+posts_queue.media_file. Al publicar, Facebook sube esa copia sin volver a
+leerla ni a calcular su hash.
+
+Si la media no es válida el post pasa a 'failed' en ese momento, con su log y
+su evento para webhooks, en lugar de fallar a la hora de publicarse. Los
+errores transitorios (red, 5xx) se reintentan cada MEDIA_PREFETCH_RETRY_MINUTES;
+si a la hora de publicar no hay copia, el worker usa media_url como siempre.
+
+Los videos solo se validan por tipo y tamaño (las dimensiones requieren
+decodificarlos).
+
+Uso:
+    python media_prefetch.py
+    python media_prefetch.py --loop 60
+"""
+
+import argparse
+import hashlib
+import mimetypes
+import os
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import requests
+from config import get_db_connection
+from media_uploader import CHUNK_SIZE, MEDIA_CACHE_DIR, resolve_local_path
+from metrics import MEDIA_PREFETCHED
+from structured_logger import get_logger
+
+logger = get_logger("media_prefetch")
+
+# Antelación con la que se prepara la media respecto a scheduled_at
+WINDOW_MINUTES = int(os.getenv("MEDIA_PREFETCH_WINDOW_MINUTES", "120"))
+# Espera antes de reintentar tras un error transitorio
+RETRY_MINUTES = int(os.getenv("MEDIA_PREFETCH_RETRY_MINUTES", "5"))
+BATCH_SIZE = int(os.getenv("MEDIA_PREFETCH_BATCH_SIZE", "50"))
+CONCURRENCY = int(os.getenv("MEDIA_PREFETCH_CONCURRENCY", "4"))
+TIMEOUT = float(os.getenv("MEDIA_PREFETCH_TIMEOUT", "30"))
+POLL_INTERVAL = float(os.getenv("MEDIA_PREFETCH_POLL_INTERVAL", "60"))
+# Copias sin posts activos que las usen se borran pasados estos días
+CACHE_RETENTION_DAYS = int(os.getenv("MEDIA_CACHE_RETENTION_DAYS", "7"))
+
+MB = 1024 * 1024
+
+# Límites de la Graph API por plataforma. aspect_ratio es (mín, máx) de ancho/alto.
+MEDIA_RULES = {
+    "Facebook": {
+        "photo_types": ("image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff"),
+        "video_types": ("video/mp4", "video/quicktime"),
+        "max_photo_bytes": 10 * MB,
+        "max_video_bytes": 10 * 1024 * MB,
+        "min_width": 1,
+        "aspect_ratio": None,
+        "remote_only": False,
+    },
+    "Instagram": {
+        "photo_types": ("image/jpeg",),
+        "video_types": ("video/mp4", "video/quicktime"),
+        "max_photo_bytes": 8 * MB,
+        "max_video_bytes": 1024 * MB,
+        "min_width": 320,
+        "aspect_ratio": (4 / 5, 1.91),
+        # Instagram descarga la media desde una URL pública
+        "remote_only": True,
+    },
+}
+
+# Estados de posts_queue en los que la copia todavía puede usarse
+ACTIVE_STATUSES = ("pending", "claimed", "publishing", "retrying")
+
+PrefetchPost = namedtuple("PrefetchPost", ["id", "account_id", "platform", "media_url"])
+
+# Se activa con SIGTERM/SIGINT en modo --loop: se termina el lote en curso y se sale
+stop_event = threading.Event()
+
+
+class MediaValidationError(Exception):
+    """Media que no se podrá publicar: el post falla sin esperar a su hora."""
+
+    def __init__(self, message, code="MEDIA_INVALID"):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+def claim_posts(cur, limit=BATCH_SIZE):
+    """
+    Reclama posts pendientes con media sin preparar dentro de la ventana.
+
+    media_checked_at hace de reserva: no se vuelven a tomar hasta pasados
+    RETRY_MINUTES, así que varios procesos pueden trabajar a la vez.
+    """
+    cur.execute("""
+        UPDATE posts_queue q
+        SET media_checked_at = NOW()
+        FROM social_accounts a
+        WHERE q.account_id = a.id
+          AND q.id IN (
+              SELECT p.id
+              FROM posts_queue p
+              JOIN social_accounts pa ON p.account_id = pa.id
+              WHERE p.status = 'pending'
+                AND p.media_url IS NOT NULL
+                AND p.media_file IS NULL
+                AND p.scheduled_at <= NOW() + %s * INTERVAL '1 minute'
+                AND (p.media_checked_at IS NULL OR p.media_checked_at < NOW() - %s * INTERVAL '1 minute')
+                AND pa.platform = ANY(%s)
+              ORDER BY p.scheduled_at ASC
+              LIMIT %s
+              FOR UPDATE OF p SKIP LOCKED
+          )
+        RETURNING q.id, q.account_id, a.platform, q.media_url
+    """, (WINDOW_MINUTES, RETRY_MINUTES, list(MEDIA_RULES), limit))
+    return [PrefetchPost(*row) for row in cur.fetchall()]
+
+
+def sniff_media_type(head):
+    """Tipo MIME según los primeros bytes del contenido (None si no se reconoce)."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:12] == b"qt  " else "video/mp4"
+    return None
+
+
+def open_source(media_url, platform):
+    """
+    Iterador de bloques del contenido de media_url.
+
+    Raises:
+        MediaValidationError: Si la media no existe o no es accesible
+        requests.RequestException: Error de red transitorio (se reintenta)
+    """
+    if MEDIA_RULES[platform]["remote_only"] and not media_url.startswith(("http://", "https://")):
+        raise MediaValidationError(
+            f"{platform} requiere una URL pública de imagen o video", "MEDIA_REQUIRED"
+        )
+
+    if "://" not in media_url or media_url.startswith("file://"):
+        path = resolve_local_path(media_url)
+        if not path:
+            raise MediaValidationError(f"No se encontró el archivo de media: {media_url}", "MEDIA_NOT_FOUND")
+
+        def read_file():
+            with open(path, "rb") as f:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+        return read_file()
+
+    response = requests.get(media_url, stream=True, timeout=TIMEOUT)
+    if response.status_code in (404, 410):
+        response.close()
+        raise MediaValidationError(f"La media no existe (HTTP {response.status_code})", "MEDIA_NOT_FOUND")
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        response.close()
+        raise MediaValidationError(f"La media no es accesible (HTTP {response.status_code})", "MEDIA_UNAVAILABLE")
+    response.raise_for_status()
+    return response.iter_content(CHUNK_SIZE)
+
+
+@lru_cache(maxsize=None)
+def load_pillow():
+    """Módulo Image de Pillow, o None si no está instalado (se avisa una sola vez)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow no está instalado: no se comprueban las dimensiones de las imágenes")
+        return None
+    return Image
+
+
+def image_dimensions(path):
+    """(ancho, alto) de una imagen, o None si Pillow no está instalado."""
+    Image = load_pillow()
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            size = image.size
+            image.verify()
+        return size
+    except Exception as e:
+        raise MediaValidationError(f"La imagen no se puede leer: {e}", "MEDIA_CORRUPT")
+
+
+def fetch_to_cache(media_url, platform):
+    """
+    Descarga la media a MEDIA_CACHE_DIR validando tipo y tamaño sobre la marcha.
+
+    Returns:
+        (media_file, tipo MIME, ruta)
+    """
+    rules = MEDIA_RULES[platform]
+    chunks = open_source(media_url, platform)
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    media_type = None
+    max_bytes = 0
+    size = 0
+
+    with tempfile.NamedTemporaryFile(dir=MEDIA_CACHE_DIR, prefix=".tmp-", delete=False) as tmp:
+        try:
+            for chunk in chunks:
+                if media_type is None:
+                    media_type = sniff_media_type(chunk[:16])
+                    if media_type in rules["photo_types"]:
+                        max_bytes = rules["max_photo_bytes"]
+                    elif media_type in rules["video_types"]:
+                        max_bytes = rules["max_video_bytes"]
+                    else:
+                        raise MediaValidationError(
+                            f"Tipo de media no admitido en {platform}: {media_type or 'desconocido'}",
+                            "MEDIA_UNSUPPORTED_TYPE"
+                        )
+                size += len(chunk)
+                if size > max_bytes:
+                    raise MediaValidationError(
+                        f"La media supera el máximo de {max_bytes // MB} MB de {platform}", "MEDIA_TOO_LARGE"
+                    )
+                digest.update(chunk)
+                tmp.write(chunk)
+            if not size:
+                raise MediaValidationError("La media está vacía", "MEDIA_EMPTY")
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+
+    extension = mimetypes.guess_extension(media_type) or ""
+    media_file = f"{digest.hexdigest()}{extension}"
+    path = os.path.join(MEDIA_CACHE_DIR, media_file)
+    # Mismo contenido, mismo nombre: si ya estaba, se sustituye por una copia idéntica
+    os.replace(tmp.name, path)
+    return media_file, media_type, path
+
+
+def validate_dimensions(path, platform):
+    """
+    Comprueba ancho mínimo y relación de aspecto de una imagen.
+
+    Returns:
+        False si no se pudieron comprobar (Pillow no instalado), True si no
+    """
+    rules = MEDIA_RULES[platform]
+    dimensions = image_dimensions(path)
+    if dimensions is None:
+        return False
+    width, height = dimensions
+    if width < rules["min_width"] or height < 1:
+        raise MediaValidationError(
+            f"La imagen mide {width}x{height}; {platform} necesita al menos {rules['min_width']} px de ancho",
+            "MEDIA_INVALID_DIMENSIONS"
+        )
+    if rules["aspect_ratio"]:
+        low, high = rules["aspect_ratio"]
+        if not low <= width / height <= high:
+            raise MediaValidationError(
+                f"Relación de aspecto {width}x{height} fuera del rango de {platform} ({low:.2f}-{high:.2f})",
+                "MEDIA_INVALID_DIMENSIONS"
+            )
+    return True
+
+
+def prepare_media(post):
+    """
+    Descarga y valida la media de un post.
+
+    Returns:
+        ('ready', (media_file, dimensiones comprobadas)), ('failed', (código, mensaje))
+        o ('retry', mensaje)
+    """
+    try:
+        media_file, media_type, path = fetch_to_cache(post.media_url, post.platform)
+        checked = True
+        if media_type.startswith("image/"):
+            checked = validate_dimensions(path, post.platform)
+        return "ready", (media_file, checked)
+    except MediaValidationError as e:
+        return "failed", (e.code, e.message)
+    except (requests.exceptions.RequestException, OSError) as e:
+        return "retry", str(e)
+
+
+def mark_ready(cur, post_id, media_file):
+    """Guarda la copia validada si el post sigue pendiente."""
+    cur.execute("""
+        UPDATE posts_queue SET media_file = %s
+        WHERE id = %s AND status = 'pending'
+    """, (media_file, post_id))
+
+
+def mark_failed(cur, post, error_code, error_msg):
+    """Marca el post como fallido con su log y su evento en una sola sentencia."""
+    cur.execute("""
+        WITH failed AS (
+            UPDATE posts_queue SET status = 'failed', error_message = %(error_msg)s
+            WHERE id = %(post_id)s AND status = 'pending'
+            RETURNING id, account_id, retry_count
+        ),
+        logged AS (
+            INSERT INTO post_publish_logs
+            (post_id, account_id, platform, publish_status, platform_response_code, error_details)
+            SELECT id, account_id, %(platform)s, 'failed', %(error_code)s, %(error_msg)s
+            FROM failed
+        )
+        INSERT INTO publish_events_outbox (account_id, post_id, event_type, payload)
+        SELECT account_id, id, 'post.failed', jsonb_build_object(
+            'post_id', id, 'account_id', account_id, 'platform', %(platform)s, 'status', 'failed',
+            'error_code', %(error_code)s, 'error_message', %(error_msg)s, 'retry_count', retry_count
+        )
+        FROM failed
+    """, {"post_id": post.id, "platform": post.platform, "error_code": error_code, "error_msg": error_msg[:1000]})
+
+
+def prune_media_cache(cur, retention_days=CACHE_RETENTION_DAYS):
+    """Borra copias antiguas que ya no usa ningún post activo. Devuelve cuántas."""
+    if not os.path.isdir(MEDIA_CACHE_DIR):
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    old_files = [
+        entry.name for entry in os.scandir(MEDIA_CACHE_DIR)
+        if entry.is_file() and entry.stat().st_mtime < cutoff
+    ]
+    if not old_files:
+        return 0
+    cur.execute("""
+        SELECT DISTINCT media_file FROM posts_queue
+        WHERE media_file = ANY(%s) AND status = ANY(%s)
+    """, (old_files, list(ACTIVE_STATUSES)))
+    in_use = {row[0] for row in cur.fetchall()}
+    removed = 0
+    for name in old_files:
+        if name not in in_use:
+            try:
+                os.unlink(os.path.join(MEDIA_CACHE_DIR, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def prefetch_media(conn, batch_size=BATCH_SIZE, max_batches=None):
+    """
+    Prepara lotes de posts hasta que no queden (o hasta max_batches).
+
+    Returns:
+        Counter con 'ready', 'failed', 'retry', 'batches' y 'dimensions_unchecked'
+        (imágenes aceptadas sin comprobar sus dimensiones por falta de Pillow)
+    """
+    summary = Counter()
+    cur = conn.cursor()
+    with ThreadPoolExecutor(max_workers=max(1, CONCURRENCY)) as pool:
+        while (max_batches is None or summary["batches"] < max_batches) and not stop_event.is_set():
+            posts = claim_posts(cur, batch_size)
+            conn.commit()
+            if not posts:
+                break
+
+            for post, (result, detail) in zip(posts, pool.map(prepare_media, posts)):
+                if result == "ready":
+                    media_file, checked = detail
+                    mark_ready(cur, post.id, media_file)
+                    if not checked:
+                        summary["dimensions_unchecked"] += 1
+                elif result == "failed":
+                    mark_failed(cur, post, *detail)
+                    logger.warning("Media no válida, post marcado como fallido", extra={
+                        "post_id": post.id, "platform": post.platform, "error_code": detail[0], "error": detail[1]
+                    })
+                else:
+                    logger.info("No se pudo descargar la media, se reintentará", extra={
+                        "post_id": post.id, "error": detail
+                    })
+                summary[result] += 1
+                MEDIA_PREFETCHED.inc(platform=post.platform, result=result)
+            conn.commit()
+
+            summary["batches"] += 1
+            if len(posts) < batch_size:
+                break
+
+    summary["pruned"] = prune_media_cache(cur)
+    cur.close()
+
+    if summary["ready"] or summary["failed"] or summary["retry"]:
+        logger.info("Media preparada", extra=dict(summary))
+    return summary
+
+
+def handle_stop_signal(signum, frame):
+    logger.info("Señal recibida, deteniendo la preparación de media", extra={"signal": signal.Signals(signum).name})
+    stop_event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Descarga y validación anticipada de media")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--loop", type=float, nargs="?", const=POLL_INTERVAL, default=None,
+                        help="Repetir cada N segundos (por defecto MEDIA_PREFETCH_POLL_INTERVAL)")
+    args = parser.parse_args()
+
+    if args.loop is None:
+        conn = get_db_connection()
+        try:
+            summary = prefetch_media(conn, args.batch_size, args.max_batches)
+        finally:
+            conn.close()
+        logger.info("Preparación de media terminada", extra=dict(summary))
+    else:
+        signal.signal(signal.SIGTERM, handle_stop_signal)
+        signal.signal(signal.SIGINT, handle_stop_signal)
+        logger.info("Preparación de media activa", extra={"interval": args.loop})
+        while not stop_event.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                prefetch_media(conn, args.batch_size, args.max_batches)
+            except Exception as e:
+                # Un corte de la BD o de red no detiene el proceso: se reintenta en el siguiente ciclo
+                logger.exception(f"Error preparando media: {type(e).__name__}: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            stop_event.wait(args.loop)
+        logger.info("Preparación de media detenida")
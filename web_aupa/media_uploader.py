@@ -0,0 +1,375 @@
+"""
+Subida de media a la Graph API.
+Las fotos se envían en streaming (multipart desde un file handle, sin cargar el
+archivo completo en memoria) y los videos grandes mediante subida reanudable por
+fragmentos. Cada objeto subido se registra por post, página y hash de contenido:
+al reintentar un post se reutiliza su foto sin publicar o se reanuda la subida
+del video, pero un post nuevo siempre sube y publica su propia media.
+"""
+
+import hashlib
+import io
+import mimetypes
+import os
+import uuid
+import psycopg2
+import config  # carga el .env una sola vez por proceso
+from graph_api import GRAPH_VIDEO_URL, GraphAPIError, graph_request
+from structured_logger import get_logger
+
+logger = get_logger("media")
+
+CHUNK_SIZE = 1024 * 1024
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+# Copias validadas por media_prefetch, nombradas <sha256>.<ext>
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(os.getenv("OUTPUT_FOLDER", "."), "media_cache"))
+
+
+class _FileSlice:
+    """Lector acotado a un rango [offset, offset + length) de un archivo."""
+
+    def __init__(self, file_obj, offset, length):
+        self.file_obj = file_obj
+        self.remaining = length
+        self.file_obj.seek(offset)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        chunk = self.file_obj.read(size)
+        self.remaining -= len(chunk)
+        return chunk
+
+
+class MultipartStream:
+    """
+    Cuerpo multipart/form-data que se genera mientras requests lo envía.
+    Los campos de texto se serializan al inicio y el archivo se lee por bloques.
+    """
+
+    def __init__(self, fields, file_field, file_obj, file_size, filename, content_type):
+        self.boundary = uuid.uuid4().hex
+        head = io.StringIO()
+        for name, value in fields.items():
+            head.write(f'--{self.boundary}\r\n')
+            head.write(f'Content-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+        head.write(f'--{self.boundary}\r\n')
+        head.write(f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n')
+        head.write(f'Content-Type: {content_type}\r\n\r\n')
+        head_bytes = head.getvalue().encode("utf-8")
+        tail_bytes = f'\r\n--{self.boundary}--\r\n'.encode("utf-8")
+
+        self._parts = [io.BytesIO(head_bytes), file_obj, io.BytesIO(tail_bytes)]
+        self._length = len(head_bytes) + file_size + len(tail_bytes)
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        buffer = b""
+        while self._parts and len(buffer) < size:
+            chunk = self._parts[0].read(size - len(buffer))
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            buffer += chunk
+        return buffer
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def resolve_local_path(media_url):
+    """
+    Localiza el archivo local correspondiente a media_url.
+
+    Acepta rutas absolutas o relativas, URLs file:// y nombres de imágenes
+    generadas por la IA guardadas en OUTPUT_FOLDER. Solo se devuelven archivos
+    dentro de OUTPUT_FOLDER o MEDIA_CACHE_DIR: un post no puede subir otros
+    archivos del servidor.
+
+    Returns:
+        Ruta del archivo o None si media_url es una URL remota / no existe
+    """
+    if not media_url:
+        return None
+    if media_url.startswith("file://"):
+        media_url = media_url[len("file://"):]
+    elif "://" in media_url:
+        return None
+
+    candidates = [media_url]
+    allowed = [os.path.realpath(MEDIA_CACHE_DIR)]
+    output_folder = os.getenv("OUTPUT_FOLDER")
+    if output_folder:
+        candidates.append(os.path.join(output_folder, os.path.basename(media_url)))
+        allowed.append(os.path.realpath(output_folder))
+
+    for path in candidates:
+        real = os.path.realpath(path)
+        if os.path.isfile(real) and any(os.path.commonpath([real, root]) == root for root in allowed):
+            return path
+    return None
+
+
+def is_video(media_url):
+    """Indica si la media es un video según su extensión."""
+    return media_url.lower().split("?")[0].endswith(VIDEO_EXTENSIONS)
+
+
+def cached_media_path(media_file):
+    """Ruta de una copia de MEDIA_CACHE_DIR, o None si no hay copia o ya no existe."""
+    if not media_file:
+        return None
+    path = os.path.join(MEDIA_CACHE_DIR, media_file)
+    return path if os.path.isfile(path) else None
+
+
+def file_content_hash(path):
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques.
+
+    Las copias de MEDIA_CACHE_DIR ya llevan el hash en el nombre y no se leen.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if len(name) == 64 and os.path.dirname(os.path.abspath(path)) == os.path.abspath(MEDIA_CACHE_DIR):
+        return name
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaUploader:
+    """Gestiona la subida de fotos y videos y su registro por post."""
+
+    def __init__(self):
+        self.db_url = os.getenv("DATABASE_URL")
+
+    def get_connection(self):
+        """Obtiene conexión a la base de datos."""
+        try:
+            return psycopg2.connect(self.db_url)
+        except Exception as e:
+            logger.error("Error de conexión a BD", extra={"error": str(e)})
+            return None
+
+    def get_cached(self, post_id, page_id, content_hash):
+        """
+        Busca un objeto que el mismo post ya subió a la página con este contenido.
+
+        Returns:
+            (platform_media_id, status, upload_session_id, uploaded_bytes) o None
+        """
+        conn = self.get_connection()
+        if not conn:
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT platform_media_id, status, upload_session_id, uploaded_bytes
+                FROM media_uploads
+                WHERE post_id = %s AND page_id = %s AND content_hash = %s
+            """, (post_id, str(page_id), content_hash))
+            row = cur.fetchone()
+            cur.close()
+            conn.close()
+            return row
+        except Exception as e:
+            logger.warning("Error consultando caché de media", extra={"error": str(e)})
+            return None
+
+    def save_upload(self, post_id, page_id, content_hash, media_type, platform_media_id,
+                    status="uploaded", upload_session_id=None, uploaded_bytes=0):
+        """Registra (o actualiza) un objeto subido por el post. Sin post no se registra."""
+        if post_id is None:
+            return False
+        conn = self.get_connection()
+        if not conn:
+            return False
+
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO media_uploads
+                (post_id, page_id, content_hash, media_type, platform_media_id, status,
+                 upload_session_id, uploaded_bytes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (post_id, page_id, content_hash) DO UPDATE
+                SET platform_media_id = EXCLUDED.platform_media_id,
+                    status = EXCLUDED.status,
+                    upload_session_id = EXCLUDED.upload_session_id,
+                    uploaded_bytes = EXCLUDED.uploaded_bytes,
+                    updated_at = NOW()
+            """, (
+                post_id, str(page_id), content_hash, media_type, platform_media_id,
+                status, upload_session_id, uploaded_bytes
+            ))
+            conn.commit()
+            cur.close()
+            conn.close()
+            return True
+        except Exception as e:
+            logger.warning("Error guardando caché de media", extra={"error": str(e)})
+            return False
+
+    def upload_photo(self, page_id, access_token, media_url, post_id=None):
+        """
+        Sube una foto sin publicar a la página y devuelve su ID de media.
+
+        Los archivos locales se envían en streaming a /photos; las URLs remotas
+        se pasan en el parámetro 'url' para que Facebook las descargue. La foto
+        solo se reutiliza si este mismo post ya la subió en un intento anterior.
+
+        Returns:
+            ID de la foto en Facebook (media_fbid)
+
+        Raises:
+            GraphAPIError: Si la subida falla
+        """
+        path = resolve_local_path(media_url)
+        if path:
+            content_hash = file_content_hash(path)
+        elif "://" in media_url:
+            content_hash = hashlib.sha256(media_url.encode("utf-8")).hexdigest()
+        else:
+            raise GraphAPIError(f"No se encontró el archivo de media: {media_url}", "MEDIA_NOT_FOUND")
+
+        cached = self.get_cached(post_id, page_id, content_hash) if post_id is not None else None
+        if cached and cached[1] == "uploaded":
+            logger.debug("Foto reutilizada del intento anterior", extra={"post_id": post_id, "media_id": cached[0]})
+            return cached[0]
+
+        if path:
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            with open(path, "rb") as f:
+                body = MultipartStream(
+                    {"published": "false", "access_token": access_token},
+                    "source", f, os.path.getsize(path),
+                    os.path.basename(path), content_type
+                )
+                data = graph_request(
+                    "POST", f"{page_id}/photos", timeout=60,
+                    data=body, headers={"Content-Type": body.content_type}
+                )
+        else:
+            data = graph_request("POST", f"{page_id}/photos", data={
+                "url": media_url,
+                "published": "false",
+                "access_token": access_token
+            })
+
+        photo_id = data.get("id")
+        self.save_upload(post_id, page_id, content_hash, "photo", photo_id)
+        logger.info("Foto subida", extra={"page_id": page_id, "media_id": photo_id})
+        return photo_id
+
+    def upload_video(self, page_id, access_token, path, description=None, chunk_size=4 * CHUNK_SIZE,
+                     post_id=None):
+        """
+        Sube y publica un video mediante el protocolo reanudable (start/transfer/finish).
+
+        El progreso del post se guarda en media_uploads tras cada fragmento, de
+        modo que si el proceso se interrumpe el reintento del post continúa desde
+        el último offset confirmado en lugar de empezar de cero. La fase finish
+        (la que publica el video) se ejecuta siempre.
+
+        Returns:
+            ID del video en Facebook
+
+        Raises:
+            GraphAPIError: Si la subida falla
+        """
+        content_hash = file_content_hash(path)
+        file_size = os.path.getsize(path)
+        url = f"{GRAPH_VIDEO_URL}/{page_id}/videos"
+
+        cached = self.get_cached(post_id, page_id, content_hash) if post_id is not None else None
+        if cached and cached[1] == "uploading" and cached[2]:
+            video_id, session_id, start_offset = cached[0], cached[2], int(cached[3] or 0)
+            logger.info("Reanudando subida de video", extra={"media_id": video_id, "start_offset": start_offset})
+        else:
+            video_id, session_id, start_offset = self._start_video_session(
+                url, post_id, page_id, access_token, content_hash, file_size
+            )
+
+        try:
+            self._transfer_video(url, post_id, page_id, access_token, path, content_hash,
+                                 video_id, session_id, start_offset, file_size, chunk_size)
+        except GraphAPIError:
+            if not cached or cached[1] != "uploading":
+                raise
+            # La sesión reanudada pudo caducar: se reinicia una única vez
+            logger.warning("Sesión de subida no válida, reiniciando", extra={"upload_session_id": session_id})
+            video_id, session_id, start_offset = self._start_video_session(
+                url, post_id, page_id, access_token, content_hash, file_size
+            )
+            self._transfer_video(url, post_id, page_id, access_token, path, content_hash,
+                                 video_id, session_id, start_offset, file_size, chunk_size)
+
+        finish_data = {
+            "upload_phase": "finish",
+            "upload_session_id": session_id,
+            "access_token": access_token
+        }
+        if description:
+            finish_data["description"] = description
+        graph_request("POST", url, timeout=60, data=finish_data)
+
+        self.save_upload(post_id, page_id, content_hash, "video", video_id, uploaded_bytes=file_size)
+        logger.info("Video subido", extra={"page_id": page_id, "media_id": video_id})
+        return video_id
+
+    def _start_video_session(self, url, post_id, page_id, access_token, content_hash, file_size):
+        """Abre una sesión de subida reanudable y la registra en la caché."""
+        data = graph_request("POST", url, data={
+            "upload_phase": "start",
+            "file_size": file_size,
+            "access_token": access_token
+        })
+        video_id = data.get("video_id")
+        session_id = data.get("upload_session_id")
+        start_offset = int(data.get("start_offset", 0))
+        self.save_upload(post_id, page_id, content_hash, "video", video_id, status="uploading",
+                         upload_session_id=session_id, uploaded_bytes=start_offset)
+        return video_id, session_id, start_offset
+
+    def _transfer_video(self, url, post_id, page_id, access_token, path, content_hash,
+                        video_id, session_id, start_offset, file_size, chunk_size):
+        """Envía los fragmentos pendientes a partir de start_offset."""
+        with open(path, "rb") as f:
+            while start_offset < file_size:
+                length = min(chunk_size, file_size - start_offset)
+                body = MultipartStream(
+                    {
+                        "upload_phase": "transfer",
+                        "upload_session_id": session_id,
+                        "start_offset": start_offset,
+                        "access_token": access_token
+                    },
+                    "video_file_chunk", _FileSlice(f, start_offset, length), length,
+                    os.path.basename(path), "application/octet-stream"
+                )
+                data = graph_request("POST", url, timeout=120, data=body,
+                                     headers={"Content-Type": body.content_type})
+                # Facebook indica el siguiente offset esperado
+                start_offset = int(data.get("start_offset", start_offset + length))
+                self.save_upload(post_id, page_id, content_hash, "video", video_id, status="uploading",
+                                 upload_session_id=session_id, uploaded_bytes=start_offset)
+
+
+# Instancia global del uploader
+media_uploader = MediaUploader()
@@ -0,0 +1,181 @@
+"""
+Métricas del worker en formato de texto de Prometheus.
+Implementa contadores, gauges e histogramas con etiquetas y un endpoint HTTP
+local (/metrics) para que Prometheus los recoja, sin dependencias externas.
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from structured_logger import get_logger
+
+logger = get_logger("metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """Base común: nombre, ayuda y valores por combinación de etiquetas."""
+
+    metric_type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    """Valor que solo crece (llamadas, errores...)."""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (profundidad de cola...)."""
+
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def replace(self, values_by_label, label_name):
+        """Sustituye todos los valores a la vez (p. ej. una fila por estado)."""
+        with self.lock:
+            self.values = {((label_name, label),): value for label, value in values_by_label.items()}
+
+
+class Histogram(_Metric):
+    """Distribución de duraciones en buckets acumulativos."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque `with`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {state['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+def render_metrics():
+    """Devuelve todas las métricas registradas en formato de texto de Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def endpoint_label(path):
+    """Normaliza una ruta de la Graph API para usarla como etiqueta (sin IDs)."""
+    path = path.split("?")[0].strip("/")
+    path = re.sub(r"^https?://[^/]+/(v\d+\.\d+/)?", "", path)
+    return re.sub(r"\d[\d_]*", "{id}", path) or "/"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Arranca el endpoint /metrics en un hilo en segundo plano."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Métricas disponibles", extra={"url": f"http://{host}:{server.server_address[1]}/metrics"})
+    return server
+
+
+# --- Métricas del pipeline de publicación ---
+QUEUE_DEPTH = Gauge("aupa_queue_depth", "Posts en posts_queue por estado")
+CLAIM_TO_PUBLISH_SECONDS = Histogram(
+    "aupa_claim_to_publish_seconds", "Tiempo desde que se reclama un post hasta registrar su resultado"
+)
+POSTS_PROCESSED = Counter("aupa_posts_processed_total", "Posts procesados por plataforma y resultado")
+GRAPH_REQUEST_SECONDS = Histogram("aupa_graph_request_seconds", "Latencia de llamadas a la Graph API")
+GRAPH_ERRORS = Counter("aupa_graph_errors_total", "Errores de la Graph API por endpoint y error_code")
+GRAPH_CIRCUIT_OPEN = Gauge("aupa_graph_circuit_open", "1 si el circuito del endpoint de la Graph API está abierto")
+TOKEN_CACHE_LOOKUPS = Counter(
+    "aupa_token_validation_cache_total", "Consultas a la caché de validación de tokens (hit/miss)"
+)
+DB_QUERY_SECONDS = Histogram("aupa_db_query_seconds", "Duración de las consultas del worker a PostgreSQL")
+INSIGHTS_SYNCED = Counter(
+    "aupa_insights_posts_synced_total", "Posts cuyas métricas se han sincronizado por plataforma y resultado"
+)
+SUPERVISOR_WORKERS = Gauge("aupa_supervisor_workers", "Procesos worker deseados y en ejecución")
+WORKER_RESTARTS = Counter("aupa_worker_restarts_total", "Reinicios de procesos worker por motivo")
+WEBHOOK_EVENTS = Counter("aupa_webhook_events_total", "Eventos de publicación enviados a webhooks por resultado")
+MEDIA_PREFETCHED = Counter(
+    "aupa_media_prefetched_total", "Media descargada y validada antes de publicar por plataforma y resultado"
+)
@@ -0,0 +1,80 @@
+"""
+Consultas de las páginas de la app (cuentas y monitor de publicaciones).
+Se mantienen fuera de app.py para reutilizarlas desde otras páginas y desde las
+pruebas de carga.
+"""
+
+from search_utils import like_pattern
+
+
+def get_accounts(cur):
+    """Cuentas sociales disponibles para publicar: (id, platform, created_at)."""
+    cur.execute("SELECT id, platform, created_at FROM social_accounts")
+    return cur.fetchall()
+
+
+def get_recent_posts(cur, limit=20):
+    """Últimos posts de la cola con el email de la cuenta."""
+    cur.execute("""
+        SELECT q.id, a.platform, q.content, q.status, q.error_message, q.scheduled_at, a.user_email
+        FROM posts_queue q
+        JOIN social_accounts a ON q.account_id = a.id
+        ORDER BY q.scheduled_at DESC LIMIT %s
+    """, (limit,))
+    return cur.fetchall()
+
+
+def search_posts(cur, text=None, email=None, page=0, page_size=20):
+    """
+    Busca posts por contenido (texto completo) y/o email de la cuenta, en la
+    cola y en el histórico (posts_all).
+
+    El texto admite la sintaxis de websearch_to_tsquery ("frase exacta", -excluir,
+    or) y los resultados se ordenan por relevancia; el email es una búsqueda
+    parcial (índice de trigramas). Sin texto se ordena por fecha programada.
+
+    Returns:
+        (filas como las de get_recent_posts, hay_más_páginas)
+    """
+    conditions = []
+    params = {"text": text or "", "limit": page_size + 1, "offset": page * page_size}
+    if text:
+        conditions.append("to_tsvector('spanish', q.content) @@ websearch_to_tsquery('spanish', %(text)s)")
+    if email:
+        conditions.append("a.user_email ILIKE %(email)s")
+        params["email"] = like_pattern(email)
+    rank = "ts_rank(to_tsvector('spanish', q.content), websearch_to_tsquery('spanish', %(text)s))"
+
+    cur.execute(f"""
+        SELECT q.id, a.platform, q.content, q.status, q.error_message, q.scheduled_at, a.user_email
+        FROM posts_all q
+        JOIN social_accounts a ON q.account_id = a.id
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY {rank + " DESC, " if text else ""}q.scheduled_at DESC, q.id DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+    """, params)
+    rows = cur.fetchall()
+    return rows[:page_size], len(rows) > page_size
+
+
+def get_recent_token_exchanges(cur, limit=20):
+    """Últimos intercambios y validaciones de tokens."""
+    cur.execute("""
+        SELECT user_email, platform, token_status, error_message,
+               facebook_user_id, exchange_timestamp, ip_address
+        FROM token_exchange_logs
+        ORDER BY exchange_timestamp DESC LIMIT %s
+    """, (limit,))
+    return cur.fetchall()
+
+
+def get_recent_publish_errors(cur, limit=20):
+    """Últimos errores de publicación registrados en auditoría."""
+    cur.execute("""
+        SELECT post_id, account_id, platform, publish_status,
+               error_details, retry_count, logged_at
+        FROM post_publish_logs
+        WHERE publish_status = 'failed'
+        ORDER BY logged_at DESC LIMIT %s
+    """, (limit,))
+    return cur.fetchall()
@@ -0,0 +1,146 @@
+"""
+Intercambio OAuth con Facebook y vinculación de todas las páginas del usuario.
+Tras canjear el código, /me (que además valida el token) y la primera página
+de /me/accounts se piden en paralelo; después se siguen los cursores de
+paginación y todas las páginas se guardan en social_accounts con un único
+upsert en bloque.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from graph_api import GraphAPIError, graph_request
+from structured_logger import get_logger
+
+logger = get_logger("oauth")
+
+PAGES_PER_REQUEST = 100
+
+
+def fetch_all_pages(user_access_token, first_page):
+    """Sigue paging.next de /me/accounts hasta agotar los resultados."""
+    pages = list(first_page.get("data", []))
+    next_url = first_page.get("paging", {}).get("next")
+    while next_url:
+        # La URL de paginación ya incluye el token y el cursor
+        data = graph_request("GET", next_url, timeout=10)
+        pages.extend(data.get("data", []))
+        next_url = data.get("paging", {}).get("next")
+    return pages
+
+
+def linked_accounts(platform, pages):
+    """
+    Convierte las páginas de Facebook en cuentas a vincular.
+
+    Facebook: una cuenta por página (platform_user_id = page_id).
+    Instagram: una por cuenta business enlazada a una página
+    (platform_user_id = IG user id, publicada con el token de la página).
+    """
+    accounts = []
+    for page in pages:
+        if not page.get("access_token"):
+            continue
+        if platform == "Instagram":
+            ig_account = page.get("instagram_business_account")
+            if ig_account:
+                accounts.append({
+                    "platform_user_id": ig_account["id"],
+                    "name": page.get("name"),
+                    "access_token": page["access_token"]
+                })
+        else:
+            accounts.append({
+                "platform_user_id": page["id"],
+                "name": page.get("name"),
+                "access_token": page["access_token"]
+            })
+    return accounts
+
+
+def exchange_facebook_code(code, platform="Facebook"):
+    """
+    Canjea el código de autorización y obtiene todas las páginas gestionadas.
+
+    Returns:
+        (resultado, error_msg, error_code). resultado es un diccionario con
+        "user", "accounts" (lista de cuentas a vincular) y "expires_in", o
+        None si hubo error.
+    """
+    fb_app_id = os.getenv("FACEBOOK_CLIENT_ID")
+    fb_app_secret = os.getenv("FACEBOOK_CLIENT_SECRET")
+    redirect_uri = os.getenv("REDIRECT_URI", "https://localhost:8501/")
+
+    if not fb_app_id or not fb_app_secret:
+        return None, "Faltan credenciales de Facebook en variables de entorno", "MISSING_CREDENTIALS"
+
+    try:
+        token_data = graph_request("GET", "oauth/access_token", timeout=10, params={
+            "client_id": fb_app_id,
+            "client_secret": fb_app_secret,
+            "redirect_uri": redirect_uri,
+            "code": code
+        })
+        user_access_token = token_data.get("access_token")
+
+        # /me valida el token; no depende de /me/accounts, así que van en paralelo
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            me_future = pool.submit(graph_request, "GET", "me", timeout=10, params={
+                "access_token": user_access_token,
+                "fields": "id,name,email"
+            })
+            pages_future = pool.submit(graph_request, "GET", "me/accounts", timeout=10, params={
+                "access_token": user_access_token,
+                "fields": "id,name,access_token,instagram_business_account",
+                "limit": PAGES_PER_REQUEST
+            })
+            user_data = me_future.result()
+            first_page = pages_future.result()
+
+        pages = fetch_all_pages(user_access_token, first_page)
+    except GraphAPIError as e:
+        logger.warning("Error en intercambio OAuth", extra={"error": e.message, "error_code": e.code})
+        return None, e.message, e.code
+
+    accounts = linked_accounts(platform, pages)
+    if not accounts:
+        if platform == "Instagram":
+            return None, "Ninguna página tiene una cuenta business de Instagram enlazada", "NO_PAGES"
+        return None, "No se encontraron páginas. Asegúrate de que el usuario tenga acceso a páginas de Facebook", "NO_PAGES"
+
+    logger.info("Páginas obtenidas", extra={"platform": platform, "pages": len(pages), "accounts": len(accounts)})
+    return {
+        "user": user_data,
+        "accounts": accounts,
+        "expires_in": token_data.get("expires_in")
+    }, None, None
+
+
+def save_linked_accounts(cur, user_email, platform, accounts, expires_in=None):
+    """
+    Inserta o actualiza en bloque las cuentas vinculadas.
+
+    Una misma cuenta puede venir repetida (una cuenta de Instagram vinculada a
+    dos páginas, o un duplicado al paginar); ON CONFLICT no admite tocar la
+    misma fila dos veces en una sentencia, así que se guarda solo la última.
+
+    Returns:
+        Lista de IDs de social_accounts en el orden de `accounts`
+    """
+    expires_at = datetime.now() + timedelta(seconds=int(expires_in)) if expires_in else None
+    unique = {account["platform_user_id"]: account for account in accounts}
+    rows = execute_values(cur, """
+        INSERT INTO social_accounts (user_email, platform, platform_user_id, access_token, expires_at)
+        VALUES %s
+        ON CONFLICT (platform, platform_user_id) DO UPDATE
+        SET user_email = EXCLUDED.user_email,
+            access_token = EXCLUDED.access_token,
+            expires_at = EXCLUDED.expires_at
+        RETURNING platform_user_id, id
+    """, [
+        (user_email, platform, platform_user_id, account["access_token"], expires_at)
+        for platform_user_id, account in unique.items()
+    ], page_size=len(unique), fetch=True)
+    ids = dict(rows)
+    return [ids[account["platform_user_id"]] for account in accounts]
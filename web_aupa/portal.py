@@ -1,3 +1,4 @@
+import importlib
 import streamlit as st
 
 
@@ -37,37 +38,38 @@ def mostrar_dashboard():
         st.subheader("✨ Marketing Digital")
         st.write("Utiliza la inteligencia artificial para crear contenido impactante.")
 
+# Páginas del portal: (módulo, función de entrada). El módulo se importa la
+# primera vez que se abre la página, así el arranque no carga pandas ni los
+# clientes de la Graph API.
+PAGINAS = {
+    "🏠 Inicio": None,
+    "🗄️ Gestión de Comercios": ("admin_comercios", "main"),
+    "🤖 Gestión IA": ("gestion_ia", "main"),
+    "🌐 Redes Sociales": ("app", "main"),
+    "📡 Operaciones": ("dashboard_operaciones", "main"),
+    "🔍 Test de Conexión": ("test_db", "ejecutar_test"),
+}
+
+def cargar_pagina(opcion):
+    """Devuelve la función de entrada de la página (importando su módulo si hace falta)."""
+    modulo, funcion = PAGINAS[opcion]
+    return getattr(importlib.import_module(modulo), funcion)
+
 def main():
     # Menú de navegación lateral
     st.sidebar.title("🛠️ Panel de Control")
     st.sidebar.divider()
     
-    opcion = st.sidebar.radio(
-        "Seleccione una herramienta:",
-        ["🏠 Inicio", "🗄️ Gestión de Comercios", "🤖 Gestión IA", "🌐 Redes Sociales", "🔍 Test de Conexión"]
-    )
+    opcion = st.sidebar.radio("Seleccione una herramienta:", list(PAGINAS))
 
     st.sidebar.divider()
     st.sidebar.info("Aupa Software - Solución Integral")
 
     # Lógica de navegación
-    if opcion == "🏠 Inicio":
+    if PAGINAS[opcion] is None:
         mostrar_dashboard()
-    
-    elif opcion == "🗄️ Gestión de Comercios":
-        import admin_comercios
-        admin_comercios.main()
-        
-    elif opcion == "🤖 Gestión IA":
-        import gestion_ia
-        # Asegúrate de que gestion_ia tenga una función main() o lógica de inicio
-    
-    elif opcion == "🌐 Redes Sociales":
-        # Renderiza la interfaz del conector social
-        render_social_connector_ui()
-    elif opcion == "🔍 Test de Conexión":
-        import test_db
-        test_db.ejecutar_test() # Llamamos a la función del archivo de prueba
+    else:
+        cargar_pagina(opcion)()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
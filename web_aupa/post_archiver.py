@@ -0,0 +1,99 @@
+"""
+Archivado de posts terminados.
+Mueve por lotes los posts 'sent', 'failed', 'dead' y 'unsupported' más
+antiguos que el umbral de posts_queue a posts_history, para que la cola
+caliente siga siendo pequeña. Cada lote es una transacción corta
+(DELETE ... RETURNING + INSERT) con SKIP LOCKED, así que no bloquea al worker.
+
+Ejecutar periódicamente (cron) o dejar que lo haga el worker:
+    python post_archiver.py
+    python post_archiver.py --older-than-days 7 --batch-size 5000
+"""
+
+import argparse
+import os
+from config import get_db_connection
+from structured_logger import get_logger
+
+logger = get_logger("post_archiver")
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("POSTS_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("POSTS_ARCHIVE_BATCH_SIZE", "1000"))
+FINISHED_STATUSES = ("sent", "failed", "dead", "unsupported")
+
+HISTORY_COLUMNS = (
+    "id, account_id, content, media_url, scheduled_at, status, error_message, sent_at, "
+    "idempotency_key, claimed_at, platform_post_id, retry_count, retry_at"
+)
+
+
+def archive_batch(cur, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Mueve un lote de posts terminados a posts_history.
+
+    Activa aupa.archiving en la transacción para que los contadores de
+    posts_queue_counters sigan incluyendo los posts archivados.
+
+    Returns:
+        Número de posts archivados
+    """
+    cur.execute("SELECT set_config('aupa.archiving', 'on', true)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM posts_queue
+            WHERE id IN (
+                SELECT id FROM posts_queue
+                WHERE status = ANY(%s)
+                  AND scheduled_at < NOW() - %s * INTERVAL '1 day'
+                ORDER BY scheduled_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {HISTORY_COLUMNS}
+        )
+        INSERT INTO posts_history ({HISTORY_COLUMNS})
+        SELECT {HISTORY_COLUMNS} FROM moved
+    """, (list(FINISHED_STATUSES), older_than_days, batch_size))
+    return cur.rowcount
+
+
+def archive_finished_posts(conn, older_than_days=ARCHIVE_AFTER_DAYS,
+                           batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """
+    Archiva lotes hasta vaciar los candidatos (o llegar a max_batches).
+
+    Hace commit tras cada lote para mantener las transacciones cortas.
+
+    Returns:
+        Total de posts archivados
+    """
+    total = 0
+    batches = 0
+    cur = conn.cursor()
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cur, older_than_days, batch_size)
+        conn.commit()
+        total += moved
+        batches += 1
+        if moved < batch_size:
+            break
+    cur.close()
+
+    if total:
+        logger.info("Posts archivados", extra={"archived": total, "batches": batches})
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archivado de posts terminados")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        archived = archive_finished_posts(conn, args.older_than_days, args.batch_size, args.max_batches)
+    finally:
+        conn.close()
+    print(f"{archived} posts archivados en posts_history")
@@ -0,0 +1,53 @@
+"""
+Operaciones sobre la cola de publicaciones (posts_queue).
+Centraliza el alta de posts con clave de idempotencia para que un doble clic o
+un reintento no generen publicaciones duplicadas.
+"""
+
+import hashlib
+from datetime import datetime
+
+
+def build_idempotency_key(account_id, content, media_url, scheduled_at):
+    """
+    Calcula la clave de idempotencia de un post.
+
+    Se deriva de la cuenta, el hash del contenido (texto y media) y la fecha
+    programada truncada al minuto.
+    """
+    content_hash = hashlib.sha256(f"{content}\x00{media_url or ''}".encode("utf-8")).hexdigest()
+    schedule = scheduled_at.replace(second=0, microsecond=0).isoformat()
+    return hashlib.sha256(f"{account_id}|{content_hash}|{schedule}".encode("utf-8")).hexdigest()
+
+
+def enqueue_post(cur, account_id, content, media_url=None, scheduled_at=None, deferred_to=None):
+    """
+    Añade un post a la cola si no existe ya uno idéntico.
+
+    Args:
+        cur: Cursor de la conexión (el commit lo hace quien llama)
+        account_id: ID de la cuenta social
+        content: Texto del post
+        media_url: Media adjunta (opcional)
+        scheduled_at: Fecha programada solicitada (por defecto, ahora)
+        deferred_to: Fecha real si el control de admisión aplazó el post. La
+                     clave de idempotencia sigue usando la fecha solicitada.
+
+    Returns:
+        (post_id, created): created es False si el post ya estaba en la cola
+    """
+    scheduled_at = (scheduled_at or datetime.now()).replace(second=0, microsecond=0)
+    key = build_idempotency_key(account_id, content, media_url, scheduled_at)
+
+    cur.execute("""
+        INSERT INTO posts_queue (account_id, content, media_url, scheduled_at, idempotency_key)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING id
+    """, (account_id, content, media_url, deferred_to or scheduled_at, key))
+    row = cur.fetchone()
+    if row:
+        return row[0], True
+
+    cur.execute("SELECT id FROM posts_queue WHERE idempotency_key = %s", (key,))
+    return cur.fetchone()[0], False
@@ -0,0 +1,495 @@
+"""
+Adaptadores de publicación por red social.
+Cada plataforma registra un Publisher que declara su concurrencia, su límite de
+llamadas por minuto y su tamaño de lote; el worker despacha los posts a través
+de este registro en lugar de una cadena de if/elif.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import config  # carga el .env una sola vez por proceso
+from graph_api import CIRCUIT_OPEN, RETRYABLE_ERROR_CODES, GraphAPIError, graph_request
+from media_uploader import cached_media_path, is_video, media_uploader, resolve_local_path
+from metrics import TOKEN_CACHE_LOOKUPS
+from structured_logger import get_logger, log_context, span
+
+logger = get_logger("publishers")
+
+# Fila de posts_queue junto con los datos de la cuenta que publica. media_file
+# es la copia validada por media_prefetch (None si no llegó a prepararse).
+QueuedPost = namedtuple("QueuedPost", [
+    "id", "content", "media_url", "platform", "access_token",
+    "platform_user_id", "account_id", "media_file"
+], defaults=(None,))
+
+# Resultado de publicar un post
+PublishResult = namedtuple("PublishResult", [
+    "post", "success", "platform_post_id", "error_msg", "error_code"
+])
+
+PUBLISHERS = {}
+
+# Segundos que el worker espera a los posts en curso al recibir SIGTERM/SIGINT
+DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "30"))
+
+
+def register_publisher(cls):
+    """Decorador que registra un adaptador para su plataforma."""
+    PUBLISHERS[cls.platform] = cls()
+    return cls
+
+
+def get_publisher(platform):
+    """Devuelve el adaptador de una plataforma o None si no está soportada."""
+    return PUBLISHERS.get(platform)
+
+
+def released_result(post):
+    """Resultado de un post que se devuelve a la cola sin publicarse (apagado)."""
+    return PublishResult(post, False, None, "Liberado por apagado del worker", "RELEASED")
+
+
+class RateLimiter:
+    """Token bucket sencillo: como máximo `per_minute` llamadas por minuto."""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.tokens = float(self.capacity)
+        self.refill_rate = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+
+class Publisher:
+    """
+    Interfaz base de un adaptador de publicación.
+
+    Atributos que cada plataforma puede ajustar:
+        platform: Nombre de la plataforma tal como se guarda en social_accounts
+        max_concurrency: Posts publicados en paralelo dentro de un lote
+        rate_limit_per_minute: Llamadas de publicación permitidas por minuto
+        batch_size: Posts pendientes que el worker reclama por ciclo
+    """
+
+    platform = None
+    max_concurrency = 1
+    rate_limit_per_minute = 60
+    batch_size = 5
+
+    def __init__(self):
+        self.rate_limiter = RateLimiter(self.rate_limit_per_minute)
+
+    def validate_token(self, post):
+        """Comprueba el token de la cuenta antes de publicar."""
+        return True
+
+    def check_token(self, post):
+        """
+        Valida el token y devuelve el PublishResult de error, o None si es válido.
+
+        Si no se pudo comprobar (la Graph API no responde o su circuito está
+        abierto) el error conserva su código para que el worker lo reintente
+        o lo devuelva a la cola en lugar de darlo por inválido.
+        """
+        with span(logger, "validate"):
+            try:
+                is_valid = self.validate_token(post)
+            except GraphAPIError as e:
+                # Con el circuito abierto el propio circuito ya avisó al abrirse
+                log = logger.debug if e.code == CIRCUIT_OPEN else logger.warning
+                log("No se pudo validar el token", extra={"error": e.message, "error_code": e.code})
+                return PublishResult(post, False, None, e.message, e.code)
+        if not is_valid:
+            logger.warning("Token inválido")
+            return PublishResult(post, False, None, "Token inválido o expirado", "INVALID_TOKEN")
+        return None
+
+    def publish(self, post):
+        """
+        Publica un único post.
+
+        Returns:
+            (success: bool, platform_post_id: str, error_msg: str, response_code: str)
+        """
+        raise NotImplementedError
+
+    def find_published(self, post, since):
+        """
+        Busca en la red social un post ya publicado (reconciliación tras un corte).
+
+        Args:
+            post: QueuedPost que quedó en curso
+            since: datetime desde el que buscar
+
+        Returns:
+            ID del post en la plataforma o None si no se encontró
+        """
+        return None
+
+    def publish_one(self, post, stop_event=None):
+        """Valida el token, respeta el límite de llamadas y publica un post.
+
+        Si `stop_event` está activo antes de llamar a la API, el post no se
+        publica y se devuelve como liberado.
+        """
+        if stop_event and stop_event.is_set():
+            return released_result(post)
+
+        with log_context(post_id=post.id, account_id=post.account_id, platform=self.platform):
+            error = self.check_token(post)
+            if error:
+                return error
+
+            self.rate_limiter.acquire()
+            if stop_event and stop_event.is_set():
+                return released_result(post)
+
+            with span(logger, "publish"):
+                success, platform_post_id, error_msg, error_code = self.publish(post)
+            return PublishResult(post, success, platform_post_id, error_msg, error_code)
+
+    def publish_batch(self, posts, stop_event=None):
+        """
+        Publica un lote de posts respetando max_concurrency.
+
+        Args:
+            posts: Lista de QueuedPost reclamados
+            stop_event: threading.Event que indica que el worker se está apagando
+
+        Returns:
+            Lista de PublishResult en el mismo orden que `posts`
+        """
+        if self.max_concurrency <= 1 or len(posts) <= 1:
+            return [self.publish_one(post, stop_event) for post in posts]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(lambda post: self.publish_one(post, stop_event), posts))
+
+
+# Resultados recientes de debug_token: {access_token: (is_valid, expires_at, validado_en)}
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_VALIDATION_CACHE_TTL", "300"))
+
+
+def validate_and_refresh_token(access_token):
+    """Valida el token y verifica si está a punto de expirar.
+
+    Los tokens válidos se cachean durante TOKEN_VALIDATION_CACHE_TTL segundos
+    (sin superar su expiración) para no llamar a debug_token en cada post.
+
+    Raises:
+        GraphAPIError: Si no se pudo comprobar (error transitorio o circuito abierto)
+    """
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(access_token)
+    if cached and now - cached[2] < TOKEN_CACHE_TTL and (not cached[1] or cached[1] > now):
+        TOKEN_CACHE_LOOKUPS.inc(result="hit")
+        return cached[0], cached[1]
+    TOKEN_CACHE_LOOKUPS.inc(result="miss")
+
+    try:
+        response_data = graph_request("GET", "debug_token", timeout=10, params={
+            "input_token": access_token,
+            "access_token": f"{os.getenv('FACEBOOK_CLIENT_ID')}|{os.getenv('FACEBOOK_CLIENT_SECRET')}"
+        })
+        data = response_data.get("data", {})
+        is_valid = data.get("is_valid", False)
+        expires_at = data.get("expires_at", 0)
+
+        logger.debug("Token validado", extra={"is_valid": is_valid, "expires_at": expires_at})
+        if is_valid:
+            with _token_cache_lock:
+                _token_cache[access_token] = (is_valid, expires_at, now)
+        return is_valid, expires_at
+    except GraphAPIError as e:
+        if e.code in RETRYABLE_ERROR_CODES or e.code == CIRCUIT_OPEN:
+            # No se pudo comprobar: no se da el token por inválido
+            raise
+        return False, 0
+    except Exception as e:
+        logger.warning("Error validando token", extra={"error": str(e)})
+        return False, 0
+
+
+def publish_to_facebook(page_id, access_token, message, media_url=None, post_id=None):
+    """Publica un post en Facebook usando Graph API.
+
+    Las fotos se suben primero sin publicar a /photos (o se reutiliza la que
+    subió un intento anterior del mismo post) y se adjuntan al post de /feed;
+    los videos se suben con el protocolo reanudable de /videos.
+
+    Args:
+        page_id: ID de la página de Facebook
+        access_token: Token de acceso válido
+        message: Contenido del post
+        media_url: Ruta local, imagen generada o URL del media (opcional)
+        post_id: ID del post en posts_queue, para reanudar su subida al reintentar
+
+    Returns:
+        (success: bool, post_id: str, error_msg: str, response_code: str)
+    """
+    try:
+        if media_url and is_video(media_url):
+            path = resolve_local_path(media_url)
+            if not path:
+                return False, None, f"No se encontró el video: {media_url}", "MEDIA_NOT_FOUND"
+            fb_post_id = media_uploader.upload_video(page_id, access_token, path, description=message,
+                                                      post_id=post_id)
+            logger.debug("Video publicado", extra={"platform_post_id": fb_post_id})
+            return True, fb_post_id, None, "200"
+
+        data = {
+            "message": message,
+            "access_token": access_token
+        }
+
+        # Si hay media, se adjunta la foto ya subida a la página
+        if media_url:
+            photo_id = media_uploader.upload_photo(page_id, access_token, media_url, post_id=post_id)
+            data["attached_media[0]"] = json.dumps({"media_fbid": photo_id})
+
+        response_data = graph_request("POST", f"{page_id}/feed", data=data)
+        fb_post_id = response_data.get("id")
+        logger.debug("Post publicado", extra={"platform_post_id": fb_post_id})
+        return True, fb_post_id, None, "200"
+
+    except GraphAPIError as e:
+        logger.warning("Error en publicación", extra={"error": e.message, "error_code": e.code})
+        return False, None, e.message, e.code
+    except Exception as e:
+        return False, None, str(e), "UNKNOWN_ERROR"
+
+
+@register_publisher
+class FacebookPublisher(Publisher):
+    """Publicación en páginas de Facebook (platform_user_id es el page_id)."""
+
+    platform = "Facebook"
+    max_concurrency = 4
+    rate_limit_per_minute = 60
+    batch_size = 10
+
+    def validate_token(self, post):
+        is_valid, _ = validate_and_refresh_token(post.access_token)
+        return is_valid
+
+    def find_published(self, post, since):
+        data = graph_request("GET", f"{post.platform_user_id}/feed", params={
+            "fields": "id,message",
+            "since": int(since.timestamp()),
+            "limit": 100,
+            "access_token": post.access_token
+        })
+        for item in data.get("data", []):
+            if item.get("message") == post.content:
+                return item.get("id")
+        return None
+
+    def publish(self, post):
+        # Si media_prefetch ya descargó y validó la media se sube esa copia
+        return publish_to_facebook(
+            post.platform_user_id,
+            post.access_token,
+            post.content,
+            cached_media_path(post.media_file) or post.media_url,
+            post_id=post.id
+        )
+
+
+@register_publisher
+class InstagramPublisher(Publisher):
+    """
+    Publicación en cuentas business de Instagram (platform_user_id es el IG user id).
+
+    Instagram publica en dos fases: se crea un contenedor de media y, cuando
+    termina de procesarse, se publica. El lote completo se procesa en pipeline:
+    primero se crean todos los contenedores, después se consulta el estado de
+    todos ellos en cada vuelta del bucle y cada uno se publica en cuanto está listo.
+    """
+
+    platform = "Instagram"
+    max_concurrency = 4
+    rate_limit_per_minute = 30
+    batch_size = 20
+    poll_interval = float(os.getenv("IG_CONTAINER_POLL_INTERVAL", "3"))
+    max_wait = float(os.getenv("IG_CONTAINER_MAX_WAIT", "300"))
+
+    def validate_token(self, post):
+        is_valid, _ = validate_and_refresh_token(post.access_token)
+        return is_valid
+
+    def create_container(self, post, stop_event=None):
+        """
+        Crea el contenedor de media de un post.
+
+        Returns:
+            (container_id, None) o (None, PublishResult de error)
+        """
+        if stop_event and stop_event.is_set():
+            return None, released_result(post)
+
+        with log_context(post_id=post.id, account_id=post.account_id, platform=self.platform):
+            error = self.check_token(post)
+            if error:
+                return None, error
+            return self._create_container(post)
+
+    def _create_container(self, post):
+
+        if not post.media_url or "://" not in post.media_url or post.media_url.startswith("file://"):
+            return None, PublishResult(
+                post, False, None,
+                "Instagram requiere una URL pública de imagen o video", "MEDIA_REQUIRED"
+            )
+
+        data = {"caption": post.content, "access_token": post.access_token}
+        # La copia validada lleva la extensión del tipo real del contenido
+        if is_video(post.media_file or post.media_url):
+            data["media_type"] = "REELS"
+            data["video_url"] = post.media_url
+        else:
+            data["image_url"] = post.media_url
+
+        self.rate_limiter.acquire()
+        try:
+            with span(logger, "create_container"):
+                response_data = graph_request("POST", f"{post.platform_user_id}/media", data=data)
+            logger.debug("Contenedor de Instagram creado", extra={"container_id": response_data.get("id")})
+            return response_data.get("id"), None
+        except GraphAPIError as e:
+            logger.warning("Error creando contenedor", extra={"error": e.message, "error_code": e.code})
+            return None, PublishResult(post, False, None, e.message, e.code)
+
+    def fetch_container_statuses(self, containers):
+        """
+        Consulta en una sola llamada por token el estado de varios contenedores.
+
+        Args:
+            containers: Diccionario {container_id: post}
+
+        Returns:
+            Diccionario {container_id: status_code}
+        """
+        by_token = {}
+        for container_id, post in containers.items():
+            by_token.setdefault(post.access_token, []).append(container_id)
+
+        statuses = {}
+        for access_token, container_ids in by_token.items():
+            # La Graph API admite hasta 50 IDs por consulta
+            for i in range(0, len(container_ids), 50):
+                ids = container_ids[i:i + 50]
+                try:
+                    data = graph_request("GET", "", params={
+                        "ids": ",".join(ids),
+                        "fields": "status_code",
+                        "access_token": access_token
+                    })
+                except GraphAPIError as e:
+                    logger.warning("Error consultando contenedores", extra={"error": e.message})
+                    continue
+                for container_id in ids:
+                    statuses[container_id] = data.get(container_id, {}).get("status_code")
+        return statuses
+
+    def publish_container(self, post, container_id):
+        """Publica un contenedor ya procesado."""
+        self.rate_limiter.acquire()
+        with log_context(post_id=post.id, account_id=post.account_id, platform=self.platform):
+            try:
+                with span(logger, "publish"):
+                    response_data = graph_request("POST", f"{post.platform_user_id}/media_publish", data={
+                        "creation_id": container_id,
+                        "access_token": post.access_token
+                    })
+                ig_media_id = response_data.get("id")
+                logger.debug("Post publicado en Instagram", extra={"platform_post_id": ig_media_id})
+                return PublishResult(post, True, ig_media_id, None, "200")
+            except GraphAPIError as e:
+                logger.warning("Error en publicación", extra={"error": e.message, "error_code": e.code})
+                return PublishResult(post, False, None, e.message, e.code)
+
+    def find_published(self, post, since):
+        data = graph_request("GET", f"{post.platform_user_id}/media", params={
+            "fields": "id,caption",
+            "since": int(since.timestamp()),
+            "limit": 100,
+            "access_token": post.access_token
+        })
+        for item in data.get("data", []):
+            if item.get("caption") == post.content:
+                return item.get("id")
+        return None
+
+    def publish(self, post):
+        result = self.publish_batch([post])[0]
+        return result.success, result.platform_post_id, result.error_msg, result.error_code
+
+    def publish_batch(self, posts, stop_event=None):
+        results = {}
+        pending = {}
+
+        # Fase 1: crear todos los contenedores por adelantado
+        with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as pool:
+            containers = pool.map(lambda post: self.create_container(post, stop_event), posts)
+            for post, (container_id, error) in zip(posts, containers):
+                if error:
+                    results[post.id] = error
+                else:
+                    pending[container_id] = post
+
+        # Fase 2: sondear todos los contenedores a la vez y publicar los que estén listos
+        deadline = time.monotonic() + self.max_wait
+        draining = False
+        while pending and time.monotonic() < deadline:
+            if stop_event and stop_event.is_set() and not draining:
+                # Se deja la mitad del margen de apagado para terminar de publicar
+                draining = True
+                deadline = min(deadline, time.monotonic() + DRAIN_TIMEOUT / 2)
+            time.sleep(self.poll_interval)
+            statuses = self.fetch_container_statuses(pending)
+
+            for container_id, status_code in statuses.items():
+                post = pending[container_id]
+                if status_code == "FINISHED":
+                    results[post.id] = self.publish_container(post, container_id)
+                    del pending[container_id]
+                elif status_code in ("ERROR", "EXPIRED"):
+                    logger.warning("Instagram no pudo procesar el contenedor", extra={
+                        "post_id": post.id, "container_id": container_id, "status_code": status_code
+                    })
+                    results[post.id] = PublishResult(
+                        post, False, None,
+                        f"Instagram no pudo procesar el media ({status_code})", f"CONTAINER_{status_code}"
+                    )
+                    del pending[container_id]
+
+        for container_id, post in pending.items():
+            if draining:
+                results[post.id] = released_result(post)
+                continue
+            results[post.id] = PublishResult(
+                post, False, None,
+                "Tiempo de procesamiento del contenedor agotado", "CONTAINER_TIMEOUT"
+            )
+
+        return [results[post.id] for post in posts]
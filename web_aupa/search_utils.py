@@ -0,0 +1,9 @@
+"""
+Utilidades de búsqueda compartidas por las páginas de la app.
+"""
+
+
+def like_pattern(text):
+    """Patrón ILIKE '%texto%' con los comodines del usuario escapados."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
@@ -0,0 +1,123 @@
+"""
+Logging estructurado para worker, app y auditoría.
+Emite una línea JSON por evento con nivel, contexto del post (post_id,
+account_id...) y duración de las etapas medidas con `span`.
+
+Variables de entorno:
+    LOG_LEVEL: DEBUG, INFO, WARNING... (por defecto INFO; en DEBUG se ve el
+               detalle por post)
+    LOG_FORMAT: 'json' (por defecto) o 'text' para lectura en consola
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_context = contextvars.ContextVar("log_context", default={})
+_configured = False
+
+# Atributos propios de logging.LogRecord que no se vuelcan como campos extra
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea cada registro como un objeto JSON en una sola línea."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_context.get())
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo: mensaje seguido de los campos de contexto."""
+
+    def format(self, record):
+        fields = dict(_context.get())
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                fields[key] = value
+        line = f"{record.levelname:<7} {record.getMessage()}"
+        if fields:
+            line += "  " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Configura el logger raíz 'aupa' una única vez por proceso."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        handler.setFormatter(TextFormatter())
+    else:
+        handler.setFormatter(JsonFormatter())
+    root = logging.getLogger("aupa")
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+    _configured = True
+
+
+def get_logger(name):
+    """Devuelve un logger hijo de 'aupa' (ej. get_logger('worker'))."""
+    configure_logging()
+    return logging.getLogger(f"aupa.{name}")
+
+
+@contextmanager
+def log_context(**fields):
+    """Añade campos (post_id, account_id...) a todos los logs del bloque."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def span(logger, name, level=logging.DEBUG, **fields):
+    """
+    Mide una etapa y registra su duración al terminar.
+
+    Emite un evento con span=<name>, duration_ms y status ('ok' o 'error').
+    Por defecto se registra en DEBUG para que el detalle por post se pueda
+    desactivar en producción con LOG_LEVEL=INFO.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        if logger.isEnabledFor(level) or status == "error":
+            logger.log(
+                level if status == "ok" else logging.WARNING,
+                f"{name} {status}",
+                extra={
+                    "span": name,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                    "status": status,
+                    **fields
+                }
+            )
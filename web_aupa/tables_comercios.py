@@ -1,78 +1,119 @@
-import pandas as pd
-from database_config import get_connection
+from config import get_db_connection
+from search_utils import like_pattern
 
 def crear_tablas():
-    """Crea la tabla 'categoria_comercio' y asegura que las columnas sean las correctas."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            # 1. Crear la tabla con la nueva estructura simplificada
+    """
+    Crea la tabla 'categoria_comercio' en bases de datos anteriores a init.sql.
+    La extensión pg_trgm y los índices de búsqueda están en init.sql. Si la
+    tabla ya existe no se ejecuta DDL (un rol sin permisos de CREATE funciona).
+    """
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('categoria_comercio')")
+        if cur.fetchone()[0] is None:
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS categoria_comercio (
-                    id SERIAL PRIMARY KEY,   
+                    id SERIAL PRIMARY KEY,
                     comercio_id TEXT NOT NULL,
                     nombre_comercio TEXT NOT NULL,
                     categoria TEXT
                 )
             ''')
             conn.commit()
-            cur.close()
-        finally:
-            conn.close()
+        cur.close()
+    finally:
+        conn.close()
 
 def insertar_comercio(comercio_id, nombre_comercio, categoria):
     """Guarda un nuevo registro en la tabla 'categoria_comercio'."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = "INSERT INTO categoria_comercio (comercio_id, nombre_comercio, categoria) VALUES (%s, %s, %s)"
-            cur.execute(query, (comercio_id, nombre_comercio, categoria))
-            conn.commit()
-            cur.close()
-        finally:
-            conn.close()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        query = "INSERT INTO categoria_comercio (comercio_id, nombre_comercio, categoria) VALUES (%s, %s, %s)"
+        cur.execute(query, (comercio_id, nombre_comercio, categoria))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
 
 def obtener_comercios():
-    """Recupera los comercios asegurando que las columnas coincidan con el DataFrame."""
-    conn = get_connection()
-    df = pd.DataFrame()
-    if conn:
-        try:
-            # Consultamos la tabla 'comercios' que es la que el error reportaba
-            query = "SELECT id, comercio_id, nombre_comercio, categoria FROM categoria_comercio ORDER BY id DESC"
-            df = pd.read_sql(query, conn)
-            df.columns = [c.lower() for c in df.columns]
-        finally:
-            conn.close()
-    return df
+    """Recupera los comercios como lista de diccionarios (sin pasar por pandas)."""
+    conn = get_db_connection()
+    comercios = []
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id, comercio_id, nombre_comercio, categoria FROM categoria_comercio ORDER BY id DESC")
+        columnas = [col[0].lower() for col in cur.description]
+        comercios = [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+        cur.close()
+    finally:
+        conn.close()
+    return comercios
+
+def buscar_comercios(texto="", pagina=0, por_pagina=20):
+    """
+    Busca comercios por nombre o ID, ordenados por parecido con el texto.
+
+    Encuentra coincidencias parciales y también nombres con erratas (trigramas).
+    Sin texto devuelve los más recientes.
+
+    Returns:
+        (lista de diccionarios, hay_más_páginas)
+    """
+    conn = get_db_connection()
+    comercios = []
+    try:
+        cur = conn.cursor()
+        params = {"texto": texto, "patron": like_pattern(texto), "limite": por_pagina + 1,
+                  "desplazamiento": pagina * por_pagina}
+        if texto:
+            cur.execute("""
+                SELECT id, comercio_id, nombre_comercio, categoria
+                FROM categoria_comercio
+                WHERE nombre_comercio ILIKE %(patron)s OR comercio_id ILIKE %(patron)s
+                   OR %(texto)s <%% nombre_comercio OR %(texto)s <%% comercio_id
+                ORDER BY GREATEST(word_similarity(%(texto)s, nombre_comercio),
+                                  word_similarity(%(texto)s, comercio_id)) DESC, id DESC
+                LIMIT %(limite)s OFFSET %(desplazamiento)s
+            """, params)
+        else:
+            cur.execute("""
+                SELECT id, comercio_id, nombre_comercio, categoria
+                FROM categoria_comercio
+                ORDER BY id DESC
+                LIMIT %(limite)s OFFSET %(desplazamiento)s
+            """, params)
+        columnas = [col[0].lower() for col in cur.description]
+        comercios = [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+        cur.close()
+    finally:
+        conn.close()
+    return comercios[:por_pagina], len(comercios) > por_pagina
 
 def actualizar_comercio(id_db, comercio_id, nombre_comercio, categoria):
     """Actualiza un categoria_comercio existente en la tabla 'comercios'."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            query = """
-                UPDATE categoria_comercio 
-                SET comercio_id = %s, nombre_comercio = %s, categoria = %s
-                WHERE id = %s
-            """
-            cur.execute(query, (comercio_id, nombre_comercio, categoria, id_db))
-            conn.commit()
-            cur.close()
-        finally:
-            conn.close()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        query = """
+            UPDATE categoria_comercio 
+            SET comercio_id = %s, nombre_comercio = %s, categoria = %s
+            WHERE id = %s
+        """
+        cur.execute(query, (comercio_id, nombre_comercio, categoria, id_db))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
 
 def eliminar_comercio(id_db):
     """Borra un registro por su ID único."""
-    conn = get_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM categoria_comercio WHERE id = %s", (id_db,))
-            conn.commit()
-            cur.close()
-        finally:
-            conn.close()
\ No newline at end of file
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM categoria_comercio WHERE id = %s", (id_db,))
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
\ No newline at end of file
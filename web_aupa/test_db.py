@@ -1,5 +1,5 @@
 import streamlit as st
-from database_config import get_connection
+from config import get_db_connection
 
 def ejecutar_test():
     """Realiza una prueba técnica de comunicación con PostgreSQL."""
@@ -7,28 +7,29 @@ def ejecutar_test():
     
     with st.status("Verificando parámetros...", expanded=True) as status:
         st.write("Intentando conectar al servidor...")
-        conn = get_connection() #
-        
-        if conn:
-            try:
-                cur = conn.cursor()
-                # Ejecutamos una consulta simple para verificar respuesta del motor SQL
-                cur.execute('SELECT version();')
-                db_version = cur.fetchone()
-                
-                st.write("✅ Conexión establecida exitosamente.")
-                st.info(f"Versión del servidor: {db_version[0]}")
-                
-                cur.close()
-                status.update(label="Prueba completada con éxito", state="complete", expanded=False)
-            except Exception as e:
-                st.error(f"❌ Error al ejecutar consulta de prueba: {e}")
-                status.update(label="Error en ejecución", state="error")
-            finally:
-                conn.close()
-        else:
-            st.error("❌ No se pudo establecer la conexión inicial.")
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            st.error(f"❌ No se pudo establecer la conexión inicial: {e}")
             status.update(label="Fallo de conexión", state="error")
+            return
+
+        try:
+            cur = conn.cursor()
+            # Ejecutamos una consulta simple para verificar respuesta del motor SQL
+            cur.execute('SELECT version();')
+            db_version = cur.fetchone()
+            
+            st.write("✅ Conexión establecida exitosamente.")
+            st.info(f"Versión del servidor: {db_version[0]}")
+            
+            cur.close()
+            status.update(label="Prueba completada con éxito", state="complete", expanded=False)
+        except Exception as e:
+            st.error(f"❌ Error al ejecutar consulta de prueba: {e}")
+            status.update(label="Error en ejecución", state="error")
+        finally:
+            conn.close()
 
 if __name__ == "__main__":
     ejecutar_test()
\ No newline at end of file
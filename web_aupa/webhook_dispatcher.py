@@ -0,0 +1,313 @@
+"""
+Entrega de eventos de publicación a webhooks (p. ej. flujos de n8n).
+
+El worker escribe cada cambio de estado de un post en publish_events_outbox en
+la misma sentencia que el cambio (outbox transaccional). Este proceso lee el
+outbox y envía los eventos por lotes a cada URL de WEBHOOK_URLS:
+
+    POST <url>
+    {"events": [{"id": 123, "type": "post.published", "account_id": 4, "post_id": 98,
+                 "created_at": "2026-01-01T10:00:00", "data": {...}}, ...]}
+
+Cada webhook lleva un cursor por cuenta (webhook_delivery_cursors): los
+eventos de una cuenta llegan en orden y, si una entrega falla, esas cuentas se
+reintentan con espera exponencial sin saltarse ningún evento. La entrega es
+"al menos una vez": el receptor puede descartar repetidos por id. Con
+WEBHOOK_SECRET cada petición lleva la firma HMAC-SHA256 del cuerpo en la
+cabecera X-Aupa-Signature.
+
+Los eventos entregados a todos los webhooks se borran del outbox; los que no
+se entregan se descartan tras WEBHOOK_OUTBOX_RETENTION_DAYS.
+
+Uso:
+    python webhook_dispatcher.py
+    python webhook_dispatcher.py --loop
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import select
+import signal
+import threading
+from collections import Counter
+import requests
+from psycopg2.extras import execute_values
+from config import get_db_connection
+from metrics import WEBHOOK_EVENTS
+from structured_logger import get_logger
+
+logger = get_logger("webhook_dispatcher")
+
+WEBHOOK_URLS = [url.strip() for url in os.getenv("WEBHOOK_URLS", "").split(",") if url.strip()]
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "100"))
+TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+# Espera tras un fallo: BACKOFF_SECONDS * 2^intentos, como máximo BACKOFF_MAX_SECONDS
+BACKOFF_SECONDS = int(os.getenv("WEBHOOK_BACKOFF_SECONDS", "10"))
+BACKOFF_MAX_SECONDS = int(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "600"))
+# Sin NOTIFY, se revisa el outbox cada POLL_INTERVAL (reintentos vencidos)
+POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "5"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("WEBHOOK_OUTBOX_RETENTION_DAYS", "7"))
+
+# Se activa con SIGTERM/SIGINT en modo --loop
+stop_event = threading.Event()
+
+
+def fetch_pending_events(cur, endpoint, limit=BATCH_SIZE):
+    """
+    Siguientes eventos sin entregar al webhook, en orden (xid, id).
+
+    Solo se leen eventos de transacciones terminadas (xid anterior al xmin de
+    la instantánea) y de cuentas sin espera pendiente por un fallo.
+    """
+    cur.execute("""
+        SELECT o.id, o.xid, o.account_id, o.post_id, o.event_type, o.payload, o.created_at
+        FROM publish_events_outbox o
+        LEFT JOIN webhook_delivery_cursors c ON c.endpoint = %s AND c.account_id = o.account_id
+        WHERE o.xid < pg_snapshot_xmin(pg_current_snapshot())
+          AND (o.xid, o.id) > (COALESCE(c.last_xid, '0'::xid8), COALESCE(c.last_event_id, 0))
+          AND (c.next_attempt_at IS NULL OR c.next_attempt_at <= NOW())
+        ORDER BY o.xid, o.id
+        LIMIT %s
+    """, (endpoint, limit))
+    return cur.fetchall()
+
+
+def post_events(endpoint, events):
+    """Envía un lote al webhook. Devuelve None si fue bien o el mensaje de error."""
+    body = json.dumps({"events": [{
+        "id": event_id,
+        "type": event_type,
+        "account_id": account_id,
+        "post_id": post_id,
+        "created_at": created_at.isoformat(),
+        "data": payload,
+    } for event_id, _, account_id, post_id, event_type, payload, created_at in events]}).encode("utf-8")
+
+    headers = {"Content-Type": "application/json"}
+    if WEBHOOK_SECRET:
+        signature = hmac.new(WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        headers["X-Aupa-Signature"] = f"sha256={signature}"
+
+    try:
+        response = requests.post(endpoint, data=body, headers=headers, timeout=TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        return str(e)
+    if response.status_code >= 300:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    return None
+
+
+def advance_cursors(cur, endpoint, events):
+    """Mueve el cursor de cada cuenta del lote a su último evento entregado."""
+    last = {}
+    for event_id, xid, account_id, *_ in events:
+        last[account_id] = (xid, event_id)
+    execute_values(cur, """
+        INSERT INTO webhook_delivery_cursors (endpoint, account_id, last_xid, last_event_id)
+        VALUES %s
+        ON CONFLICT (endpoint, account_id) DO UPDATE
+        SET last_xid = EXCLUDED.last_xid,
+            last_event_id = EXCLUDED.last_event_id,
+            attempts = 0,
+            next_attempt_at = NOW(),
+            last_error = NULL
+    """, [(endpoint, account_id, xid, event_id) for account_id, (xid, event_id) in last.items()],
+        template="(%s, %s, %s::xid8, %s)")
+
+
+def record_failure(cur, endpoint, events, error):
+    """Aplaza las cuentas del lote con espera exponencial según sus intentos."""
+    cur.execute("""
+        INSERT INTO webhook_delivery_cursors AS c (endpoint, account_id, attempts, next_attempt_at, last_error)
+        SELECT %s, account_id, 1, NOW() + %s * INTERVAL '1 second', %s
+        FROM unnest(%s::int[]) AS account_id
+        ON CONFLICT (endpoint, account_id) DO UPDATE
+        SET attempts = c.attempts + 1,
+            next_attempt_at = NOW() + LEAST(%s * POWER(2, c.attempts), %s) * INTERVAL '1 second',
+            last_error = EXCLUDED.last_error
+    """, (endpoint, BACKOFF_SECONDS, error[:1000], sorted({event[2] for event in events}),
+          BACKOFF_SECONDS, BACKOFF_MAX_SECONDS))
+
+
+def dispatch_endpoint(conn, endpoint, batch_size=BATCH_SIZE):
+    """
+    Entrega al webhook los eventos pendientes, lote a lote.
+
+    Un solo proceso a la vez por webhook (advisory lock). Se para en el primer
+    lote que falla: el webhook probablemente no responde.
+
+    Returns:
+        Counter con 'delivered', 'failed' y 'batches'
+    """
+    summary = Counter()
+    cur = conn.cursor()
+    lock_key = f"webhook:{endpoint}"
+    cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (lock_key,))
+    if not cur.fetchone()[0]:
+        conn.commit()
+        return summary
+
+    try:
+        while True:
+            events = fetch_pending_events(cur, endpoint, batch_size)
+            # Sin transacción abierta mientras se espera al webhook
+            conn.commit()
+            if not events:
+                break
+
+            error = post_events(endpoint, events)
+            summary["batches"] += 1
+            if error:
+                record_failure(cur, endpoint, events, error)
+                conn.commit()
+                summary["failed"] += len(events)
+                WEBHOOK_EVENTS.inc(len(events), result="failed")
+                logger.warning("Error entregando eventos al webhook", extra={
+                    "endpoint": endpoint, "events": len(events), "error": error
+                })
+                break
+
+            advance_cursors(cur, endpoint, events)
+            conn.commit()
+            summary["delivered"] += len(events)
+            WEBHOOK_EVENTS.inc(len(events), result="delivered")
+            if len(events) < batch_size:
+                break
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (lock_key,))
+        conn.commit()
+        cur.close()
+    return summary
+
+
+def prune_outbox(cur, endpoints=None):
+    """
+    Borra del outbox los eventos caducados y, si se indican los webhooks, los
+    ya entregados a todos ellos. Devuelve el número de eventos borrados.
+    """
+    if endpoints is None:
+        cur.execute("""
+            DELETE FROM publish_events_outbox
+            WHERE created_at < NOW() - %s * INTERVAL '1 day'
+        """, (OUTBOX_RETENTION_DAYS,))
+        return cur.rowcount
+
+    cur.execute("""
+        DELETE FROM publish_events_outbox o
+        WHERE o.created_at < NOW() - %s * INTERVAL '1 day'
+           OR NOT EXISTS (
+               SELECT 1 FROM unnest(%s::text[]) AS e(endpoint)
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM webhook_delivery_cursors c
+                   WHERE c.endpoint = e.endpoint
+                     AND c.account_id = o.account_id
+                     AND (c.last_xid, c.last_event_id) >= (o.xid, o.id)
+               )
+           )
+    """, (OUTBOX_RETENTION_DAYS, list(endpoints)))
+    return cur.rowcount
+
+
+def dispatch(conn, endpoints=None, batch_size=BATCH_SIZE):
+    """Un ciclo de entrega a todos los webhooks y limpieza del outbox."""
+    endpoints = WEBHOOK_URLS if endpoints is None else endpoints
+    summary = Counter()
+    for endpoint in endpoints:
+        summary.update(dispatch_endpoint(conn, endpoint, batch_size))
+
+    cur = conn.cursor()
+    summary["pruned"] = prune_outbox(cur, endpoints)
+    conn.commit()
+    cur.close()
+
+    if summary["delivered"] or summary["failed"]:
+        logger.info("Eventos entregados a webhooks", extra=dict(summary))
+    return summary
+
+
+def open_listen_connection():
+    """Conexión en autocommit suscrita a los NOTIFY de publish_events."""
+    listen_conn = get_db_connection()
+    listen_conn.autocommit = True
+    listen_conn.cursor().execute("LISTEN publish_events")
+    return listen_conn
+
+
+def close_quietly(conn):
+    """Cierra una conexión ignorando errores (p. ej. si ya estaba rota)."""
+    if conn is not None and not conn.closed:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def run_loop(interval, batch_size=BATCH_SIZE):
+    """
+    Entrega eventos hasta que se activa stop_event.
+
+    Un error (BD caída, red) no detiene el proceso: se cierran las dos
+    conexiones y se vuelven a abrir, con su LISTEN, en la siguiente vuelta.
+    Los NOTIFY perdidos mientras tanto no importan: cada vuelta lee el outbox.
+    """
+    conn = listen_conn = None
+    try:
+        while not stop_event.is_set():
+            try:
+                if conn is None:
+                    conn = get_db_connection()
+                if listen_conn is None:
+                    listen_conn = open_listen_connection()
+                dispatch(conn, batch_size=batch_size)
+                wait_for_events(listen_conn, interval)
+            except Exception as e:
+                logger.exception(f"Error en el dispatcher de webhooks: {type(e).__name__}: {e}")
+                close_quietly(conn)
+                close_quietly(listen_conn)
+                conn = listen_conn = None
+                stop_event.wait(interval)
+    finally:
+        close_quietly(conn)
+        close_quietly(listen_conn)
+
+
+def handle_stop_signal(signum, frame):
+    logger.info("Señal recibida, deteniendo el dispatcher", extra={"signal": signal.Signals(signum).name})
+    stop_event.set()
+
+
+def wait_for_events(listen_conn, timeout):
+    """Espera un NOTIFY de publish_events (o el timeout)."""
+    if select.select([listen_conn], [], [], timeout)[0]:
+        listen_conn.poll()
+        listen_conn.notifies.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrega de eventos de publicación a webhooks")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--loop", type=float, nargs="?", const=POLL_INTERVAL, default=None,
+                        help="Seguir escuchando; revisa el outbox al menos cada N segundos")
+    args = parser.parse_args()
+
+    if not WEBHOOK_URLS:
+        parser.error("Define WEBHOOK_URLS (URLs separadas por comas)")
+
+    if args.loop is None:
+        conn = get_db_connection()
+        try:
+            summary = dispatch(conn, batch_size=args.batch_size)
+        finally:
+            conn.close()
+        print(", ".join(f"{key}={value}" for key, value in sorted(summary.items())) or "Nada que entregar")
+    else:
+        signal.signal(signal.SIGTERM, handle_stop_signal)
+        signal.signal(signal.SIGINT, handle_stop_signal)
+        logger.info("Dispatcher de webhooks activo", extra={"webhooks": len(WEBHOOK_URLS)})
+        run_loop(args.loop, args.batch_size)
+        logger.info("Dispatcher de webhooks detenido")
@@ -1,198 +1,553 @@
 import time
-import psycopg2
+import logging
 import os
-import requests
-from dotenv import load_dotenv
-from datetime import datetime
-import json
-from audit_logger import audit_logger
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import get_db_connection
+from datetime import timedelta
+from log_partitions import maintain_log_partitions
+from post_archiver import archive_finished_posts
+from metrics import (
+    CLAIM_TO_PUBLISH_SECONDS, DB_QUERY_SECONDS, POSTS_PROCESSED, QUEUE_DEPTH, start_metrics_server
+)
+from graph_api import CIRCUIT_OPEN, RETRYABLE_ERROR_CODES
+from publishers import DRAIN_TIMEOUT, PUBLISHERS, PublishResult, QueuedPost
+from structured_logger import get_logger, log_context, span
+from webhook_dispatcher import prune_outbox
 
-load_dotenv()
+logger = get_logger("worker")
 
-def get_db_connection():
-    """Establece conexión a la base de datos."""
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+# Segundos tras los que un post en 'claimed'/'publishing' se considera abandonado
+INFLIGHT_TIMEOUT = int(os.getenv("WORKER_INFLIGHT_TIMEOUT", "600"))
+# Cada cuántos segundos se renueva el lease (claimed_at) de los lotes en curso
+LEASE_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_LEASE_HEARTBEAT_INTERVAL", str(INFLIGHT_TIMEOUT / 5)))
+# Errores transitorios: reintentos con espera exponencial antes de pasar a 'dead'
+MAX_RETRIES = int(os.getenv("WORKER_MAX_RETRIES", "5"))
+RETRY_BACKOFF_SECONDS = int(os.getenv("WORKER_RETRY_BACKOFF_SECONDS", "60"))
+RETRY_BACKOFF_MAX_SECONDS = int(os.getenv("WORKER_RETRY_BACKOFF_MAX_SECONDS", "3600"))
+# BATCH_ERROR: el adaptador de la plataforma lanzó una excepción con el lote en curso
+RETRYABLE_CODES = RETRYABLE_ERROR_CODES + ("CONTAINER_TIMEOUT", "BATCH_ERROR")
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "10"))
+# Puerto local del endpoint /metrics (0 para desactivarlo)
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9108"))
+# Cada cuántos segundos se mantienen las particiones de logs y se archivan
+# posts terminados (0 lo desactiva)
+MAINTENANCE_INTERVAL = float(os.getenv("WORKER_MAINTENANCE_INTERVAL", "3600"))
+# Lotes de archivado por ciclo de mantenimiento, para no retrasar la publicación
+ARCHIVE_MAX_BATCHES = int(os.getenv("WORKER_ARCHIVE_MAX_BATCHES", "50"))
 
-def validate_and_refresh_token(access_token):
-    """Valida el token y verifica si está a punto de expirar."""
-    try:
-        url = "https://graph.facebook.com/v18.0/debug_token"
-        params = {
-            "input_token": access_token,
-            "access_token": f"{os.getenv('FACEBOOK_CLIENT_ID')}|{os.getenv('FACEBOOK_CLIENT_SECRET')}"
-        }
+# Se activa con SIGTERM/SIGINT: el worker deja de reclamar posts y drena los lotes en curso
+shutdown_event = threading.Event()
+
+def park_unsupported_posts(cur):
+    """Marca como 'unsupported' los posts de plataformas sin adaptador.
+    
+    Así dejan de ocupar la ventana de posts pendientes en cada ciclo.
+    """
+    with DB_QUERY_SECONDS.time(query="park_unsupported"):
+        cur.execute("""
+            WITH parked AS (
+                UPDATE posts_queue q
+                SET status = 'unsupported',
+                    error_message = 'Plataforma no soportada: ' || a.platform
+                FROM social_accounts a
+                WHERE q.account_id = a.id
+                  AND q.status = 'pending'
+                  AND NOT (a.platform = ANY(%s))
+                RETURNING q.id, q.account_id, a.platform, q.error_message
+            ),
+            logged AS (
+                INSERT INTO post_publish_logs
+                (post_id, account_id, platform, publish_status, platform_response_code, error_details)
+                SELECT id, account_id, platform, 'rejected', 'UNSUPPORTED_PLATFORM', error_message
+                FROM parked
+            ),
+            events AS (
+                INSERT INTO publish_events_outbox (account_id, post_id, event_type, payload)
+                SELECT account_id, id, 'post.unsupported', jsonb_build_object(
+                    'post_id', id, 'account_id', account_id, 'platform', platform, 'status', 'unsupported',
+                    'error_code', 'UNSUPPORTED_PLATFORM', 'error_message', error_message
+                )
+                FROM parked
+            )
+            SELECT id, account_id, platform FROM parked
+        """, (list(PUBLISHERS),))
+        parked = cur.fetchall()
+    
+    for post_id, account_id, platform in parked:
+        logger.info("Post aparcado: plataforma no soportada", extra={
+            "post_id": post_id, "account_id": account_id, "platform": platform
+        })
+    return len(parked)
+
+def claim_pending_posts(cur, publisher):
+    """Reclama el siguiente lote de posts de una plataforma.
+    
+    Toma los posts pendientes cuya hora programada ya llegó y los reintentos
+    vencidos y los pasa a 'claimed'; quien llama debe hacer commit y marcarlos
+    como 'publishing' antes de llamar a la API.
+    """
+    with span(logger, "claim", platform=publisher.platform), DB_QUERY_SECONDS.time(query="claim"):
+        cur.execute("""
+            UPDATE posts_queue q
+            SET status = 'claimed', claimed_at = NOW()
+            FROM social_accounts a
+            WHERE q.account_id = a.id
+              AND q.id IN (
+                  SELECT p.id
+                  FROM posts_queue p
+                  JOIN social_accounts pa ON p.account_id = pa.id
+                  WHERE ((p.status = 'pending' AND p.scheduled_at <= NOW())
+                         OR (p.status = 'retrying' AND p.retry_at <= NOW()))
+                    AND pa.platform = %s
+                  ORDER BY p.scheduled_at ASC
+                  LIMIT %s
+                  FOR UPDATE OF p SKIP LOCKED
+              )
+            RETURNING q.id, q.content, q.media_url, a.platform, a.access_token, 
+                      a.platform_user_id, a.id as account_id, q.media_file
+        """, (publisher.platform, publisher.batch_size))
+        return [QueuedPost(*row) for row in cur.fetchall()]
+
+def mark_publishing(cur, posts):
+    """Pasa los posts reclamados a 'publishing' justo antes de llamar a la API."""
+    with DB_QUERY_SECONDS.time(query="mark_publishing"):
+        cur.execute("""
+            UPDATE posts_queue
+            SET status = 'publishing'
+            WHERE id = ANY(%s) AND status = 'claimed'
+        """, ([post.id for post in posts],))
+
+def reconcile_in_flight_posts(conn, cur):
+    """Resuelve los posts que quedaron en curso tras un corte del worker.
+    
+    Los 'claimed' no llegaron a la API y vuelven a 'pending' directamente. De
+    los 'publishing' cuyo lease caducó (claimed_at sin renovar durante
+    INFLIGHT_TIMEOUT, ver extend_lease), si el post consta como publicado en
+    auditoría o aparece en la red social se marca como enviado; si no, vuelve
+    a 'pending'.
+    
+    Las búsquedas en la red social se hacen sin transacción abierta ni filas
+    bloqueadas; cada post se actualiza después solo si sigue en 'publishing'
+    con el mismo claimed_at (nadie renovó el lease ni lo resolvió entretanto).
+    """
+    with DB_QUERY_SECONDS.time(query="reconcile"):
+        cur.execute("""
+            UPDATE posts_queue
+            SET status = 'pending', claimed_at = NULL
+            WHERE status = 'claimed'
+              AND claimed_at < NOW() - %s * INTERVAL '1 second'
+        """, (INFLIGHT_TIMEOUT,))
+        cur.execute("""
+            SELECT q.id, q.content, q.media_url, a.platform, a.access_token, 
+                   a.platform_user_id, a.id as account_id, q.claimed_at,
+                   (SELECT l.facebook_post_id FROM post_publish_logs l
+                    WHERE l.post_id = q.id AND l.publish_status = 'published'
+                    ORDER BY l.logged_at DESC LIMIT 1)
+            FROM posts_queue q
+            JOIN social_accounts a ON q.account_id = a.id
+            WHERE q.status = 'publishing'
+              AND q.claimed_at < NOW() - %s * INTERVAL '1 second'
+        """, (INFLIGHT_TIMEOUT,))
+        in_flight = cur.fetchall()
+    conn.commit()
+    
+    for row in in_flight:
+        post = QueuedPost(*row[:7])
+        claimed_at, logged_post_id = row[7], row[8]
+        platform_post_id = logged_post_id
         
-        response = requests.get(url, params=params, timeout=10)
+        if not platform_post_id:
+            publisher = PUBLISHERS.get(post.platform)
+            try:
+                if publisher:
+                    platform_post_id = publisher.find_published(post, claimed_at - timedelta(minutes=5))
+            except Exception as e:
+                logger.warning("No se pudo reconciliar el post", extra={"post_id": post.id, "error": str(e)})
+                continue
         
-        if response.status_code == 200:
-            data = response.json().get("data", {})
-            is_valid = data.get("is_valid", False)
-            expires_at = data.get("expires_at", 0)
-            
-            print(f"🔍 Token validado: válido={is_valid}, expira en {expires_at} segundos")
-            return is_valid, expires_at
+        if platform_post_id:
+            # Si no constaba en auditoría, el log se escribe en la misma sentencia
+            cur.execute("""
+                WITH updated AS (
+                    UPDATE posts_queue 
+                    SET status = 'sent', sent_at = NOW(), platform_post_id = %(platform_post_id)s
+                    WHERE id = %(post_id)s AND status = 'publishing' AND claimed_at = %(claimed_at)s
+                    RETURNING id, account_id, platform_post_id
+                ),
+                logged AS (
+                    INSERT INTO post_publish_logs
+                    (post_id, account_id, platform, facebook_post_id, publish_status, platform_response_code)
+                    SELECT id, account_id, %(platform)s, platform_post_id, 'published', 'RECONCILED'
+                    FROM updated
+                    WHERE %(needs_log)s
+                )
+                INSERT INTO publish_events_outbox (account_id, post_id, event_type, payload)
+                SELECT account_id, id, 'post.published', jsonb_build_object(
+                    'post_id', id, 'account_id', account_id, 'platform', %(platform)s, 'status', 'sent',
+                    'platform_post_id', platform_post_id, 'error_code', 'RECONCILED'
+                )
+                FROM updated
+            """, {
+                "platform_post_id": platform_post_id, "post_id": post.id, "claimed_at": claimed_at,
+                "platform": post.platform, "needs_log": not logged_post_id
+            })
+            if cur.rowcount:
+                logger.info("Post en curso ya estaba publicado, marcado como enviado", extra={
+                    "post_id": post.id, "platform_post_id": platform_post_id
+                })
         else:
-            return False, 0
-    except Exception as e:
-        print(f"⚠️ Error validando token: {e}")
-        return False, 0
+            cur.execute("""
+                UPDATE posts_queue 
+                SET status = 'pending', claimed_at = NULL
+                WHERE id = %s AND status = 'publishing' AND claimed_at = %s
+            """, (post.id, claimed_at))
+            if cur.rowcount:
+                logger.info("Post en curso no llegó a publicarse, devuelto a la cola", extra={"post_id": post.id})
+        conn.commit()
 
-def publish_to_facebook(page_id, access_token, message, media_url=None):
-    """Publica un post en Facebook usando Graph API.
+def extend_lease(cur, post_ids):
+    """Renueva claimed_at de los posts que se están publicando.
     
-    Args:
-        page_id: ID de la página de Facebook
-        access_token: Token de acceso válido
-        message: Contenido del post
-        media_url: URL del media (opcional)
+    Mientras un lote sigue en curso (subidas grandes, sondeo de contenedores,
+    drenaje) su lease no caduca y reconcile_in_flight_posts no lo toca.
+    """
+    with DB_QUERY_SECONDS.time(query="extend_lease"):
+        cur.execute("""
+            UPDATE posts_queue
+            SET claimed_at = NOW()
+            WHERE id = ANY(%s) AND status = 'publishing'
+        """, (post_ids,))
+
+def result_kind(result):
+    """Clasifica un resultado: 'released', 'deferred', 'published', 'retryable' o 'failed'."""
+    if result.error_code == "RELEASED":
+        return "released"
+    if result.error_code == CIRCUIT_OPEN:
+        return "deferred"
+    if result.success:
+        return "published"
+    if result.error_code in RETRYABLE_CODES:
+        return "retryable"
+    return "failed"
+
+def apply_results(cur, results):
+    """Aplica los resultados de un lote en posts_queue y en post_publish_logs.
+    
+    Una sola sentencia (CTE con UPDATE e INSERT) en la conexión del worker: el
+    cambio de estado, su log de auditoría y su evento para webhooks
+    (publish_events_outbox) se escriben juntos o no se escribe ninguno. Los
+    errores transitorios (RETRYABLE_CODES) pasan a 'retrying' con espera
+    exponencial hasta agotar MAX_RETRIES y entonces a 'dead'; el resto, a
+    'failed'. Los posts liberados y los que no se llegaron a enviar por tener
+    el circuito de la Graph API abierto vuelven a 'pending' sin log.
+    
+    Solo se tocan los posts que siguen en 'publishing'; si otro worker ya los
+    reconcilió no aparecen en el resultado.
     
     Returns:
-        (success: bool, post_id: str, error_msg: str, response_code: str)
+        Dict post_id -> (estado en posts_queue, retry_count, tipo de resultado)
     """
-    try:
-        url = f"https://graph.facebook.com/v18.0/{page_id}/feed"
+    cur.execute("""
+        WITH results AS (
+            SELECT * FROM unnest(%s::int[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[])
+                AS r(id, platform, kind, platform_post_id, error_msg, error_code)
+        ),
+        updated AS (
+            UPDATE posts_queue q
+            SET status = CASE r.kind
+                    WHEN 'released' THEN 'pending'
+                    WHEN 'deferred' THEN 'pending'
+                    WHEN 'published' THEN 'sent'
+                    WHEN 'retryable' THEN CASE WHEN q.retry_count < %s THEN 'retrying' ELSE 'dead' END
+                    ELSE 'failed'
+                END,
+                claimed_at = CASE WHEN r.kind IN ('released', 'deferred', 'retryable') THEN NULL ELSE q.claimed_at END,
+                sent_at = CASE WHEN r.kind = 'published' THEN NOW() ELSE q.sent_at END,
+                platform_post_id = CASE WHEN r.kind = 'published' THEN r.platform_post_id ELSE q.platform_post_id END,
+                retry_at = CASE WHEN r.kind = 'retryable'
+                    THEN NOW() + LEAST(%s * POWER(2, q.retry_count), %s) * INTERVAL '1 second'
+                    ELSE q.retry_at END,
+                retry_count = q.retry_count + CASE WHEN r.kind = 'retryable' THEN 1 ELSE 0 END,
+                error_message = CASE WHEN r.kind IN ('retryable', 'failed') THEN r.error_msg ELSE q.error_message END
+            FROM results r
+            WHERE q.id = r.id AND q.status = 'publishing'
+            RETURNING q.id, q.account_id, q.status, q.retry_count,
+                      r.platform, r.kind, r.platform_post_id, r.error_msg, r.error_code
+        ),
+        logged AS (
+            INSERT INTO post_publish_logs
+            (post_id, account_id, platform, facebook_post_id, publish_status,
+             platform_response_code, error_details, retry_count)
+            SELECT id, account_id, platform, platform_post_id,
+                   CASE WHEN kind = 'published' THEN 'published' ELSE 'failed' END,
+                   CASE WHEN kind = 'published' THEN '200' ELSE error_code END,
+                   LEFT(error_msg, 1000), retry_count
+            FROM updated
+            WHERE kind NOT IN ('released', 'deferred')
+        ),
+        events AS (
+            INSERT INTO publish_events_outbox (account_id, post_id, event_type, payload)
+            SELECT account_id, id, 'post.' || CASE status WHEN 'sent' THEN 'published' ELSE status END,
+                   jsonb_build_object(
+                       'post_id', id, 'account_id', account_id, 'platform', platform, 'status', status,
+                       'platform_post_id', platform_post_id, 'error_code', error_code,
+                       'error_message', LEFT(error_msg, 1000), 'retry_count', retry_count
+                   )
+            FROM updated
+            WHERE kind NOT IN ('released', 'deferred')
+        )
+        SELECT id, status, retry_count, kind FROM updated
+    """, (
+        [result.post.id for result in results],
+        [result.post.platform for result in results],
+        [result_kind(result) for result in results],
+        [result.platform_post_id if result.success else None for result in results],
+        [result.error_msg for result in results],
+        [result.error_code for result in results],
+        MAX_RETRIES, RETRY_BACKOFF_SECONDS, RETRY_BACKOFF_MAX_SECONDS,
+    ))
+    return {post_id: (status, retry_count, kind) for post_id, status, retry_count, kind in cur.fetchall()}
+
+def record_results(cur, results):
+    """Guarda los resultados de un lote y los registra en logs y métricas.
+    
+    Quien llama hace un único commit para todo el lote.
+    
+    Returns:
+        Lista de resultados: 'published', 'failed', 'retrying', 'dead',
+        'released', 'deferred' (circuito abierto) o 'stale' (el post ya no
+        estaba en curso)
+    """
+    with span(logger, "db_update"), DB_QUERY_SECONDS.time(query="record_results"):
+        applied = apply_results(cur, results)
+    
+    outcomes = []
+    for result in results:
+        post = result.post
+        status, retry_count, kind = applied.get(post.id, (None, 0, None))
+        outcome = kind if status == "pending" else {"sent": "published"}.get(status, status) or "stale"
         
-        data = {
-            "message": message,
-            "access_token": access_token
-        }
+        with log_context(post_id=post.id, account_id=post.account_id, platform=post.platform):
+            if outcome == "stale":
+                logger.warning("El post ya no estaba en 'publishing', no se registra el resultado", extra={
+                    "platform_post_id": result.platform_post_id, "error_code": result.error_code
+                })
+            elif outcome == "released":
+                logger.info("Post devuelto a la cola por apagado del worker")
+            elif outcome == "deferred":
+                logger.info("Post devuelto a la cola: circuito de la Graph API abierto", extra={
+                    "error_msg": result.error_msg
+                })
+            elif outcome == "published":
+                logger.debug("Post enviado", extra={"platform_post_id": result.platform_post_id})
+            else:
+                logger.warning("Post falló", extra={
+                    "error_msg": result.error_msg, "error_code": result.error_code,
+                    "queue_status": outcome, "retry_count": retry_count
+                })
         
-        # Si hay media, agregarlo
-        if media_url:
-            data["source"] = media_url
+        POSTS_PROCESSED.inc(platform=post.platform, outcome=outcome)
+        outcomes.append(outcome)
+    return outcomes
+
+def refresh_queue_depth(cur):
+    """Actualiza la métrica de profundidad de cola por estado (desde los contadores)."""
+    with DB_QUERY_SECONDS.time(query="queue_depth"):
+        cur.execute("SELECT status, SUM(posts) FROM posts_queue_counters GROUP BY status")
+        QUEUE_DEPTH.replace({status: int(posts) for status, posts in cur.fetchall()}, "status")
+
+def run_batches(conn, cur, batches, summary, claimed_at):
+    """Publica los lotes reclamados y registra sus resultados.
+    
+    `claimed_at` es el instante (time.monotonic) en que se reclamaron los lotes.
+    
+    Los resultados de cada lote se guardan en una sola sentencia y un solo commit.
+    Mientras haya lotes en curso se renueva su lease cada LEASE_HEARTBEAT_INTERVAL.
+    Si un lote lanza una excepción, sus posts se reintentan (BATCH_ERROR) y se
+    siguen registrando los demás lotes.
+    
+    Si llega una señal de apagado, espera como máximo DRAIN_TIMEOUT a los lotes
+    en curso. Los posts de lotes que no terminan a tiempo quedan en 'publishing'
+    y los reconcilia el siguiente worker; sus hilos siguen bloqueados en la API,
+    así que el proceso debe terminar con exit_worker.
+    """
+    pool = ThreadPoolExecutor(max_workers=len(batches))
+    futures = {
+        pool.submit(publisher.publish_batch, posts, shutdown_event): posts
+        for publisher, posts in batches.items()
+    }
+    running = set(futures)
+    deadline = None
+    last_heartbeat = time.monotonic()
+    
+    while running:
+        if shutdown_event.is_set() and deadline is None:
+            deadline = time.monotonic() + DRAIN_TIMEOUT
+            logger.info("Apagado solicitado: esperando a los lotes en curso", extra={
+                "drain_timeout": DRAIN_TIMEOUT, "batches": len(running)
+            })
         
-        response = requests.post(url, data=data, timeout=15)
+        timeout = 1.0 if deadline is None else max(0.0, min(1.0, deadline - time.monotonic()))
+        done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
         
-        print(f"📤 Respuesta de Facebook API: código {response.status_code}")
+        for future in done:
+            try:
+                results = future.result()
+            except Exception as e:
+                posts = futures[future]
+                logger.exception("Error publicando un lote", extra={"post_ids": [post.id for post in posts]})
+                error_msg = f"Error publicando el lote: {type(e).__name__}: {e}"
+                results = [PublishResult(post, False, None, error_msg, "BATCH_ERROR") for post in posts]
+            summary.update(record_results(cur, results))
+            with DB_QUERY_SECONDS.time(query="commit"):
+                conn.commit()
+            for result in results:
+                CLAIM_TO_PUBLISH_SECONDS.observe(
+                    time.monotonic() - claimed_at, platform=result.post.platform
+                )
         
-        if response.status_code == 200:
-            response_data = response.json()
-            fb_post_id = response_data.get("id")
-            print(f"✅ Post publicado exitosamente. ID: {fb_post_id}")
-            return True, fb_post_id, None, "200"
-        else:
-            error_data = response.json()
-            error_msg = error_data.get("error", {}).get("message", "Unknown error")
-            error_type = error_data.get("error", {}).get("type", "UNKNOWN")
-            print(f"❌ Error en publicación: {error_msg}")
-            return False, None, error_msg, error_type
-            
-    except requests.exceptions.Timeout:
-        return False, None, "Timeout en conexión con Facebook", "TIMEOUT"
-    except requests.exceptions.RequestException as e:
-        return False, None, str(e), "REQUEST_ERROR"
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        
+        if running and time.monotonic() - last_heartbeat >= LEASE_HEARTBEAT_INTERVAL:
+            last_heartbeat = time.monotonic()
+            try:
+                extend_lease(cur, [post.id for future in running for post in futures[future]])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.warning("No se pudo renovar el lease de los posts en curso", extra={"error": str(e)})
+    
+    for future in running:
+        summary["unconfirmed"] += len(futures[future])
+        logger.warning("Posts sin confirmar quedan en 'publishing' para reconciliación", extra={
+            "post_ids": [post.id for post in futures[future]]
+        })
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_maintenance(conn, cur):
+    """Mantiene particiones de logs, archiva posts y caduca eventos del outbox
+    sin interrumpir el ciclo si falla."""
+    try:
+        with span(logger, "log_partitions"):
+            maintain_log_partitions(cur)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Error manteniendo particiones de logs", extra={"error": str(e)})
+    
+    try:
+        with span(logger, "archive_posts"):
+            archive_finished_posts(conn, max_batches=ARCHIVE_MAX_BATCHES)
     except Exception as e:
-        return False, None, str(e), "UNKNOWN_ERROR"
+        conn.rollback()
+        logger.warning("Error archivando posts", extra={"error": str(e)})
+    
+    try:
+        with span(logger, "prune_outbox"):
+            prune_outbox(cur)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.warning("Error depurando el outbox de webhooks", extra={"error": str(e)})
 
-def process_posts():
-    """Procesa posts pendientes y los publica en redes sociales."""
-    while True:
+def process_posts(on_cycle=None):
+    """Procesa posts pendientes y los publica en redes sociales.
+    
+    El bucle termina cuando se activa shutdown_event (SIGTERM/SIGINT).
+    
+    Args:
+        on_cycle: Función opcional que se llama al terminar cada ciclo
+            (el supervisor la usa como latido)
+    
+    Returns:
+        Counter con el resumen de la ejecución
+    """
+    summary = Counter()
+    last_maintenance = None
+    
+    while not shutdown_event.is_set():
+        conn = None
         try:
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Buscar posts pendientes con información de la cuenta
-            cur.execute("""
-                SELECT q.id, q.content, q.media_url, a.platform, a.access_token, 
-                       a.platform_user_id, a.id as account_id
-                FROM posts_queue q
-                JOIN social_accounts a ON q.account_id = a.id
-                WHERE q.status = 'pending'
-                ORDER BY q.scheduled_at ASC
-                LIMIT 5
-            """)
+            if MAINTENANCE_INTERVAL and (
+                last_maintenance is None
+                or time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL
+            ):
+                run_maintenance(conn, cur)
+                last_maintenance = time.monotonic()
             
-            pending_posts = cur.fetchall()
+            reconcile_in_flight_posts(conn, cur)
+            summary["parked"] += park_unsupported_posts(cur)
+            refresh_queue_depth(cur)
+            conn.commit()
             
-            if not pending_posts:
-                print(f"⏳ [{datetime.now()}] Sin posts pendientes. Esperando...")
+            # Cada plataforma reclama su propio lote para que ninguna bloquee a otra
+            claimed_at = time.monotonic()
+            batches = {}
+            for publisher in PUBLISHERS.values():
+                if shutdown_event.is_set():
+                    break
+                posts = claim_pending_posts(cur, publisher)
+                if posts:
+                    batches[publisher] = posts
+            conn.commit()
             
-            for post in pending_posts:
-                post_id, content, media_url, platform, access_token, platform_user_id, account_id = post
-                print(f"\n{'='*60}")
-                print(f"📝 Procesando post {post_id} para {platform}")
-                print(f"   Contenido: {content[:50]}...")
-                print(f"{'='*60}")
-                
-                # Validar token antes de intentar publicar
-                is_valid, _ = validate_and_refresh_token(access_token)
-                
-                if not is_valid:
-                    print(f"❌ Token inválido para post {post_id}")
-                    cur.execute("""
-                        UPDATE posts_queue 
-                        SET status = 'failed', error_message = %s 
-                        WHERE id = %s
-                    """, ("Token inválido o expirado", post_id))
-                    
-                    audit_logger.log_publish_event(
-                        post_id, account_id, platform,
-                        status="failed",
-                        error_details="Token inválido o expirado",
-                        platform_response_code="INVALID_TOKEN"
-                    )
-                    conn.commit()
-                    continue
-                
-                # Publicar según la plataforma
-                if platform == "Facebook":
-                    success, fb_post_id, error_msg, error_code = publish_to_facebook(
-                        platform_user_id, 
-                        access_token, 
-                        content,
-                        media_url
-                    )
-                    
-                    if success:
-                        cur.execute("""
-                            UPDATE posts_queue 
-                            SET status = 'sent', sent_at = NOW() 
-                            WHERE id = %s
-                        """, (post_id,))
-                        
-                        audit_logger.log_publish_event(
-                            post_id, account_id, platform,
-                            fb_post_id=fb_post_id,
-                            status="published",
-                            platform_response_code="200"
-                        )
-                        print(f"✅ Post {post_id} enviado a Facebook")
-                    else:
-                        cur.execute("""
-                            UPDATE posts_queue 
-                            SET status = 'failed', error_message = %s 
-                            WHERE id = %s
-                        """, (error_msg, post_id))
-                        
-                        audit_logger.log_publish_event(
-                            post_id, account_id, platform,
-                            status="failed",
-                            error_details=error_msg,
-                            platform_response_code=error_code
-                        )
-                        print(f"❌ Post {post_id} falló: {error_msg}")
-                
-                elif platform == "Instagram":
-                    # Lógica similar para Instagram (USA business_account_id)
-                    print(f"⏳ Instagram no implementado aún para post {post_id}")
-                    
-                elif platform == "TikTok":
-                    # Lógica para TikTok
-                    print(f"⏳ TikTok no implementado aún para post {post_id}")
-                
+            if not batches:
+                logger.debug("Sin posts pendientes")
+            else:
+                mark_publishing(cur, [post for posts in batches.values() for post in posts])
                 conn.commit()
-            
-            cur.close()
-            conn.close()
+                run_batches(conn, cur, batches, summary, claimed_at)
             
         except Exception as e:
-            print(f"❌ Error en worker: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error en worker: {type(e).__name__}: {e}")
+        finally:
+            # Cerrar la conexión cierra también su cursor
+            if conn is not None:
+                conn.close()
         
-        print("⏰ Próxima revisión en 10 segundos...")
-        time.sleep(10)
+        if on_cycle:
+            on_cycle()
+        if shutdown_event.is_set():
+            break
+        logger.debug("Esperando al siguiente ciclo", extra={"seconds": POLL_INTERVAL})
+        shutdown_event.wait(POLL_INTERVAL)
+    
+    return summary
+
+def exit_worker(summary):
+    """Registra el resumen del worker y termina el proceso.
+    
+    El intérprete espera al salir a los hilos de los lotes que no drenaron a
+    tiempo (sondeos de la Graph API sin límite de DRAIN_TIMEOUT). En ese caso
+    se sale con os._exit tras volcar los logs para que el plazo se cumpla.
+    """
+    logger.info("Worker detenido", extra={
+        key: summary[key] for key in ("published", "failed", "released", "deferred", "unconfirmed", "parked")
+    })
+    if summary["unconfirmed"]:
+        logging.shutdown()
+        os._exit(0)
+
+def handle_shutdown_signal(signum, frame):
+    """Deja de reclamar posts; una segunda señal fuerza la salida inmediata."""
+    if shutdown_event.is_set():
+        logger.warning("Segunda señal recibida, saliendo sin esperar")
+        os._exit(1)
+    logger.info("Señal recibida, deteniendo el worker", extra={"signal": signal.Signals(signum).name})
+    shutdown_event.set()
 
 if __name__ == "__main__":
-    print("Worker activo y escuchando la base de datos...")
-    process_posts()
\ No newline at end of file
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    signal.signal(signal.SIGINT, handle_shutdown_signal)
+    
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    logger.info("Worker activo y escuchando la base de datos")
+    exit_worker(process_posts())
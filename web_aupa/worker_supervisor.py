@@ -0,0 +1,243 @@
+"""
+Supervisor del worker de publicación.
+Lanza varios procesos worker (worker.process_posts), los vigila con un latido
+compartido, reinicia los que mueren o se cuelgan y ajusta su número entre un
+mínimo y un máximo según los posts pendientes que ya tocan y el retraso de
+publicación observado. Los picos de campaña se absorben solos y en horas
+valle queda el mínimo.
+
+Solo el primer worker hace el mantenimiento periódico (particiones y archivado).
+Si WORKER_METRICS_PORT está definido, el supervisor expone sus métricas en ese
+puerto y cada worker en el siguiente según su posición (puerto + 1 + posición).
+
+Uso:
+    python worker_supervisor.py
+    python worker_supervisor.py --min-workers 1 --max-workers 8
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from config import get_db_connection
+from metrics import SUPERVISOR_WORKERS, WORKER_RESTARTS, start_metrics_server
+from structured_logger import get_logger
+
+logger = get_logger("supervisor")
+
+MIN_WORKERS = int(os.getenv("SUPERVISOR_MIN_WORKERS", "1"))
+MAX_WORKERS = int(os.getenv("SUPERVISOR_MAX_WORKERS", "4"))
+# Posts pendientes (ya vencidos) que se asignan a cada worker
+POSTS_PER_WORKER = int(os.getenv("SUPERVISOR_POSTS_PER_WORKER", "50"))
+# Retraso p90 entre la hora programada y el envío a partir del cual se añade un worker
+LATENCY_TARGET_SECONDS = float(os.getenv("SUPERVISOR_LATENCY_TARGET_SECONDS", "120"))
+# Ventana en la que se mide ese retraso
+LATENCY_WINDOW_SECONDS = int(os.getenv("SUPERVISOR_LATENCY_WINDOW_SECONDS", "600"))
+# Tiempo que la carga debe pedir menos workers antes de quitar uno (de uno en uno)
+SCALE_DOWN_COOLDOWN = float(os.getenv("SUPERVISOR_SCALE_DOWN_COOLDOWN", "300"))
+CHECK_INTERVAL = float(os.getenv("SUPERVISOR_CHECK_INTERVAL", "15"))
+# Un worker sin latido durante este tiempo se considera colgado
+HEARTBEAT_TIMEOUT = float(os.getenv("SUPERVISOR_HEARTBEAT_TIMEOUT", "900"))
+# Un worker que muere antes de este tiempo se reinicia con espera creciente
+CRASH_LOOP_SECONDS = 30
+MAX_RESTART_DELAY = 60
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9108"))
+# Lo que se espera a que un worker drene sus lotes al pararlo
+STOP_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "30")) + 30
+
+stop_event = threading.Event()
+
+
+def run_worker(slot, heartbeat):
+    """Punto de entrada de cada proceso worker."""
+    if slot > 0:
+        # Se lee al importar worker: solo el primero mantiene particiones y archivo
+        os.environ["WORKER_MAINTENANCE_INTERVAL"] = "0"
+    import worker
+
+    signal.signal(signal.SIGTERM, worker.handle_shutdown_signal)
+    signal.signal(signal.SIGINT, worker.handle_shutdown_signal)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT + 1 + slot)
+
+    def beat():
+        heartbeat.value = time.time()
+
+    beat()
+    worker.exit_worker(worker.process_posts(on_cycle=beat))
+
+
+class WorkerSlot:
+    """Un proceso worker vigilado y su historial de reinicios."""
+
+    def __init__(self, slot, context):
+        self.slot = slot
+        self.context = context
+        self.heartbeat = context.Value("d", 0.0)
+        self.process = None
+        self.started_at = None
+        self.crashes = 0
+        self.restart_at = None
+
+    def start(self):
+        self.heartbeat.value = time.time()
+        self.process = self.context.Process(
+            target=run_worker, args=(self.slot, self.heartbeat), name=f"aupa-worker-{self.slot}", daemon=False
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        logger.info("Worker iniciado", extra={"slot": self.slot, "pid": self.process.pid})
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def is_hung(self):
+        return self.is_alive() and time.time() - self.heartbeat.value > HEARTBEAT_TIMEOUT
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """SIGTERM (el worker drena sus lotes) y, si no termina a tiempo, SIGKILL."""
+        if not self.is_alive():
+            return
+        self.process.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning("El worker no terminó a tiempo, se fuerza", extra={"slot": self.slot})
+            self.process.kill()
+            self.process.join(5)
+
+
+def observe_load(cur):
+    """
+    Devuelve (posts que ya tocan, retraso p90 en segundos o None).
+
+    El retraso es sent_at - scheduled_at de los posts enviados en la ventana.
+    """
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM posts_queue
+        WHERE (status = 'pending' AND scheduled_at <= NOW())
+           OR (status = 'retrying' AND retry_at <= NOW())
+    """)
+    due = cur.fetchone()[0]
+    cur.execute("""
+        SELECT percentile_cont(0.9) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM sent_at - scheduled_at))
+        FROM posts_queue
+        WHERE status = 'sent'
+          AND scheduled_at >= NOW() - INTERVAL '1 day'
+          AND sent_at >= NOW() - %s * INTERVAL '1 second'
+    """, (LATENCY_WINDOW_SECONDS,))
+    p90 = cur.fetchone()[0]
+    return due, float(p90) if p90 is not None else None
+
+
+def desired_workers(due, latency_p90, current, min_workers=MIN_WORKERS, max_workers=MAX_WORKERS):
+    """Número de workers objetivo para la carga observada."""
+    target = math.ceil(due / POSTS_PER_WORKER) if due else min_workers
+    if due and latency_p90 is not None and latency_p90 > LATENCY_TARGET_SECONDS:
+        # Hay retraso con cola: uno más de los que ya hay aunque la cola parezca pequeña
+        target = max(target, current + 1)
+    return max(min_workers, min(max_workers, target))
+
+
+def supervise(min_workers=MIN_WORKERS, max_workers=MAX_WORKERS):
+    """Bucle del supervisor; termina cuando se activa stop_event."""
+    min_workers = max(1, min_workers)
+    max_workers = max(min_workers, max_workers)
+    context = multiprocessing.get_context("spawn")
+    slots = []
+    desired = min_workers
+    low_since = None
+
+    while not stop_event.is_set():
+        # Ajuste según la carga: se sube en cuanto hace falta y se baja despacio
+        try:
+            conn = get_db_connection()
+            try:
+                due, latency_p90 = observe_load(conn.cursor())
+            finally:
+                conn.close()
+            target = desired_workers(due, latency_p90, len(slots), min_workers, max_workers)
+            if target > desired:
+                logger.info("Escalando workers", extra={
+                    "from_workers": desired, "to_workers": target, "due": due, "latency_p90": latency_p90
+                })
+                desired = target
+            if target >= desired:
+                low_since = None
+            elif low_since is None:
+                low_since = time.monotonic()
+            elif time.monotonic() - low_since >= SCALE_DOWN_COOLDOWN:
+                logger.info("Reduciendo workers", extra={
+                    "from_workers": desired, "to_workers": desired - 1, "due": due, "latency_p90": latency_p90
+                })
+                desired -= 1
+                low_since = time.monotonic()
+        except Exception as e:
+            # Sin BD se mantiene el número actual y se siguen vigilando los procesos
+            logger.warning("No se pudo medir la carga", extra={"error": str(e)})
+
+        while len(slots) > desired:
+            slot = slots.pop()
+            slot.stop()
+            logger.info("Worker detenido", extra={"slot": slot.slot})
+        while len(slots) < desired:
+            slot = WorkerSlot(len(slots), context)
+            slot.start()
+            slots.append(slot)
+
+        # Salud: caídos y colgados
+        now = time.monotonic()
+        for slot in slots:
+            if slot.is_hung():
+                logger.error("Worker sin latido, se reinicia", extra={
+                    "slot": slot.slot, "pid": slot.process.pid, "seconds": round(time.time() - slot.heartbeat.value)
+                })
+                WORKER_RESTARTS.inc(reason="hung")
+                slot.stop(timeout=10)
+                slot.start()
+            elif not slot.is_alive():
+                if slot.restart_at is None:
+                    crashed_fast = now - slot.started_at < CRASH_LOOP_SECONDS
+                    slot.crashes = slot.crashes + 1 if crashed_fast else 0
+                    delay = min(MAX_RESTART_DELAY, 2 ** slot.crashes) if crashed_fast else 0
+                    logger.error("Worker caído", extra={
+                        "slot": slot.slot, "exitcode": slot.process.exitcode, "restart_in": delay
+                    })
+                    WORKER_RESTARTS.inc(reason="crashed")
+                    slot.restart_at = now + delay
+                if now >= slot.restart_at:
+                    slot.restart_at = None
+                    slot.start()
+
+        SUPERVISOR_WORKERS.set(desired, state="desired")
+        SUPERVISOR_WORKERS.set(sum(1 for slot in slots if slot.is_alive()), state="running")
+        stop_event.wait(CHECK_INTERVAL)
+
+    logger.info("Deteniendo workers", extra={"workers": len(slots)})
+    for slot in slots:
+        if slot.is_alive():
+            slot.process.terminate()
+    for slot in slots:
+        slot.stop()
+
+
+def handle_stop_signal(signum, frame):
+    logger.info("Señal recibida, deteniendo el supervisor", extra={"signal": signal.Signals(signum).name})
+    stop_event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Supervisor de workers de publicación")
+    parser.add_argument("--min-workers", type=int, default=MIN_WORKERS)
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+    signal.signal(signal.SIGINT, handle_stop_signal)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    logger.info("Supervisor activo", extra={"min_workers": args.min_workers, "max_workers": args.max_workers})
+    supervise(args.min_workers, args.max_workers)